@@ -12,6 +12,7 @@ class ActionType(str, Enum):
     """Supported action types."""
     MOVE = "move"
     ROTATION = "rotation"
+    LOOK_AROUND = "look_around"
     STOP = "stop"
 
 
@@ -51,6 +52,25 @@ class PreloadRequest(BaseModel):
     zoom_level: Optional[int] = Field(None, description="Zoom level (0-5), defaults to settings")
 
 
+class PreloadJobRequest(BaseModel):
+    """Request to start a preload job."""
+    name: str = Field(..., description="Job name; also the geofence/whitelist list to preload if no panoramas are given")
+    pano_ids: Optional[List[str]] = Field(None, description="Panoramas to preload")
+    whitelist_file: Optional[str] = Field(None, description="Preload every list of a whitelist file (e.g. 'height_whitelist.json')")
+    zoom_level: Optional[int] = Field(None, description="Zoom level (0-5), defaults to settings")
+
+
+class CoverageAuditRequest(BaseModel):
+    """Request to audit cached assets of required panoramas."""
+    names: Optional[List[str]] = Field(None, description="Geofence/whitelist list names")
+    whitelist_file: Optional[str] = Field(None, description="Every list of a whitelist file (e.g. 'height_whitelist.json')")
+    task_ids: Optional[List[str]] = Field(None, description="Tasks whose geofence/spawn/target panoramas are required")
+    all_tasks: bool = Field(False, description="Audit every task in the tasks directory")
+    zoom_level: Optional[int] = Field(None, description="Zoom level (0-5), defaults to settings")
+    preload: bool = Field(False, description="Start a preload job for the missing panoramas")
+    job_name: Optional[str] = Field(None, description="Name of the preload job (default: derived from the request)")
+
+
 # === Response Models ===
 
 class AvailableMove(BaseModel):
@@ -61,6 +81,13 @@ class AvailableMove(BaseModel):
     heading: Optional[float] = Field(None, description="Absolute heading to this move (true north reference)")
 
 
+class LookAroundView(BaseModel):
+    """One of the views returned by a 'look_around' action."""
+    direction: str = Field(..., description="View direction relative to the agent (front/right/back/left)")
+    heading: float = Field(..., description="Absolute heading of this view (true north reference)")
+    image: Optional[str] = Field(None, description="URL to this view's image")
+
+
 class Observation(BaseModel):
     """Agent observation."""
     task_description: str = Field(..., description="Task description")
@@ -71,6 +98,7 @@ class Observation(BaseModel):
     fov: float = Field(90.0, description="Current FOV (30-100)")
     center_heading: float = Field(0.0, description="Panorama tile origin heading for coordinate conversion")
     available_moves: List[AvailableMove] = Field(default_factory=list)
+    look_around: Optional[List[LookAroundView]] = Field(None, description="Views from a 'look_around' action")
 
 
 class SessionState(BaseModel):
@@ -141,11 +169,46 @@ class TaskListResponse(BaseModel):
 
 class PreloadStatusResponse(BaseModel):
     """Response with preload status."""
-    status: str  # pending / in_progress / completed / failed
+    status: str  # not_started / pending / in_progress / completed / failed / cancelled
     progress: int = 0
     total: int = 0
     percentage: float = 0.0
     message: Optional[str] = None
+    job_id: Optional[str] = None
+    failed: int = 0  # Panoramas that could not be fetched (included in progress)
+
+
+class PreloadJobInfo(BaseModel):
+    """A persistent preload job."""
+    job_id: str
+    name: str
+    zoom: int
+    status: str  # pending / in_progress / completed / failed / cancelled
+    total: int
+    done: int
+    failed: int
+    message: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
+class PreloadJobListResponse(BaseModel):
+    """List of preload jobs."""
+    jobs: List[PreloadJobInfo]
+
+
+class CoverageAuditResponse(BaseModel):
+    """Missing cached assets of a set of required panoramas."""
+    zoom: int
+    required: int
+    missing_metadata: List[str]
+    missing_links: List[str]  # Metadata cached without links
+    missing_images: List[str]
+    unrecorded_images: int  # Image files without a database record
+    known_failures: Dict[str, str]  # pano_id -> negative cache reason
+    missing: List[str]  # Panoramas a preload job fetches (no metadata or no image)
+    audit_ms: float
+    job: Optional[PreloadJobInfo] = None  # Preload job started for the missing panoramas
 
 
 class GeofenceInfo(BaseModel):
@@ -159,6 +222,78 @@ class GeofenceListResponse(BaseModel):
     geofences: List[GeofenceInfo]
 
 
+class GeofenceWarmResponse(BaseModel):
+    """Response after loading a geofence graph into memory."""
+    name: str
+    pano_count: int
+    with_metadata: int  # Panoramas with cached metadata (others have no moves)
+    edge_count: int
+    build_ms: float
+
+
+class ApiKeyUsage(BaseModel):
+    """Usage counters of one API key."""
+    key: str  # Masked
+    services: Dict[str, Dict[str, float]]  # service -> requests / ok / rate_limited / forbidden / errors / cooldown_seconds
+
+
+class ApiKeyUsageResponse(BaseModel):
+    """Response with API key pool usage."""
+    key_count: int
+    keys: List[ApiKeyUsage]
+    totals: Dict[str, int]
+
+
+class ActionPoolStatsResponse(BaseModel):
+    """Response with action pool queue statistics."""
+    workers: int
+    queue_size: int
+    active: int  # Submitted to the pool (running or waiting for a thread)
+    waiting: int  # Waiting for an earlier action of the same session
+    admitted: int
+    completed: int
+    rejected: int  # Answered 503 (queue full)
+    avg_wait_ms: float
+    avg_run_ms: float
+
+
+class SessionStatsResponse(BaseModel):
+    """Response with statistics of the sessions held in memory."""
+    store: str  # memory / shm / sqlite
+    sessions: int
+    statuses: Dict[str, int]  # status -> sessions
+    max_sessions: int
+    task_configs: int  # Task configs cached
+    open_log_files: int
+    evicted: Dict[str, int]  # idle / ended / limit
+    persistence: Optional[Dict[str, int]] = None  # Background database writer counters
+
+
+class TempImageSweep(BaseModel):
+    """Summary of one temp image sweep."""
+    sessions: int  # Session directories found
+    files: int
+    bytes: int
+    deleted: Dict[str, int]  # policy / expired / quota -> images
+    freed_bytes: int
+    remaining_bytes: int
+    duration_ms: float
+    finished_at: str
+
+
+class TempImageStatsResponse(BaseModel):
+    """Response with statistics of the temp image janitor."""
+    policy: str
+    expire_hours: float
+    quota_gb: float  # 0 = no quota
+    sweep_interval: float
+    running: bool
+    sweeps: int
+    deleted: Dict[str, int]  # policy / expired / quota -> images, since startup
+    freed_bytes: int
+    last_sweep: Optional[TempImageSweep] = None
+
+
 class PlayerProgress(BaseModel):
     """Player progress info."""
     task_id: str
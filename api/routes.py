@@ -7,17 +7,25 @@ import json
 import asyncio
 from pathlib import Path
 from typing import Optional
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Response
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from config.settings import settings, TASKS_DIR
 from engine.session_manager import session_manager, SessionStatus as EngineSessionStatus
+from engine.session_store import SessionStoreFull
 from engine.action_executor import action_executor
+from engine.action_runner import action_runner, ActionQueueFull
 from engine.logger import session_logger
 from engine.geofence_checker import geofence_checker
 from engine.observation_generator import get_observation_generator
+from engine.temp_images import temp_image_janitor
+from engine.api_key_pool import api_key_pool
+from engine.preload_jobs import preload_manager, resolve_whitelist
+from engine.coverage_audit import (
+    audit_coverage, required_panos_for_file, required_panos_for_tasks, task_geofence
+)
 
 from .models import (
     CreateSessionRequest, CreateSessionResponse,
@@ -25,11 +33,15 @@ from .models import (
     SessionStateResponse, EndSessionResponse,
     TaskListResponse, TaskInfo, TaskDetail,
     PreloadRequest, PreloadStatusResponse,
+    PreloadJobRequest, PreloadJobInfo, PreloadJobListResponse,
+    CoverageAuditRequest, CoverageAuditResponse,
     PlayerProgressResponse, PlayerProgress,
     ResumeSessionResponse, PauseSessionResponse,
-    Observation, AvailableMove, SessionStatus,
+    Observation, AvailableMove, LookAroundView, SessionStatus,
     ErrorResponse, SessionInfo, SessionListResponse, SessionLogResponse,
-    GeofenceInfo, GeofenceListResponse
+    GeofenceInfo, GeofenceListResponse, GeofenceWarmResponse,
+    ApiKeyUsageResponse, ActionPoolStatsResponse, SessionStatsResponse,
+    TempImageStatsResponse
 )
 
 
@@ -37,15 +49,29 @@ from .models import (
 router = APIRouter(prefix="/api", tags=["VLN Benchmark"])
 
 
+async def _run_blocking(session_id: Optional[str], func, *args):
+    """
+    Run blocking session work (SQLite, rendering, log files) in the action
+    pool, off the event loop. Answers 503 when the pool is saturated.
+    """
+    try:
+        return await action_runner.run(session_id, func, *args)
+    except ActionQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(settings.ACTION_QUEUE_TIMEOUT)))}
+        )
+
+
 # === Session Management ===
 
-@router.post("/session/create", response_model=CreateSessionResponse)
-async def create_session(request: CreateSessionRequest):
+def _start_session(request: CreateSessionRequest):
     """
-    Create a new evaluation session.
+    Create a session, log its start and render the initial view (blocking).
     
-    Creates a session for the specified agent and task, returning
-    the initial observation.
+    Returns:
+        (session, initial observation), or None if the task was not found
     """
     session = session_manager.create_session(
         agent_id=request.agent_id,
@@ -54,7 +80,7 @@ async def create_session(request: CreateSessionRequest):
     )
     
     if session is None:
-        raise HTTPException(status_code=404, detail=f"Task not found: {request.task_id}")
+        return None
     
     # Log session start
     session_logger.log_session_start(session)
@@ -73,8 +99,28 @@ async def create_session(request: CreateSessionRequest):
     except Exception as e:
         print(f"Error generating initial observation: {e}")
     
-    # Generate initial observation
-    initial_observation = _build_observation(session)
+    # Start downloading the panoramas around the spawn point
+    action_executor.prefetch(session)
+    
+    return session, _build_observation(session)
+
+
+@router.post("/session/create", response_model=CreateSessionResponse)
+async def create_session(request: CreateSessionRequest):
+    """
+    Create a new evaluation session.
+    
+    Creates a session for the specified agent and task, returning
+    the initial observation.
+    """
+    try:
+        started = await _run_blocking(None, _start_session, request)
+    except SessionStoreFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    if started is None:
+        raise HTTPException(status_code=404, detail=f"Task not found: {request.task_id}")
+    session, initial_observation = started
     
     return CreateSessionResponse(
         session_id=session.session_id,
@@ -82,6 +128,14 @@ async def create_session(request: CreateSessionRequest):
     )
 
 
+def _session_state(session_id: str):
+    """Look up a session and build its observation (blocking; None if not found)."""
+    session = session_manager.get_session(session_id)
+    if session is None:
+        return None
+    return session, _build_observation(session)
+
+
 @router.get("/session/{session_id}/state", response_model=SessionStateResponse)
 async def get_session_state(session_id: str):
     """
@@ -89,12 +143,11 @@ async def get_session_state(session_id: str):
     
     Returns the current status and observation for the session.
     """
-    session = session_manager.get_session(session_id)
+    state = await _run_blocking(session_id, _session_state, session_id)
     
-    if session is None:
+    if state is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    observation = _build_observation(session)
+    session, observation = state
     
     return SessionStateResponse(
         session_id=session.session_id,
@@ -105,17 +158,34 @@ async def get_session_state(session_id: str):
     )
 
 
+def _execute_and_log(session_id: str, action: dict):
+    """Execute an action and append it to the session log (blocking; None if not found)."""
+    # Hold the session lock until the entry is logged, so entries stay in step order
+    with session_manager.lock(session_id):
+        if session_manager.get_session(session_id) is None:
+            return None
+        result = action_executor.execute(session_id, action)
+        
+        # Log action
+        if result.success:
+            session = session_manager.get_session(session_id)
+            available_moves = _get_available_moves(session)
+            session_logger.log_action(session, action, result.to_dict(), available_moves)
+            
+            # Log session end if done
+            if result.done:
+                session_logger.log_session_end(session)
+    
+    return result
+
+
 @router.post("/session/{session_id}/action", response_model=ActionResponse)
 async def execute_action(session_id: str, request: ActionRequest):
     """
     Execute an action in a session.
     
-    Supports move, rotation, and stop actions.
+    Supports move, rotation, look_around, and stop actions.
     """
-    session = session_manager.get_session(session_id)
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
     # Build action dict
     action = {"type": request.type.value}
     if request.move_id is not None:
@@ -133,18 +203,10 @@ async def execute_action(session_id: str, request: ActionRequest):
     if request.agent_total_duration_seconds is not None:
         action["agent_total_duration_seconds"] = request.agent_total_duration_seconds
     
-    # Execute action
-    result = action_executor.execute(session_id, action)
-    
-    # Log action
-    if result.success:
-        session = session_manager.get_session(session_id)
-        available_moves = _get_available_moves(session)
-        session_logger.log_action(session, action, result.to_dict(), available_moves)
-        
-        # Log session end if done
-        if result.done:
-            session_logger.log_session_end(session)
+    # Execute and log the action in the action pool (one at a time per session)
+    result = await _run_blocking(session_id, _execute_and_log, session_id, action)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Session not found")
     
     # Build response
     observation = None
@@ -159,7 +221,11 @@ async def execute_action(session_id: str, request: ActionRequest):
             center_heading=result.observation.get('center_heading', 0.0),
             available_moves=[
                 AvailableMove(**m) for m in result.observation.get('available_moves', [])
-            ]
+            ],
+            look_around=[
+                LookAroundView(direction=v['direction'], heading=v['heading'], image=v.get('image'))
+                for v in result.observation['look_around']
+            ] if result.observation.get('look_around') else None
         )
     
     return ActionResponse(
@@ -171,6 +237,15 @@ async def execute_action(session_id: str, request: ActionRequest):
     )
 
 
+def _end_and_log(session_id: str):
+    """End a session and log its end (blocking; None if not found)."""
+    with session_manager.lock(session_id):
+        session = session_manager.end_session(session_id, "manual_end")
+        if session is not None:
+            session_logger.log_session_end(session)
+    return session
+
+
 @router.post("/session/{session_id}/end", response_model=EndSessionResponse)
 async def end_session(session_id: str):
     """
@@ -178,16 +253,11 @@ async def end_session(session_id: str):
     
     Terminates the session and returns summary information.
     """
-    session = session_manager.get_session(session_id)
+    # End and log after any action of this session still in flight
+    session = await _run_blocking(session_id, _end_and_log, session_id)
     if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # End session
-    session = session_manager.end_session(session_id, "manual_end")
-    
-    # Log end
-    session_logger.log_session_end(session)
-    
     return EndSessionResponse(
         status=session.status.value,
         total_steps=session.step_count,
@@ -203,7 +273,7 @@ async def pause_session(session_id: str):
     
     Only works for human mode sessions.
     """
-    success = session_manager.pause_session(session_id)
+    success = await _run_blocking(session_id, session_manager.pause_session, session_id)
     
     if not success:
         raise HTTPException(status_code=400, detail="Cannot pause this session")
@@ -215,6 +285,15 @@ async def pause_session(session_id: str):
     )
 
 
+def _resume(session_id: str):
+    """Resume a session (may load it from the database) and build its observation (blocking)."""
+    session = session_manager.resume_session(session_id)
+    if session is None:
+        return None
+    action_executor.prefetch(session)
+    return session, _build_observation(session)
+
+
 @router.post("/session/{session_id}/resume", response_model=ResumeSessionResponse)
 async def resume_session(session_id: str):
     """
@@ -222,12 +301,11 @@ async def resume_session(session_id: str):
     
     Restores session state and returns current observation.
     """
-    session = session_manager.resume_session(session_id)
+    resumed = await _run_blocking(session_id, _resume, session_id)
     
-    if session is None:
+    if resumed is None:
         raise HTTPException(status_code=404, detail="Session not found or cannot resume")
-    
-    observation = _build_observation(session)
+    session, observation = resumed
     
     return ResumeSessionResponse(
         success=True,
@@ -351,16 +429,37 @@ async def get_task(task_id: str):
     )
 
 
-# Preload status tracking (simple in-memory)
-_preload_status = {}
+def _preload_status_response(job: Optional[dict]) -> PreloadStatusResponse:
+    """Build a preload status response from a preload job."""
+    if job is None:
+        return PreloadStatusResponse(
+            status="not_started",
+            progress=0,
+            total=0,
+            percentage=0.0
+        )
+    
+    progress = job["done"] + job["failed"]
+    percentage = (progress / job["total"] * 100) if job["total"] > 0 else 0
+    
+    return PreloadStatusResponse(
+        status=job["status"],
+        progress=progress,
+        total=job["total"],
+        percentage=round(percentage, 1),
+        message=job.get("message"),
+        job_id=job["job_id"],
+        failed=job["failed"]
+    )
 
 
 @router.post("/tasks/{task_id}/preload", response_model=PreloadStatusResponse)
-async def preload_task(task_id: str, request: PreloadRequest, background_tasks: BackgroundTasks):
+async def preload_task(task_id: str, request: PreloadRequest):
     """
     Start preloading panoramas for a task.
     
-    Downloads all panoramas in the task's geofence.
+    Downloads all panoramas in the task's geofence as a persistent
+    preload job (see /preload/jobs).
     """
     # Load task config to get geofence name
     task_path = TASKS_DIR / f"{task_id}.json"
@@ -370,61 +469,25 @@ async def preload_task(task_id: str, request: PreloadRequest, background_tasks:
     with open(task_path, 'r', encoding='utf-8') as f:
         task_config = json.load(f)
     
-    geofence_name = task_config.get('geofence')
+    geofence_name = task_geofence(task_config)
     if not geofence_name:
         raise HTTPException(status_code=404, detail="No geofence specified in task")
     
-    # Get geofence by name
-    geofence = geofence_checker.get_geofence(geofence_name)
-    if not geofence:
+    # Get geofence by name (geofence config, then the other whitelists)
+    pano_ids = resolve_whitelist(geofence_name)
+    if not pano_ids:
         raise HTTPException(status_code=404, detail=f"Geofence not found: {geofence_name}")
     
-    total = len(geofence)
-    zoom_level = request.zoom_level or settings.PANORAMA_ZOOM_LEVEL
-    
-    # Initialize status
-    _preload_status[task_id] = {
-        "status": "in_progress",
-        "progress": 0,
-        "total": total,
-        "message": f"Preloading {total} panoramas at zoom level {zoom_level}"
-    }
-    
-    # Start background task
-    background_tasks.add_task(_preload_panoramas, task_id, list(geofence), zoom_level)
-    
-    return PreloadStatusResponse(
-        status="started",
-        progress=0,
-        total=total,
-        percentage=0.0,
-        message=f"Preloading {total} panoramas at zoom level {zoom_level}"
-    )
+    job = await preload_manager.submit(task_id, pano_ids, request.zoom_level)
+    return _preload_status_response(job)
 
 
 @router.get("/tasks/{task_id}/preload/status", response_model=PreloadStatusResponse)
 async def get_preload_status(task_id: str):
     """
-    Get preload status for a task.
+    Get preload status for a task (its latest preload job).
     """
-    if task_id not in _preload_status:
-        return PreloadStatusResponse(
-            status="not_started",
-            progress=0,
-            total=0,
-            percentage=0.0
-        )
-    
-    status = _preload_status[task_id]
-    percentage = (status["progress"] / status["total"] * 100) if status["total"] > 0 else 0
-    
-    return PreloadStatusResponse(
-        status=status["status"],
-        progress=status["progress"],
-        total=status["total"],
-        percentage=round(percentage, 1),
-        message=status.get("message")
-    )
+    return _preload_status_response(await asyncio.to_thread(preload_manager.get_latest_job, task_id))
 
 
 # === Geofence Management ===
@@ -445,62 +508,232 @@ async def list_geofences():
     return GeofenceListResponse(geofences=geofences)
 
 
-@router.post("/geofences/{geofence_name}/preload", response_model=PreloadStatusResponse)
-async def preload_geofence(geofence_name: str, request: PreloadRequest, background_tasks: BackgroundTasks):
+@router.post("/geofences/{geofence_name}/warm", response_model=GeofenceWarmResponse)
+async def warm_geofence(geofence_name: str):
     """
-    Start preloading panoramas for a geofence.
+    Load a geofence's whole adjacency graph into memory.
+    
+    Afterwards available moves and distances for sessions in this
+    geofence are computed without database access.
     """
-    geofence = geofence_checker.get_geofence(geofence_name)
-    if not geofence:
+    if not geofence_checker.get_geofence(geofence_name):
         raise HTTPException(status_code=404, detail=f"Geofence not found: {geofence_name}")
     
-    total = len(geofence)
-    zoom_level = request.zoom_level or settings.PANORAMA_ZOOM_LEVEL
+    # Reads every link row of the geofence; keep the event loop free meanwhile
+    graph = await asyncio.to_thread(geofence_checker.warm_geofence, geofence_name, force=True)
     
-    # Initialize status (using geofence_name as key)
-    _preload_status[geofence_name] = {
-        "status": "in_progress",
-        "progress": 0,
-        "total": total,
-        "message": f"Preloading {total} panoramas for {geofence_name}"
-    }
+    return GeofenceWarmResponse(**graph.get_stats())
+
+
+@router.post("/geofences/{geofence_name}/preload", response_model=PreloadStatusResponse)
+async def preload_geofence(geofence_name: str, request: PreloadRequest):
+    """
+    Start preloading panoramas for a geofence.
     
-    # Start background task
-    background_tasks.add_task(_preload_panoramas, geofence_name, list(geofence), zoom_level)
+    Lists from height_whitelist.json and perception_whitelist.json are
+    accepted too. A geofence that is already being preloaded at this zoom
+    returns the running job.
+    """
+    pano_ids = resolve_whitelist(geofence_name)
+    if not pano_ids:
+        raise HTTPException(status_code=404, detail=f"Geofence not found: {geofence_name}")
     
-    return PreloadStatusResponse(
-        status="started",
-        progress=0,
-        total=total,
-        percentage=0.0,
-        message=f"Preloading {total} panoramas for {geofence_name}"
-    )
+    job = await preload_manager.submit(geofence_name, pano_ids, request.zoom_level)
+    return _preload_status_response(job)
 
 
 @router.get("/geofences/{geofence_name}/preload/status", response_model=PreloadStatusResponse)
 async def get_geofence_preload_status(geofence_name: str):
     """
-    Get preload status for a geofence.
+    Get preload status for a geofence (its latest preload job).
     """
-    if geofence_name not in _preload_status:
-        # Check if maybe it was preloaded as a task? No, separate keys.
-        return PreloadStatusResponse(
-            status="not_started",
-            progress=0,
-            total=0,
-            percentage=0.0
-        )
+    return _preload_status_response(await asyncio.to_thread(preload_manager.get_latest_job, geofence_name))
+
+
+@router.get("/geofences/{geofence_name}/coverage", response_model=CoverageAuditResponse)
+async def get_geofence_coverage(geofence_name: str, zoom_level: Optional[int] = None):
+    """
+    List the panoramas of a geofence without cached metadata, links or image.
+    """
+    pano_ids = resolve_whitelist(geofence_name)
+    if not pano_ids:
+        raise HTTPException(status_code=404, detail=f"Geofence not found: {geofence_name}")
     
-    status = _preload_status[geofence_name]
-    percentage = (status["progress"] / status["total"] * 100) if status["total"] > 0 else 0
+    report = await asyncio.to_thread(audit_coverage, pano_ids, zoom_level)
+    return CoverageAuditResponse(**report)
+
+
+# === Coverage Audit ===
+
+def _whitelist_path(filename: str) -> Path:
+    """Get one of settings.PRELOAD_WHITELIST_PATHS by file name."""
+    path = next((p for p in settings.PRELOAD_WHITELIST_PATHS if p.name == filename), None)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Unknown whitelist file: {filename}")
+    return path
+
+
+@router.post("/coverage/audit", response_model=CoverageAuditResponse)
+async def audit_cache_coverage(request: CoverageAuditRequest):
+    """
+    Find required panoramas without cached metadata, links or image.
     
-    return PreloadStatusResponse(
-        status=status["status"],
-        progress=status["progress"],
-        total=status["total"],
-        percentage=round(percentage, 1),
-        message=status.get("message")
-    )
+    Required panoramas are the union of the given list names, every list
+    of `whitelist_file` and the geofence/spawn/target panoramas of the
+    given tasks. With `preload`, the missing panoramas are handed to a
+    preload job right away.
+    """
+    pano_ids = []
+    for name in request.names or []:
+        panos = resolve_whitelist(name)
+        if panos is None:
+            raise HTTPException(status_code=404, detail=f"Geofence not found: {name}")
+        pano_ids.extend(panos)
+    if request.whitelist_file:
+        pano_ids.extend(required_panos_for_file(_whitelist_path(request.whitelist_file)))
+    if request.all_tasks or request.task_ids:
+        try:
+            pano_ids.extend(required_panos_for_tasks(TASKS_DIR, None if request.all_tasks else request.task_ids))
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    if not pano_ids:
+        raise HTTPException(status_code=400, detail="Nothing to audit: give names, whitelist_file or tasks")
+    
+    report = await asyncio.to_thread(audit_coverage, pano_ids, request.zoom_level)
+    
+    if request.preload and report["missing"]:
+        if request.job_name:
+            job_name = request.job_name
+        elif request.names:
+            job_name = request.names[0] if len(request.names) == 1 else f"{len(request.names)}_lists"
+        else:
+            job_name = request.whitelist_file or ("all_tasks" if request.all_tasks else "tasks")
+        job_name = f"audit_{job_name}"
+        report["job"] = PreloadJobInfo(**await preload_manager.submit(job_name, report["missing"], report["zoom"]))
+    
+    return CoverageAuditResponse(**report)
+
+
+# === Preload Jobs ===
+
+@router.post("/preload/jobs", response_model=PreloadJobInfo)
+async def create_preload_job(request: PreloadJobRequest):
+    """
+    Start a preload job.
+    
+    Panoramas come from `pano_ids`, from every list of `whitelist_file`,
+    or (if neither is given) from the geofence/whitelist list `name`.
+    """
+    if request.pano_ids is not None:
+        pano_ids = request.pano_ids
+    elif request.whitelist_file:
+        pano_ids = required_panos_for_file(_whitelist_path(request.whitelist_file))
+    else:
+        pano_ids = resolve_whitelist(request.name)
+        if pano_ids is None:
+            raise HTTPException(status_code=404, detail=f"Geofence not found: {request.name}")
+    
+    return PreloadJobInfo(**await preload_manager.submit(request.name, pano_ids, request.zoom_level))
+
+
+@router.get("/preload/jobs", response_model=PreloadJobListResponse)
+async def list_preload_jobs(status: Optional[str] = None, limit: int = 100):
+    """
+    List preload jobs, newest first.
+    """
+    jobs = await asyncio.to_thread(preload_manager.list_jobs, status, limit)
+    return PreloadJobListResponse(jobs=[PreloadJobInfo(**job) for job in jobs])
+
+
+@router.get("/preload/jobs/{job_id}", response_model=PreloadJobInfo)
+async def get_preload_job(job_id: str):
+    """
+    Get a preload job.
+    """
+    job = await asyncio.to_thread(preload_manager.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Preload job not found: {job_id}")
+    return PreloadJobInfo(**job)
+
+
+@router.post("/preload/jobs/{job_id}/cancel", response_model=PreloadJobInfo)
+async def cancel_preload_job(job_id: str):
+    """
+    Cancel a preload job.
+    
+    Panoramas not fetched yet stay pending; the job can be resumed later.
+    """
+    if not await preload_manager.cancel(job_id):
+        job = await asyncio.to_thread(preload_manager.get_job, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Preload job not found: {job_id}")
+        raise HTTPException(status_code=400, detail=f"Preload job is {job['status']}")
+    return PreloadJobInfo(**await asyncio.to_thread(preload_manager.get_job, job_id))
+
+
+@router.post("/preload/jobs/{job_id}/resume", response_model=PreloadJobInfo)
+async def resume_preload_job(job_id: str, retry_failed: bool = True):
+    """
+    Resume a cancelled or unfinished preload job (and retry its failures).
+    """
+    job = await preload_manager.resume(job_id, retry_failed=retry_failed)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Preload job not found: {job_id}")
+    return PreloadJobInfo(**job)
+
+
+# === API Keys ===
+
+@router.get("/keys/usage", response_model=ApiKeyUsageResponse)
+async def get_api_key_usage():
+    """
+    Get per-key request counters of the Google API key pool.
+    
+    Keys are masked; counters are per service (tiles, metadata, maps_js,
+    places, routes) since the server started.
+    """
+    return ApiKeyUsageResponse(**api_key_pool.get_usage())
+
+
+# === Action Pool ===
+
+@router.get("/actions/stats", response_model=ActionPoolStatsResponse)
+async def get_action_pool_stats():
+    """
+    Get queue statistics of the pool that runs session actions.
+    """
+    return ActionPoolStatsResponse(**action_runner.get_stats())
+
+
+# === Session Memory ===
+
+@router.get("/sessions/stats", response_model=SessionStatsResponse)
+async def get_session_stats():
+    """
+    Get statistics of the sessions held in memory and of their eviction.
+    """
+    return SessionStatsResponse(**await _run_blocking(None, session_manager.get_stats))
+
+
+# === Temp Images ===
+
+@router.get("/temp-images/stats", response_model=TempImageStatsResponse)
+async def get_temp_image_stats():
+    """
+    Get statistics of the temp image janitor (policy, quota, last sweep).
+    """
+    return TempImageStatsResponse(**temp_image_janitor.get_stats())
+
+
+@router.post("/temp-images/sweep", response_model=TempImageStatsResponse)
+async def sweep_temp_images():
+    """
+    Apply the cleanup policy and the disk quota to temp_images/ now.
+    
+    Skipped if a sweep is already running (in this or another worker).
+    """
+    await _run_blocking(None, temp_image_janitor.sweep)
+    return TempImageStatsResponse(**temp_image_janitor.get_stats())
 
 
 # === Player Progress ===
@@ -532,12 +765,40 @@ async def get_player_progress(player_id: str):
     )
 
 
+# === Panoramas ===
+
+def _panorama_jpeg(pano_id: str, zoom: int) -> Optional[bytes]:
+    """Stitch and JPEG-encode a cached panorama (blocking; None if not cached)."""
+    from cache.panorama_cache import panorama_cache
+    from engine.image_stitcher import ImageStitcher
+    
+    image = panorama_cache.get_decoded(pano_id, zoom)
+    if image is None:
+        return None
+    return ImageStitcher.encode(image)
+
+
+@router.get("/panoramas/{pano_id}/z{zoom}.jpg")
+async def get_panorama_jpeg(pano_id: str, zoom: int):
+    """
+    Get a full panorama as JPEG for the human-mode 360° viewer.
+    
+    Serves panoramas stored as lossless tile sets (PANORAMA_STORE_TILES),
+    which have no JPEG under /data/panoramas.
+    """
+    image_bytes = await _run_blocking(None, _panorama_jpeg, pano_id, zoom)
+    if image_bytes is None:
+        raise HTTPException(status_code=404, detail=f"Panorama not cached: {pano_id} (zoom {zoom})")
+    return Response(content=image_bytes, media_type="image/jpeg", headers={"Cache-Control": "max-age=3600"})
+
+
 # === Helper Functions ===
 
 def _build_observation(session) -> Observation:
-    """Build observation from session state."""
+    """Build observation from session state (blocking: metadata lookup)."""
     from engine.session_manager import SessionMode
     from cache.metadata_cache import metadata_cache
+    from cache.panorama_cache import panorama_cache
     
     available_moves = _get_available_moves(session)
     
@@ -564,6 +825,10 @@ def _build_observation(session) -> Observation:
         if is_human_mode:
             zoom_level = settings.PANORAMA_ZOOM_LEVEL
             panorama_url = f"/data/panoramas/{pano_id}_z{zoom_level}.jpg"
+            stored = panorama_cache.get(pano_id, zoom_level)
+            if stored is not None and stored.suffix == '.pyr':
+                # Lossless tile set: no JPEG on disk, stitched on request
+                panorama_url = f"/api/panoramas/{pano_id}/z{zoom_level}.jpg"
             print(f"[Human Mode] panorama_url = {panorama_url}, center_heading = {center_heading}")
     
     return Observation(
@@ -581,113 +846,10 @@ def _build_observation(session) -> Observation:
 def _get_available_moves(session) -> list:
     """Get available moves for a session."""
     from engine.direction_calculator import direction_calculator
-    from cache.metadata_cache import metadata_cache
-    
-    current_pano_id = session.state.pano_id
-    
-    # Get metadata
-    metadata = metadata_cache.get(current_pano_id)
-    if not metadata:
-        return []
     
-    links = metadata.get('links', [])
-    if not links:
-        return []
-    
-    # Filter by geofence
-    links = geofence_checker.filter_links(session.geofence, links)
-    
-    # Get locations
-    current_location = (session.state.lat, session.state.lng)
-    if current_location[0] is None:
-        current_location = metadata_cache.get_location(current_pano_id)
-    
-    link_pano_ids = [l.get('panoId') or l.get('pano_id') for l in links]
-    locations = metadata_cache.get_all_locations(link_pano_ids)
-    
-    # Calculate moves (link.heading is already true north reference)
-    moves = direction_calculator.calculate_available_moves(
-        links, session.state.heading, current_location, locations
-    )
-    moves = direction_calculator.sort_moves_by_direction(moves)
+    # Precomputed per-pano move table (link.heading is already true north reference)
+    table = geofence_checker.get_move_table(session.geofence, session.state.pano_id)
+    moves = direction_calculator.moves_from_table(table, session.state.heading)
     
     return [{"id": m["id"], "direction": m["direction"], "distance": m.get("distance"), "heading": m.get("heading")} for m in moves]
 
-
-async def _process_single_pano(pano_id: str, zoom_level: int, semaphore: asyncio.Semaphore, progress_tracker: dict, task_id_or_name: str):
-    """Process a single panorama (metadata + image) with concurrency limit."""
-    from engine.image_stitcher import image_stitcher
-    from engine.metadata_fetcher import metadata_fetcher
-    
-    async with semaphore:
-        try:
-            # 1. Metadata (Async)
-            await metadata_fetcher.fetch_and_cache_async(pano_id)
-            
-            # 2. Image (Sync in Thread)
-            # image_stitcher.download_and_stitch checks cache internally
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(
-                None, 
-                image_stitcher.download_and_stitch,
-                pano_id, 
-                zoom_level,
-                None
-            )
-            
-        except Exception as e:
-            print(f"[Preload] Error processing {pano_id}: {e}")
-        finally:
-            progress_tracker["progress"] += 1
-            curr = progress_tracker["progress"]
-            total = progress_tracker["total"]
-            
-            # Update global status
-            if task_id_or_name in _preload_status:
-                _preload_status[task_id_or_name]["progress"] = curr
-                _preload_status[task_id_or_name]["message"] = f"Processed {curr}/{total} panoramas"
-                print(f"[Preload-Progress] {curr}/{total} ({round(curr/total*100, 1)}%)")
-
-
-async def _preload_panoramas(task_id_or_name: str, pano_ids: list, zoom_level: int):
-    """
-    Background task to preload panoramas (Fully Async & Parallel).
-    """
-    import asyncio
-    
-    total = len(pano_ids)
-    print(f"[Preload] Starting parallel preload for {total} panoramas (Task/List: {task_id_or_name})...")
-    
-    # Update status
-    if task_id_or_name in _preload_status:
-        _preload_status[task_id_or_name]["status"] = "in_progress"
-        # Reset progress if restarting? keeping message.
-        _preload_status[task_id_or_name]["total"] = total
-    
-    # Concurrency limit (8 parallel downloads)
-    # This limits how many panos are processed at once.
-    # Metadata fetching has its own internal pool (4 workers).
-    # Image downloading happens in threads.
-    semaphore = asyncio.Semaphore(12)
-    progress_tracker = {"progress": 0, "total": total}
-    
-    tasks = []
-    for pano_id in pano_ids:
-        tasks.append(_process_single_pano(pano_id, zoom_level, semaphore, progress_tracker, task_id_or_name))
-    
-    if not tasks:
-        _preload_status[task_id_or_name]["status"] = "completed"
-        _preload_status[task_id_or_name]["progress"] = 0
-        return
-
-    # Run all
-    await asyncio.gather(*tasks)
-    
-    # Complete
-    if task_id_or_name in _preload_status:
-        _preload_status[task_id_or_name]["status"] = "completed"
-        _preload_status[task_id_or_name]["progress"] = total
-        _preload_status[task_id_or_name]["message"] = f"Completed preloading {total} panoramas."
-    
-    print(f"[Preload] Finished {task_id_or_name}!")
-
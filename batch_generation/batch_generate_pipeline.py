@@ -32,11 +32,12 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from data_generator.task_assembler import TaskAssembler
 from visual_data_generator.run_agent_visual import run_agent_on_task
 from engine.image_stitcher import image_stitcher
+from engine.api_key_pool import api_key_pool
 
 # --- Configuration ---
 TARGET_TASKS = 1200
 MAX_VERIFICATION_WORKERS = 5
-MAX_DOWNLOAD_WORKERS = 10
+MAX_DOWNLOAD_WORKERS = 10 * max(1, len(api_key_pool))  # Scales with configured API keys
 STATE_FILE = Path(__file__).parent.parent / "data" / "generation_state.json"
 CITIES_FILE = Path(__file__).parent.parent / "data" / "cities.json"
 TASKS_DIR = Path(__file__).parent.parent / "tasks"
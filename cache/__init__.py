@@ -5,5 +5,6 @@ Provides SQLite-based caching for panorama images, metadata, and locations.
 from .cache_manager import CacheManager
 from .panorama_cache import PanoramaCache
 from .metadata_cache import MetadataCache
+from .negative_cache import NegativeCache
 
-__all__ = ["CacheManager", "PanoramaCache", "MetadataCache"]
+__all__ = ["CacheManager", "PanoramaCache", "MetadataCache", "NegativeCache"]
@@ -149,15 +149,65 @@ class CacheManager:
                     elapsed_time REAL DEFAULT 0,
                     trajectory TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    record TEXT,
+                    active INTEGER DEFAULT 1
+                )
+            ''')
+            
+            # Migration: full session record (JSON) and live flag for the session store
+            cursor.execute("PRAGMA table_info(sessions)")
+            columns = [row[1] for row in cursor.fetchall()]
+            if 'record' not in columns:
+                cursor.execute('ALTER TABLE sessions ADD COLUMN record TEXT')
+            if 'active' not in columns:
+                cursor.execute('ALTER TABLE sessions ADD COLUMN active INTEGER DEFAULT 1')
+            
+            # Negative results (ZERO_RESULTS, missing tiles, filtered panos)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS negative_cache (
+                    pano_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (pano_id, kind)
+                )
+            ''')
+            
+            # Preload jobs table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS preload_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    zoom INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER DEFAULT 0,
+                    done INTEGER DEFAULT 0,
+                    failed INTEGER DEFAULT 0,
+                    message TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
             
+            # Per-panorama state of preload jobs
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS preload_job_panos (
+                    job_id TEXT NOT NULL,
+                    pano_id TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    PRIMARY KEY (job_id, pano_id)
+                )
+            ''')
+            
             # Create indexes for faster lookups
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_panoramas_pano_id ON panoramas(pano_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_metadata_pano_id ON metadata(pano_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_locations_pano_id ON locations(pano_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_preload_jobs_status ON preload_jobs(status)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_preload_job_panos_state ON preload_job_panos(job_id, state)')
     
     def close(self):
         """Close the database connection for current thread."""
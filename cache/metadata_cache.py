@@ -3,13 +3,68 @@ MetadataCache - Manages panorama metadata and location data in SQLite.
 
 Stores metadata (lat, lng, capture_date, links) and provides fast
 coordinate lookups for distance calculations.
+
+Parsed rows are memoized in-process as immutable PanoRecord objects, so
+hot-path lookups during a session cost no SQL once warm. The memo is
+invalidated by save()/delete() and can be preloaded for a whole geofence.
 """
 import json
-from typing import Optional, Dict, List, Tuple
+import threading
+from types import MappingProxyType
+from typing import Optional, Dict, List, Tuple, NamedTuple, Iterable, Callable
 from pathlib import Path
 
 from .cache_manager import cache_manager
 
+# SQLite's default limit on host parameters per statement is 999
+_SQL_BATCH_SIZE = 900
+
+
+class PanoRecord(NamedTuple):
+    """Immutable, parsed metadata row."""
+    pano_id: str
+    lat: float
+    lng: float
+    capture_date: Optional[str]
+    links: Tuple[MappingProxyType, ...]
+    center_heading: float
+    fetched_at: Optional[str]
+    source: Optional[str]
+    has_links_column: bool
+    
+    @classmethod
+    def from_row(cls, row) -> 'PanoRecord':
+        """Build a record from a metadata table row."""
+        links = json.loads(row['links']) if row['links'] else []
+        return cls(
+            pano_id=row['pano_id'],
+            lat=row['lat'],
+            lng=row['lng'],
+            capture_date=row['capture_date'],
+            links=tuple(MappingProxyType(dict(link)) for link in links),
+            center_heading=row['center_heading'] if row['center_heading'] is not None else 0.0,
+            fetched_at=row['fetched_at'],
+            source=row['source'],
+            has_links_column=row['links'] is not None
+        )
+    
+    def links_list(self) -> List[Dict]:
+        """Links as a fresh list of mutable dicts."""
+        return [dict(link) for link in self.links]
+    
+    def to_dict(self) -> Dict:
+        """Convert to the metadata dict format returned by MetadataCache.get()."""
+        return {
+            'pano_id': self.pano_id,
+            'lat': self.lat,
+            'lng': self.lng,
+            'capture_date': self.capture_date,
+            'links': self.links_list(),
+            'center_heading': self.center_heading,
+            'fetched_at': self.fetched_at,
+            'source': self.source
+        }
+
 
 class MetadataCache:
     """
@@ -23,6 +78,116 @@ class MetadataCache:
     - source: Which API was used (maps_js_api / static_api)
     """
     
+    def __init__(self):
+        """Initialize the in-process memo (read-through over SQLite)."""
+        self._records: Dict[str, PanoRecord] = {}
+        self._locations: Dict[str, Tuple[float, float]] = {}
+        self._memo_lock = threading.Lock()
+        # Bumped on every invalidation so in-flight reads can't store stale rows
+        self._generation = 0
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+    
+    def _remember(self, records: Iterable[PanoRecord], generation: int):
+        """Store freshly read records unless an invalidation happened meanwhile."""
+        with self._memo_lock:
+            if generation != self._generation:
+                return
+            for record in records:
+                self._records[record.pano_id] = record
+                self._locations[record.pano_id] = (record.lat, record.lng)
+    
+    def _invalidate(self, pano_id: str):
+        """Drop memoized data for a panorama."""
+        with self._memo_lock:
+            self._generation += 1
+            self._records.pop(pano_id, None)
+            self._locations.pop(pano_id, None)
+        self._notify(pano_id)
+    
+    def clear_memo(self):
+        """Drop all memoized records (e.g. after external writes to the DB)."""
+        with self._memo_lock:
+            self._generation += 1
+            self._records.clear()
+            self._locations.clear()
+        self._notify(None)
+    
+    def add_invalidation_listener(self, callback: Callable[[Optional[str]], None]):
+        """
+        Register a callback for metadata changes.
+        
+        Args:
+            callback: Called with the changed pano_id, or None when the
+                whole memo was dropped
+        """
+        self._listeners.append(callback)
+    
+    def _notify(self, pano_id: Optional[str]):
+        """Tell listeners (e.g. warmed geofence graphs) that data changed."""
+        for callback in self._listeners:
+            try:
+                callback(pano_id)
+            except Exception as e:
+                print(f"[MetadataCache] Invalidation listener failed: {e}")
+    
+    def get_record(self, pano_id: str) -> Optional[PanoRecord]:
+        """
+        Get the immutable metadata record for a panorama (memoized).
+        
+        Args:
+            pano_id: Panorama ID
+        
+        Returns:
+            PanoRecord or None if not found
+        """
+        record = self._records.get(pano_id)
+        if record is not None:
+            self.memo_hits += 1
+            return record
+        
+        self.memo_misses += 1
+        generation = self._generation
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                'SELECT * FROM metadata WHERE pano_id = ?',
+                (pano_id,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            record = PanoRecord.from_row(row)
+        
+        self._remember((record,), generation)
+        return record
+    
+    def preload(self, pano_ids: Iterable[str]) -> int:
+        """
+        Load metadata for many panoramas into the memo in batched queries.
+        
+        Args:
+            pano_ids: Panorama IDs (e.g. a geofence whitelist)
+        
+        Returns:
+            Number of records now memoized for the given IDs
+        """
+        missing = [p for p in set(pano_ids) if p not in self._records]
+        generation = self._generation
+        
+        for start in range(0, len(missing), _SQL_BATCH_SIZE):
+            chunk = missing[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            with cache_manager.get_connection() as conn:
+                cursor = conn.execute(
+                    f'SELECT * FROM metadata WHERE pano_id IN ({placeholders})',
+                    chunk
+                )
+                records = [PanoRecord.from_row(row) for row in cursor.fetchall()]
+            self._remember(records, generation)
+        
+        return sum(1 for p in set(pano_ids) if p in self._records)
+    
     def has(self, pano_id: str) -> bool:
         """
         Check if metadata exists for a panorama.
@@ -33,6 +198,9 @@ class MetadataCache:
         Returns:
             True if metadata exists
         """
+        if pano_id in self._records:
+            return True
+        
         with cache_manager.get_connection() as conn:
             cursor = conn.execute(
                 'SELECT 1 FROM metadata WHERE pano_id = ?',
@@ -50,25 +218,10 @@ class MetadataCache:
         Returns:
             Metadata dict or None if not found
         """
-        with cache_manager.get_connection() as conn:
-            cursor = conn.execute(
-                'SELECT * FROM metadata WHERE pano_id = ?',
-                (pano_id,)
-            )
-            row = cursor.fetchone()
-            if row is None:
-                return None
-            
-            return {
-                'pano_id': row['pano_id'],
-                'lat': row['lat'],
-                'lng': row['lng'],
-                'capture_date': row['capture_date'],
-                'links': json.loads(row['links']) if row['links'] else [],
-                'center_heading': row['center_heading'] if row['center_heading'] is not None else 0.0,
-                'fetched_at': row['fetched_at'],
-                'source': row['source']
-            }
+        record = self.get_record(pano_id)
+        if record is None:
+            return None
+        return record.to_dict()
     
     def save(self, pano_id: str, lat: float, lng: float,
              capture_date: Optional[str] = None,
@@ -89,6 +242,7 @@ class MetadataCache:
         """
         links_json = json.dumps(links) if links else None
         
+        self._invalidate(pano_id)
         with cache_manager.get_connection() as conn:
             conn.execute('''
                 INSERT OR REPLACE INTO metadata 
@@ -101,6 +255,44 @@ class MetadataCache:
                 INSERT OR REPLACE INTO locations (pano_id, lat, lng)
                 VALUES (?, ?, ?)
             ''', (pano_id, lat, lng))
+        self._invalidate(pano_id)
+    
+    def save_many(self, records: List[Dict]) -> int:
+        """
+        Save or update metadata for many panoramas in one transaction.
+        
+        Args:
+            records: Dicts with the keyword arguments of save() (pano_id,
+                lat, lng and optionally capture_date, links, center_heading,
+                source)
+        
+        Returns:
+            Number of records written
+        """
+        rows = []
+        for r in records:
+            links = r.get('links')
+            rows.append((
+                r['pano_id'], r['lat'], r['lng'], r.get('capture_date'),
+                json.dumps(links) if links else None,
+                r.get('center_heading'), r.get('source', 'unknown')
+            ))
+        if not rows:
+            return 0
+        
+        with cache_manager.get_connection() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO metadata 
+                (pano_id, lat, lng, capture_date, links, center_heading, source)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.executemany('''
+                INSERT OR REPLACE INTO locations (pano_id, lat, lng)
+                VALUES (?, ?, ?)
+            ''', [(row[0], row[1], row[2]) for row in rows])
+        for row in rows:
+            self._invalidate(row[0])
+        return len(rows)
     
     def get_links(self, pano_id: str) -> Optional[List[Dict]]:
         """
@@ -112,15 +304,10 @@ class MetadataCache:
         Returns:
             List of link dicts [{panoId, heading}, ...] or None
         """
-        with cache_manager.get_connection() as conn:
-            cursor = conn.execute(
-                'SELECT links FROM metadata WHERE pano_id = ?',
-                (pano_id,)
-            )
-            row = cursor.fetchone()
-            if row is None or row['links'] is None:
-                return None
-            return json.loads(row['links'])
+        record = self.get_record(pano_id)
+        if record is None or not record.has_links_column:
+            return None
+        return record.links_list()
     
     def get_center_heading(self, pano_id: str) -> Optional[float]:
         """
@@ -135,15 +322,10 @@ class MetadataCache:
         Returns:
             Center heading in degrees (0-360) or None if not found
         """
-        with cache_manager.get_connection() as conn:
-            cursor = conn.execute(
-                'SELECT center_heading FROM metadata WHERE pano_id = ?',
-                (pano_id,)
-            )
-            row = cursor.fetchone()
-            if row is None:
-                return None
-            return row['center_heading'] if row['center_heading'] is not None else 0.0
+        record = self.get_record(pano_id)
+        if record is None:
+            return None
+        return record.center_heading
     
     def get_location(self, pano_id: str) -> Optional[Tuple[float, float]]:
         """
@@ -155,6 +337,11 @@ class MetadataCache:
         Returns:
             Tuple of (lat, lng) or None if not found
         """
+        location = self._locations.get(pano_id)
+        if location is not None:
+            return location
+        
+        generation = self._generation
         with cache_manager.get_connection() as conn:
             cursor = conn.execute(
                 'SELECT lat, lng FROM locations WHERE pano_id = ?',
@@ -163,7 +350,12 @@ class MetadataCache:
             row = cursor.fetchone()
             if row is None:
                 return None
-            return (row['lat'], row['lng'])
+            location = (row['lat'], row['lng'])
+        
+        with self._memo_lock:
+            if generation == self._generation:
+                self._locations[pano_id] = location
+        return location
     
     def get_all_locations(self, pano_ids: List[str]) -> Dict[str, Tuple[float, float]]:
         """
@@ -178,13 +370,37 @@ class MetadataCache:
         if not pano_ids:
             return {}
         
-        placeholders = ','.join('?' * len(pano_ids))
-        with cache_manager.get_connection() as conn:
-            cursor = conn.execute(
-                f'SELECT pano_id, lat, lng FROM locations WHERE pano_id IN ({placeholders})',
-                pano_ids
-            )
-            return {row['pano_id']: (row['lat'], row['lng']) for row in cursor.fetchall()}
+        result = {}
+        missing = []
+        for pano_id in pano_ids:
+            location = self._locations.get(pano_id)
+            if location is not None:
+                result[pano_id] = location
+            else:
+                missing.append(pano_id)
+        
+        if not missing:
+            return result
+        
+        generation = self._generation
+        fetched = {}
+        for start in range(0, len(missing), _SQL_BATCH_SIZE):
+            chunk = missing[start:start + _SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            with cache_manager.get_connection() as conn:
+                cursor = conn.execute(
+                    f'SELECT pano_id, lat, lng FROM locations WHERE pano_id IN ({placeholders})',
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    fetched[row['pano_id']] = (row['lat'], row['lng'])
+        
+        with self._memo_lock:
+            if generation == self._generation:
+                self._locations.update(fetched)
+        
+        result.update(fetched)
+        return result
     
     def has_links(self, pano_id: str) -> bool:
         """
@@ -196,16 +412,10 @@ class MetadataCache:
         Returns:
             True if links exist and are not empty
         """
-        with cache_manager.get_connection() as conn:
-            cursor = conn.execute(
-                'SELECT links FROM metadata WHERE pano_id = ? AND links IS NOT NULL',
-                (pano_id,)
-            )
-            row = cursor.fetchone()
-            if row is None:
-                return False
-            links = json.loads(row['links']) if row['links'] else []
-            return len(links) > 0
+        record = self.get_record(pano_id)
+        if record is None:
+            return False
+        return len(record.links) > 0
     
     def delete(self, pano_id: str) -> bool:
         """
@@ -226,7 +436,10 @@ class MetadataCache:
                 'DELETE FROM locations WHERE pano_id = ?',
                 (pano_id,)
             )
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+        
+        self._invalidate(pano_id)
+        return deleted
     
     def get_stats(self) -> dict:
         """Get cache statistics."""
@@ -240,7 +453,10 @@ class MetadataCache:
             row = cursor.fetchone()
             return {
                 'total_metadata': row['total'],
-                'with_links': row['with_links']
+                'with_links': row['with_links'],
+                'memo_records': len(self._records),
+                'memo_hits': self.memo_hits,
+                'memo_misses': self.memo_misses
             }
 
 
@@ -0,0 +1,150 @@
+"""
+NegativeCache - Persistent record of lookups that came back empty.
+
+Remembers panoramas that returned ZERO_RESULTS, were missing tiles, failed
+repeatedly or were filtered out (e.g. capture date too old), with a reason
+code and an expiry time, so later runs skip them without a network call.
+"""
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from .cache_manager import cache_manager
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings
+
+
+# SQLite's default limit on host parameters per statement
+_MAX_PARAMS = 900
+
+
+class NegativeCache:
+    """
+    Negative results keyed by (pano_id, kind).
+    
+    Kinds:
+    - 'metadata': Static API metadata lookup
+    - 'links': Maps JS API getPanorama lookup
+    - 'tiles_z{zoom}': Tiles API panorama download at a zoom level
+    - 'whitelist': rejected by whitelist generation filters
+    
+    Entries expire after settings.NEGATIVE_CACHE_TTL[reason] seconds.
+    """
+    
+    def _ttl(self, reason: str) -> float:
+        return settings.NEGATIVE_CACHE_TTL.get(reason, settings.NEGATIVE_CACHE_DEFAULT_TTL)
+    
+    def get(self, pano_id: str, kind: str) -> Optional[str]:
+        """
+        Get the reason a panorama is known to fail, if not expired.
+        
+        Args:
+            pano_id: Panorama ID
+            kind: Lookup kind ('metadata', 'links', 'tiles_z{zoom}', 'whitelist')
+        
+        Returns:
+            Reason code or None if there is no live entry
+        """
+        if not settings.NEGATIVE_CACHE_ENABLED:
+            return None
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                'SELECT reason FROM negative_cache WHERE pano_id = ? AND kind = ? AND expires_at > ?',
+                (pano_id, kind, time.time())
+            )
+            row = cursor.fetchone()
+        return row['reason'] if row else None
+    
+    def get_many(self, pano_ids: Iterable[str], kinds: Iterable[str]) -> Dict[str, str]:
+        """
+        Find which of many panoramas have a live entry for any of the kinds.
+        
+        Args:
+            pano_ids: Panorama IDs
+            kinds: Lookup kinds to consider
+        
+        Returns:
+            Dict mapping pano_id to a reason code (only known failures)
+        """
+        if not settings.NEGATIVE_CACHE_ENABLED:
+            return {}
+        pano_ids = list(pano_ids)
+        kinds = list(kinds)
+        now = time.time()
+        found = {}
+        step = _MAX_PARAMS - len(kinds)
+        with cache_manager.get_connection() as conn:
+            for i in range(0, len(pano_ids), step):
+                chunk = pano_ids[i:i + step]
+                cursor = conn.execute(
+                    f'''
+                    SELECT pano_id, reason FROM negative_cache
+                    WHERE pano_id IN ({','.join('?' * len(chunk))})
+                      AND kind IN ({','.join('?' * len(kinds))})
+                      AND expires_at > ?
+                    ''',
+                    (*chunk, *kinds, now)
+                )
+                for row in cursor.fetchall():
+                    found[row['pano_id']] = row['reason']
+        return found
+    
+    def add(self, pano_id: str, kind: str, reason: str, ttl: Optional[float] = None):
+        """
+        Record a negative result.
+        
+        Args:
+            pano_id: Panorama ID
+            kind: Lookup kind
+            reason: Reason code (e.g. 'ZERO_RESULTS', 'NOT_FOUND', 'OLD_CAPTURE', 'ERROR')
+            ttl: Lifetime in seconds (defaults to the reason's configured TTL)
+        """
+        if not settings.NEGATIVE_CACHE_ENABLED:
+            return
+        expires_at = time.time() + (ttl if ttl is not None else self._ttl(reason))
+        with cache_manager.get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO negative_cache (pano_id, kind, reason, expires_at)
+                VALUES (?, ?, ?, ?)
+            ''', (pano_id, kind, reason, expires_at))
+    
+    def remove(self, pano_id: str, kind: Optional[str] = None) -> int:
+        """
+        Forget negative results for a panorama (all kinds if kind is None).
+        
+        Returns:
+            Number of entries removed
+        """
+        with cache_manager.get_connection() as conn:
+            if kind is None:
+                cursor = conn.execute('DELETE FROM negative_cache WHERE pano_id = ?', (pano_id,))
+            else:
+                cursor = conn.execute(
+                    'DELETE FROM negative_cache WHERE pano_id = ? AND kind = ?',
+                    (pano_id, kind)
+                )
+            return cursor.rowcount
+    
+    def purge_expired(self) -> int:
+        """Delete expired entries. Returns the number removed."""
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute('DELETE FROM negative_cache WHERE expires_at <= ?', (time.time(),))
+            return cursor.rowcount
+    
+    def get_stats(self) -> dict:
+        """Get live entry counts by kind and reason."""
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute('''
+                SELECT kind, reason, COUNT(*) as count FROM negative_cache
+                WHERE expires_at > ? GROUP BY kind, reason
+            ''', (time.time(),))
+            stats: Dict[str, Dict[str, int]] = {}
+            for row in cursor.fetchall():
+                stats.setdefault(row['kind'], {})[row['reason']] = row['count']
+            return stats
+
+
+# Global instance
+negative_cache = NegativeCache()
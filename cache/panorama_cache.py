@@ -2,17 +2,151 @@
 PanoramaCache - Manages panorama image file storage and database indexing.
 
 Handles saving, retrieving, and checking existence of panorama images
-at different zoom levels.
+at different zoom levels. Also keeps a byte-budgeted in-memory LRU of
+decoded panoramas (and pyramid tiles) shared by all sessions.
 """
+import os
 import shutil
+import tempfile
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
 
 from .cache_manager import cache_manager
+from .panorama_pyramid import PanoramaPyramid, write_pyramid, write_tile_set
+from .panorama_raw import RawPanoramaStore
+from .panorama_tiles import TileStore, TILE_SIZE
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config.settings import PANORAMAS_DIR
+from config.settings import settings, PANORAMAS_DIR, PANORAMAS_RAW_DIR, TILES_DIR
+
+
+class DecodedPanoramaLRU:
+    """
+    Byte-budgeted LRU of decoded panorama arrays.
+    
+    Arrays are stored read-only (OpenCV BGR order, as decoded) so they can be
+    shared between sessions and threads without copying. Concurrent misses
+    on the same key decode only once.
+    """
+    
+    def __init__(self, max_bytes: int):
+        """
+        Initialize the LRU.
+        
+        Args:
+            max_bytes: Total budget for decoded pixel data (0 disables caching)
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._loading: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __contains__(self, key: Tuple) -> bool:
+        with self._lock:
+            return key in self._entries
+    
+    def get(self, key: Tuple, loader):
+        """
+        Get a decoded array, calling loader() on a miss.
+        
+        Args:
+            key: (pano_id, zoom) or (pano_id, zoom, level, tx, ty) for pyramid tiles
+            loader: Callable returning a numpy array or None
+        
+        Returns:
+            Decoded array or None if loader failed
+        """
+        while True:
+            with self._lock:
+                array = self._entries.get(key)
+                if array is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return array
+                
+                event = self._loading.get(key)
+                if event is None:
+                    # This thread becomes the loader for the key
+                    self.misses += 1
+                    event = threading.Event()
+                    self._loading[key] = event
+                    break
+            
+            # Another thread is decoding the same panorama; wait and retry
+            event.wait()
+        
+        try:
+            array = loader()
+            if array is not None:
+                array.setflags(write=False)
+                self._put(key, array)
+            return array
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+    
+    def _put(self, key: Tuple, array):
+        """Insert an array and evict least recently used entries over budget."""
+        size = array.nbytes
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            
+            self._entries[key] = array
+            self.current_bytes += size
+            
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+    
+    def invalidate(self, key: Tuple):
+        """Drop a cached entry if present."""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+    
+    def invalidate_pano(self, pano_id: str, zoom: int):
+        """Drop the full image and all pyramid tiles of a panorama."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == pano_id and k[1] == zoom]:
+                self.current_bytes -= self._entries.pop(key).nbytes
+    
+    def clear(self):
+        """Drop all cached entries."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def get_stats(self) -> dict:
+        """Get LRU statistics."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
 
 
 class PanoramaCache:
@@ -21,6 +155,16 @@ class PanoramaCache:
     
     File naming: {pano_id}_z{zoom}.jpg
     Example: wwkpfmLCWlQ0vinOvd0TpQ_z2.jpg
+    
+    With settings.PANORAMA_PYRAMID, a tile pyramid {pano_id}_z{zoom}.pyr is
+    kept next to each JPEG (see PanoramaPyramid). With
+    settings.PANORAMA_RAW_CACHE_GB > 0, decoded panoramas are also kept as
+    memory-mapped .npy files (see RawPanoramaStore).
+    
+    Panoramas saved with save_tiles() have no JPEG: the downloaded tile set
+    is kept losslessly as a single-level .pyr and stitched when needed.
+    
+    Individual downloaded tiles are kept in `tiles` (see TileStore).
     """
     
     def __init__(self, panoramas_dir: Optional[Path] = None):
@@ -32,11 +176,72 @@ class PanoramaCache:
         """
         self.panoramas_dir = panoramas_dir or PANORAMAS_DIR
         self.panoramas_dir.mkdir(parents=True, exist_ok=True)
+        self.memory = DecodedPanoramaLRU(settings.PANORAMA_MEMORY_CACHE_MB * 1024 * 1024)
+        self._pyramids: OrderedDict = OrderedDict()
+        self._pyramid_lock = threading.Lock()
+        self.raw = RawPanoramaStore(
+            PANORAMAS_RAW_DIR,
+            int(settings.PANORAMA_RAW_CACHE_GB * 1024 ** 3)
+        )
+        self.tiles = TileStore(
+            TILES_DIR,
+            settings.TILE_CACHE_ENABLED,
+            int(settings.TILE_CACHE_MAX_GB * 1024 ** 3)
+        )
+        self._listeners: List[Callable[[str, int], None]] = []
     
     def _get_image_path(self, pano_id: str, zoom: int) -> Path:
         """Get the file path for a panorama image."""
         return self.panoramas_dir / f"{pano_id}_z{zoom}.jpg"
     
+    def _get_pyramid_path(self, pano_id: str, zoom: int) -> Path:
+        """Get the file path for a panorama tile pyramid."""
+        return self.panoramas_dir / f"{pano_id}_z{zoom}.pyr"
+    
+    def _invalidate(self, pano_id: str, zoom: int):
+        """Drop decoded data and the open pyramid reader for a panorama."""
+        self.memory.invalidate_pano(pano_id, zoom)
+        with self._pyramid_lock:
+            self._pyramids.pop((pano_id, zoom), None)
+        for callback in self._listeners:
+            try:
+                callback(pano_id, zoom)
+            except Exception as e:
+                print(f"[PanoramaCache] Invalidation listener failed: {e}")
+    
+    def invalidate(self, pano_id: str, zoom: int):
+        """Drop in-memory data of a panorama another process has replaced."""
+        self._invalidate(pano_id, zoom)
+    
+    def add_invalidation_listener(self, callback: Callable[[str, int], None]):
+        """
+        Register a callback for panoramas whose stored image changed.
+        
+        Args:
+            callback: Called with (pano_id, zoom)
+        """
+        self._listeners.append(callback)
+    
+    def _after_write(self, pano_id: str, zoom: int):
+        """Refresh derived data after the JPEG for a panorama changed."""
+        # Raw file first: listeners (render workers) must not reload the old pixels
+        self.raw.invalidate(pano_id, zoom)
+        self._invalidate(pano_id, zoom)
+        pyramid_path = self._get_pyramid_path(pano_id, zoom)
+        if settings.PANORAMA_PYRAMID:
+            self.build_pyramid(pano_id, zoom)
+        elif pyramid_path.exists():
+            # Never serve tiles from an older image
+            pyramid_path.unlink()
+    
+    def _record(self, pano_id: str, zoom: int, path: Path):
+        """Insert or update the database record for a stored panorama."""
+        with cache_manager.get_connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO panoramas (pano_id, zoom, image_path)
+                VALUES (?, ?, ?)
+            ''', (pano_id, zoom, str(path)))
+    
     def has(self, pano_id: str, zoom: int) -> bool:
         """
         Check if a panorama image exists in cache.
@@ -46,11 +251,10 @@ class PanoramaCache:
             zoom: Zoom level (0-5)
             
         Returns:
-            True if image exists in cache
+            True if image (or its lossless tile set) exists in cache
         """
         # First check file system (more reliable)
-        image_path = self._get_image_path(pano_id, zoom)
-        if not image_path.exists():
+        if self.get(pano_id, zoom) is None:
             return False
         
         # Also verify database record exists
@@ -70,13 +274,193 @@ class PanoramaCache:
             zoom: Zoom level
             
         Returns:
-            Path to image file if exists, None otherwise
+            Path to image file if exists (the .pyr for a tile set saved
+            without a JPEG), None otherwise
         """
         image_path = self._get_image_path(pano_id, zoom)
         if image_path.exists():
             return image_path
+        pyramid_path = self._get_pyramid_path(pano_id, zoom)
+        if pyramid_path.exists():
+            return pyramid_path
         return None
     
+    def read_image(self, pano_id: str, zoom: int):
+        """
+        Decode a stored panorama from disk (bypassing the memory LRU).
+        
+        Reads the JPEG, or stitches a lossless tile set.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+        
+        Returns:
+            BGR numpy array or None if not stored / decode failed
+        """
+        if cv2 is None:
+            raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+        
+        image_path = self._get_image_path(pano_id, zoom)
+        if image_path.exists():
+            return cv2.imread(str(image_path))
+        
+        pyramid = self.get_pyramid(pano_id, zoom)
+        if pyramid is None:
+            return None
+        return pyramid.stitch_level(pyramid.num_levels - 1)
+    
+    def get_decoded(self, pano_id: str, zoom: int):
+        """
+        Get a decoded panorama array, using the shared in-memory LRU.
+        
+        The returned array is read-only and in OpenCV BGR channel order
+        (a np.memmap when served from the raw tier).
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+        
+        Returns:
+            numpy array (H, W, 3) or None if not cached / decode failed
+        """
+        if cv2 is None:
+            raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+        
+        def load():
+            # Memory-mapped tier: no decode, pages shared between processes
+            array = self.raw.get(pano_id, zoom)
+            if array is not None:
+                return array
+            
+            array = self.read_image(pano_id, zoom)
+            if array is not None:
+                self.raw.put_async(pano_id, zoom, array)
+            return array
+        
+        return self.memory.get((pano_id, zoom), load)
+    
+    def derive_lower_zoom(self, pano_id: str, zoom: int) -> Optional[Path]:
+        """
+        Create a panorama by downsampling a cached higher zoom of it.
+        
+        Uses the smallest cached zoom above the requested one. Zoom 0 (a
+        padded single tile) is never derived.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level to create
+        
+        Returns:
+            Path to the saved image, or None if no higher zoom is cached
+        """
+        if zoom < 1 or cv2 is None:
+            return None
+        
+        width = TILE_SIZE * 2 ** zoom
+        for higher in self.get_all_for_pano(pano_id):
+            if higher <= zoom:
+                continue
+            image = self.read_image(pano_id, higher)
+            if image is None or image.shape[1] != TILE_SIZE * 2 ** higher:
+                continue
+            small = cv2.resize(image, (width, width // 2), interpolation=cv2.INTER_AREA)
+            ok, buf = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            if not ok:
+                return None
+            return self.save(pano_id, zoom, buf.tobytes())
+        
+        return None
+    
+    def build_pyramid(self, pano_id: str, zoom: int) -> Optional[Path]:
+        """
+        Build the tile pyramid for a cached panorama from its JPEG.
+        
+        A lossless tile set (no JPEG) is already tiled and is left as is.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+        
+        Returns:
+            Path to the .pyr file, or None if the image is missing/unsuitable
+        """
+        if cv2 is None:
+            raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+        
+        image_path = self.get(pano_id, zoom)
+        if image_path is None:
+            return None
+        if image_path.suffix == '.pyr':
+            return image_path
+        image = cv2.imread(str(image_path))
+        if image is None:
+            return None
+        
+        try:
+            path = write_pyramid(image, self._get_pyramid_path(pano_id, zoom))
+        except ValueError as e:
+            print(f"[PanoramaCache] Skipping pyramid for {pano_id}_z{zoom}: {e}")
+            return None
+        
+        self._invalidate(pano_id, zoom)
+        return path
+    
+    def get_pyramid(self, pano_id: str, zoom: int) -> Optional[PanoramaPyramid]:
+        """
+        Get an open tile pyramid reader for a panorama.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level of the source image
+        
+        Returns:
+            PanoramaPyramid or None if no pyramid exists
+        """
+        key = (pano_id, zoom)
+        with self._pyramid_lock:
+            pyramid = self._pyramids.get(key)
+            if pyramid is not None:
+                self._pyramids.move_to_end(key)
+                return pyramid
+        
+        path = self._get_pyramid_path(pano_id, zoom)
+        if not path.exists():
+            return None
+        try:
+            pyramid = PanoramaPyramid(path)
+        except (OSError, ValueError) as e:
+            print(f"[PanoramaCache] Unreadable pyramid {path.name}: {e}")
+            return None
+        
+        with self._pyramid_lock:
+            self._pyramids[key] = pyramid
+            while len(self._pyramids) > 256:
+                self._pyramids.popitem(last=False)
+        return pyramid
+    
+    def get_pyramid_tile(self, pano_id: str, zoom: int, level: int, tx: int, ty: int):
+        """
+        Get a decoded pyramid tile, using the shared in-memory LRU.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level of the source image
+            level: Pyramid level
+            tx: Tile column
+            ty: Tile row
+        
+        Returns:
+            Read-only BGR tile array or None
+        """
+        pyramid = self.get_pyramid(pano_id, zoom)
+        if pyramid is None:
+            return None
+        return self.memory.get(
+            (pano_id, zoom, level, tx, ty),
+            lambda: pyramid.decode_tile(level, tx, ty)
+        )
+    
     def save(self, pano_id: str, zoom: int, image_data: bytes) -> Path:
         """
         Save a panorama image to cache.
@@ -91,19 +475,55 @@ class PanoramaCache:
         """
         image_path = self._get_image_path(pano_id, zoom)
         
-        # Write image file
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
-        
-        # Insert or update database record
-        with cache_manager.get_connection() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO panoramas (pano_id, zoom, image_path)
-                VALUES (?, ?, ?)
-            ''', (pano_id, zoom, str(image_path)))
+        # Write image file (temp file + rename: readers never see a partial JPEG)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.panoramas_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image_data)
+            os.replace(tmp_path, image_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._after_write(pano_id, zoom)
         
+        self._record(pano_id, zoom, image_path)
         return image_path
     
+    def save_tiles(
+        self,
+        pano_id: str,
+        zoom: int,
+        tiles: Dict[Tuple[int, int], bytes],
+        cols: int,
+        rows: int
+    ) -> Path:
+        """
+        Save a downloaded tile set losslessly instead of a stitched JPEG.
+        
+        The tiles are stored verbatim in {pano_id}_z{zoom}.pyr and stitched
+        lazily at render time. Any older JPEG of the panorama is removed.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            tiles: Dict mapping (x, y) to tile bytes
+            cols: Grid columns
+            rows: Grid rows
+        
+        Returns:
+            Path to the saved .pyr file
+        """
+        pyramid_path = write_tile_set(tiles, cols, rows, self._get_pyramid_path(pano_id, zoom))
+        image_path = self._get_image_path(pano_id, zoom)
+        if image_path.exists():
+            image_path.unlink()
+        self.raw.invalidate(pano_id, zoom)
+        self._invalidate(pano_id, zoom)
+        
+        self._record(pano_id, zoom, pyramid_path)
+        return pyramid_path
+    
     def save_from_file(self, pano_id: str, zoom: int, source_path: Path) -> Path:
         """
         Save a panorama image from an existing file.
@@ -120,14 +540,9 @@ class PanoramaCache:
         
         # Copy file
         shutil.copy2(source_path, image_path)
+        self._after_write(pano_id, zoom)
         
-        # Insert or update database record
-        with cache_manager.get_connection() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO panoramas (pano_id, zoom, image_path)
-                VALUES (?, ?, ?)
-            ''', (pano_id, zoom, str(image_path)))
-        
+        self._record(pano_id, zoom, image_path)
         return image_path
     
     def delete(self, pano_id: str, zoom: int) -> bool:
@@ -146,6 +561,13 @@ class PanoramaCache:
         # Delete file if exists
         if image_path.exists():
             image_path.unlink()
+        pyramid_path = self._get_pyramid_path(pano_id, zoom)
+        if pyramid_path.exists():
+            pyramid_path.unlink()
+        self.raw.invalidate(pano_id, zoom)
+        self._invalidate(pano_id, zoom)
+        # A forced re-download must not re-stitch the same tiles
+        self.tiles.delete(pano_id, zoom)
         
         # Delete database record
         with cache_manager.get_connection() as conn:
@@ -182,7 +604,10 @@ class PanoramaCache:
             row = cursor.fetchone()
             return {
                 'total_images': row['total'],
-                'unique_panoramas': row['unique_panos']
+                'unique_panoramas': row['unique_panos'],
+                'memory': self.memory.get_stats(),
+                'raw': self.raw.get_stats(),
+                'tiles': self.tiles.get_stats()
             }
 
 
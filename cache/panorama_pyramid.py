@@ -0,0 +1,328 @@
+"""
+PanoramaPyramid - Tiled, mip-mapped single-file panorama storage.
+
+File layout ({pano_id}_z{zoom}.pyr):
+    MAGIC | uint32 header length | JSON header | concatenated JPEG tiles
+
+Level 0 is the smallest (512 px wide); each following level doubles the
+resolution up to the source panorama. Tiles are TILE_SIZE squares (level 0
+is a single 512x256 tile), so a renderer can decode just the tiles a view
+touches at the level matching its output resolution.
+
+A downloaded tile set can also be stored verbatim as a single-level file
+(write_tile_set): no re-encode, stitched lazily when rendered.
+"""
+import os
+import json
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+PYRAMID_MAGIC = b'PPYR1\n'
+TILE_SIZE = 512
+
+# Shared pool for parallel tile decoding (OpenCV releases the GIL)
+_decode_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_decode_pool() -> ThreadPoolExecutor:
+    global _decode_pool
+    if _decode_pool is None:
+        _decode_pool = ThreadPoolExecutor(
+            max_workers=min(8, os.cpu_count() or 4),
+            thread_name_prefix='tile-decode'
+        )
+    return _decode_pool
+
+
+def decode_tile_into(data: bytes, output: np.ndarray, x: int, y: int, tile_size: int = TILE_SIZE) -> bool:
+    """
+    Decode a JPEG tile straight into its slot of a panorama buffer.
+    
+    Args:
+        data: Encoded tile bytes
+        output: BGR buffer of shape (rows * tile_size, cols * tile_size, 3)
+        x: Tile column
+        y: Tile row
+        tile_size: Tile edge length in pixels
+    
+    Returns:
+        True if the tile was decoded
+    """
+    tile = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if tile is None:
+        return False
+    h = min(tile.shape[0], tile_size)
+    w = min(tile.shape[1], tile_size)
+    output[y * tile_size:y * tile_size + h, x * tile_size:x * tile_size + w] = tile[:h, :w]
+    return True
+
+
+def stitch_tiles(
+    tiles: Dict[Tuple[int, int], bytes],
+    cols: int,
+    rows: int,
+    tile_size: int = TILE_SIZE
+) -> Optional[np.ndarray]:
+    """
+    Decode a tile grid into one BGR panorama, tiles decoded in parallel.
+    
+    Args:
+        tiles: Dict mapping (x, y) to encoded tile bytes
+        cols: Grid columns
+        rows: Grid rows
+        tile_size: Tile edge length in pixels
+    
+    Returns:
+        BGR array (rows * tile_size, cols * tile_size, 3), or None if a tile
+        is missing or undecodable
+    """
+    if cv2 is None:
+        raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+    
+    coords = [(x, y) for y in range(rows) for x in range(cols)]
+    missing = [c for c in coords if c not in tiles]
+    if missing:
+        print(f"Missing tile at {missing[0]}")
+        return None
+    
+    output = np.zeros((rows * tile_size, cols * tile_size, 3), dtype=np.uint8)
+    results = _get_decode_pool().map(
+        lambda c: decode_tile_into(tiles[c], output, c[0], c[1], tile_size),
+        coords
+    )
+    if not all(results):
+        return None
+    return output
+
+
+def _write_file(path: Path, tile_size: int, levels: List[Dict], chunks: List[bytes]) -> Path:
+    """Write header and tile data to a temp file and rename it into place."""
+    header = json.dumps({'tile_size': tile_size, 'levels': levels}).encode('utf-8')
+    
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PYRAMID_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for data in chunks:
+                f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    
+    return path
+
+
+def write_pyramid(
+    image: np.ndarray,
+    path: Path,
+    tile_size: int = TILE_SIZE,
+    quality: int = 90
+) -> Path:
+    """
+    Write an equirectangular image as a tile pyramid.
+    
+    The file is written to a temp file and renamed into place, so readers
+    never see a partial pyramid.
+    
+    Args:
+        image: Equirectangular BGR image (2:1, width a multiple of tile_size)
+        path: Output .pyr path
+        tile_size: Tile edge length in pixels
+        quality: JPEG quality for tiles
+    
+    Returns:
+        Path to the written pyramid
+    """
+    if cv2 is None:
+        raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+    
+    height, width = image.shape[:2]
+    if width % tile_size != 0 or width != 2 * height:
+        raise ValueError(f"Pyramid needs a 2:1 image with width divisible by {tile_size}, got {width}x{height}")
+    
+    # Build levels from full resolution down to one tile wide
+    images = [image]
+    while images[-1].shape[1] > tile_size:
+        prev = images[-1]
+        images.append(cv2.resize(
+            prev, (prev.shape[1] // 2, prev.shape[0] // 2),
+            interpolation=cv2.INTER_AREA
+        ))
+    images.reverse()
+    
+    levels = []
+    chunks: List[bytes] = []
+    offset = 0
+    for level_img in images:
+        h, w = level_img.shape[:2]
+        cols = (w + tile_size - 1) // tile_size
+        rows = (h + tile_size - 1) // tile_size
+        tiles = []
+        for ty in range(rows):
+            for tx in range(cols):
+                tile = level_img[ty * tile_size:(ty + 1) * tile_size, tx * tile_size:(tx + 1) * tile_size]
+                ok, buf = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                if not ok:
+                    raise ValueError("Failed to encode pyramid tile")
+                data = buf.tobytes()
+                tiles.append([offset, len(data)])
+                chunks.append(data)
+                offset += len(data)
+        levels.append({'width': w, 'height': h, 'cols': cols, 'rows': rows, 'tiles': tiles})
+    
+    return _write_file(path, tile_size, levels, chunks)
+
+
+def write_tile_set(
+    tiles: Dict[Tuple[int, int], bytes],
+    cols: int,
+    rows: int,
+    path: Path,
+    tile_size: int = TILE_SIZE
+) -> Path:
+    """
+    Store a downloaded tile grid verbatim as a single-level pyramid.
+    
+    The original JPEG tiles are kept byte for byte (no generation loss);
+    the panorama is stitched only when rendered.
+    
+    Args:
+        tiles: Dict mapping (x, y) to encoded tile bytes
+        cols: Grid columns
+        rows: Grid rows
+        path: Output .pyr path
+        tile_size: Tile edge length in pixels
+    
+    Returns:
+        Path to the written file
+    """
+    entries = []
+    chunks: List[bytes] = []
+    offset = 0
+    for y in range(rows):
+        for x in range(cols):
+            data = tiles.get((x, y))
+            if data is None:
+                raise ValueError(f"Missing tile at ({x}, {y})")
+            entries.append([offset, len(data)])
+            chunks.append(data)
+            offset += len(data)
+    
+    level = {
+        'width': cols * tile_size,
+        'height': rows * tile_size,
+        'cols': cols,
+        'rows': rows,
+        'tiles': entries
+    }
+    return _write_file(path, tile_size, [level], chunks)
+
+
+class PanoramaPyramid:
+    """
+    Reader for a .pyr tile pyramid.
+    
+    Only the header is parsed on open; tiles are read and decoded on demand.
+    """
+    
+    def __init__(self, path: Path):
+        """
+        Open a pyramid file.
+        
+        Args:
+            path: Path to the .pyr file
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(PYRAMID_MAGIC)) != PYRAMID_MAGIC:
+                raise ValueError(f"Not a panorama pyramid: {self.path}")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        
+        self.data_offset = len(PYRAMID_MAGIC) + 4 + header_len
+        self.tile_size: int = header['tile_size']
+        self.levels: List[Dict] = header['levels']
+    
+    @property
+    def num_levels(self) -> int:
+        return len(self.levels)
+    
+    def level_shape(self, level: int) -> Tuple[int, int]:
+        """Get (height, width) of a level."""
+        info = self.levels[level]
+        return (info['height'], info['width'])
+    
+    def choose_level(self, min_width: float) -> int:
+        """
+        Pick the smallest level at least min_width pixels wide.
+        
+        Args:
+            min_width: Required panorama width in pixels
+        
+        Returns:
+            Level index (the top level if none is wide enough)
+        """
+        for level, info in enumerate(self.levels):
+            if info['width'] >= min_width:
+                return level
+        return len(self.levels) - 1
+    
+    def read_tile_bytes(self, level: int, tx: int, ty: int) -> bytes:
+        """Read the encoded JPEG bytes of one tile."""
+        info = self.levels[level]
+        offset, length = info['tiles'][ty * info['cols'] + tx]
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset + offset)
+            return f.read(length)
+    
+    def decode_tile(self, level: int, tx: int, ty: int) -> Optional[np.ndarray]:
+        """
+        Read and decode one tile.
+        
+        Args:
+            level: Pyramid level
+            tx: Tile column
+            ty: Tile row
+        
+        Returns:
+            BGR tile array or None if decoding failed
+        """
+        data = self.read_tile_bytes(level, tx, ty)
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    
+    def stitch_level(self, level: int) -> Optional[np.ndarray]:
+        """
+        Decode every tile of a level into one image.
+        
+        Args:
+            level: Pyramid level
+        
+        Returns:
+            BGR array of the level or None if a tile failed to decode
+        """
+        info = self.levels[level]
+        tiles = {
+            (tx, ty): self.read_tile_bytes(level, tx, ty)
+            for ty in range(info['rows'])
+            for tx in range(info['cols'])
+        }
+        image = stitch_tiles(tiles, info['cols'], info['rows'], self.tile_size)
+        if image is None:
+            return None
+        return image[:info['height'], :info['width']]
@@ -0,0 +1,252 @@
+"""
+RawPanoramaStore - Memory-mapped on-disk tier of decoded panoramas.
+
+Stores decoded panoramas as uncompressed .npy files that are opened with
+np.memmap, so a render samples pixels straight from the page cache with no
+JPEG decode. Processes on the same machine share the same physical pages.
+The directory is kept under a byte budget by evicting least recently used
+files (by mtime, refreshed on access). Files are written by a background
+thread (put_async), so a cold render does not wait for a write of the
+uncompressed array.
+"""
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Refresh a file's mtime at most this often when it is read (seconds)
+_TOUCH_INTERVAL = 60
+
+# Arrays waiting for the background writer; older ones are dropped beyond this
+_MAX_PENDING_WRITES = 4
+
+
+class RawPanoramaStore:
+    """
+    Size-bounded directory of {pano_id}_z{zoom}.npy decoded panoramas.
+    """
+    
+    def __init__(self, raw_dir: Path, max_bytes: int):
+        """
+        Initialize the store.
+        
+        Args:
+            raw_dir: Directory for .npy files
+            max_bytes: Disk budget (0 disables the tier)
+        """
+        self.raw_dir = Path(raw_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None  # Lazily computed by a directory scan
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        self._pending: OrderedDict = OrderedDict()
+        self._writing: Optional[Tuple[str, int]] = None
+        self._writing_stale = False
+        self._write_cond = threading.Condition(self._lock)
+        self._writer: Optional[threading.Thread] = None
+        self.dropped_writes = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def _get_path(self, pano_id: str, zoom: int) -> Path:
+        """Get the file path for a raw panorama."""
+        return self.raw_dir / f"{pano_id}_z{zoom}.npy"
+    
+    def has(self, pano_id: str, zoom: int) -> bool:
+        """Check if a raw panorama exists."""
+        return self._get_path(pano_id, zoom).exists()
+    
+    def get(self, pano_id: str, zoom: int) -> Optional[np.ndarray]:
+        """
+        Open a raw panorama as a read-only memory map.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+        
+        Returns:
+            np.memmap (H, W, 3) in BGR order, or None if not stored
+        """
+        if not self.enabled:
+            return None
+        
+        path = self._get_path(pano_id, zoom)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        try:
+            mtime = path.stat().st_mtime
+            now = time.time()
+            if now - mtime > _TOUCH_INTERVAL:
+                os.utime(path, (now, now))
+        except OSError:
+            pass
+        return array
+    
+    def put(self, pano_id: str, zoom: int, array: np.ndarray) -> Optional[Path]:
+        """
+        Store a decoded panorama, evicting old files if over budget.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            array: Decoded BGR panorama
+        
+        Returns:
+            Path to the .npy file, or None if the tier is disabled/too small
+        """
+        if not self.enabled or array.nbytes > self.max_bytes:
+            return None
+        
+        self.raw_dir.mkdir(parents=True, exist_ok=True)
+        path = self._get_path(pano_id, zoom)
+        
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.raw_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[RawPanoramaStore] Failed to write {path.name}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return None
+        
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += path.stat().st_size - old_size
+            over = self._total_bytes is None or self._total_bytes > self.max_bytes
+        if over:
+            self.evict()
+        
+        return path
+    
+    def put_async(self, pano_id: str, zoom: int, array: np.ndarray):
+        """
+        Queue a decoded panorama for the background writer.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            array: Decoded BGR panorama (not modified afterwards)
+        """
+        if not self.enabled or array.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            key = (pano_id, zoom)
+            self._pending[key] = array
+            self._pending.move_to_end(key)
+            while len(self._pending) > _MAX_PENDING_WRITES:
+                self._pending.popitem(last=False)
+                self.dropped_writes += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name="raw-panorama-writer", daemon=True)
+                self._writer.start()
+            self._write_cond.notify()
+    
+    def _run_writer(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._write_cond.wait()
+                key, array = self._pending.popitem(last=False)
+                self._writing, self._writing_stale = key, False
+            self.put(*key, array)
+            with self._lock:
+                stale = self._writing_stale
+                self._writing = None
+            if stale:
+                # Invalidated while it was being written
+                self.invalidate(*key)
+    
+    def invalidate(self, pano_id: str, zoom: int):
+        """Delete a stored panorama (e.g. after its JPEG changed)."""
+        with self._lock:
+            self._pending.pop((pano_id, zoom), None)
+            if self._writing == (pano_id, zoom):
+                self._writing_stale = True
+        path = self._get_path(pano_id, zoom)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+    
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Delete least recently used files until the directory fits the budget.
+        
+        Args:
+            max_bytes: Budget override (defaults to the configured budget)
+        
+        Returns:
+            Number of files deleted
+        """
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        if not self.raw_dir.exists():
+            return 0
+        
+        entries = []
+        total = 0
+        with os.scandir(self.raw_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.npy'):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        
+        deleted = 0
+        if total > budget:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= budget:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    # Still mapped elsewhere (Windows) - try again next sweep
+                    continue
+                total -= size
+                deleted += 1
+        
+        with self._lock:
+            self._total_bytes = total
+            self.evictions += deleted
+        return deleted
+    
+    def get_stats(self) -> dict:
+        """Get store statistics."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'pending_writes': len(self._pending),
+                'dropped_writes': self.dropped_writes
+            }
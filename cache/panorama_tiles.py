@@ -0,0 +1,309 @@
+"""
+TileStore - Persistent per-tile cache of downloaded panorama tiles.
+
+Tiles are stored as the JPEG bytes the Tiles API returned, one file per
+(pano_id, zoom, x, y) under data/tiles/{pano_id}/{zoom}_{x}_{y}.jpg, written
+atomically as they arrive. An interrupted download therefore resumes from
+the tiles already on disk, and a missing tile at zoom z can be derived
+locally from the four tiles covering it at zoom z+1 instead of fetched.
+The directory is kept under a byte budget by evicting the panoramas whose
+tiles were written least recently.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+TILE_SIZE = 512
+
+
+class TileStore:
+    """
+    Directory of downloaded tiles keyed by (pano_id, zoom, x, y).
+    
+    For zoom >= 1 the grid at zoom z+1 is exactly twice the grid at zoom z
+    in both directions, so tile (x, y) at zoom z is the 2x downsample of
+    tiles (2x..2x+1, 2y..2y+1) at zoom z+1. Zoom 0 (a padded single tile)
+    is never derived.
+    """
+    
+    def __init__(self, tiles_dir: Path, enabled: bool = True, max_bytes: int = 0):
+        """
+        Initialize the store.
+        
+        Args:
+            tiles_dir: Root directory for tiles
+            enabled: If False, get/put are no-ops
+            max_bytes: Disk budget (0 = unbounded)
+        """
+        self.tiles_dir = Path(tiles_dir)
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._total_bytes: Optional[int] = None  # Lazily computed by a directory scan
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.derived = 0
+        self.evictions = 0
+    
+    def _get_path(self, pano_id: str, zoom: int, x: int, y: int) -> Path:
+        """Get the file path for a tile."""
+        return self.tiles_dir / pano_id / f"{zoom}_{x}_{y}.jpg"
+    
+    def has(self, pano_id: str, zoom: int, x: int, y: int) -> bool:
+        """Check if a tile is stored."""
+        return self.enabled and self._get_path(pano_id, zoom, x, y).exists()
+    
+    def get(self, pano_id: str, zoom: int, x: int, y: int) -> Optional[bytes]:
+        """
+        Read a stored tile.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            x: Tile X coordinate
+            y: Tile Y coordinate
+        
+        Returns:
+            Tile JPEG bytes or None if not stored
+        """
+        if not self.enabled:
+            return None
+        try:
+            with open(self._get_path(pano_id, zoom, x, y), 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+    
+    def put(self, pano_id: str, zoom: int, x: int, y: int, data: bytes) -> Optional[Path]:
+        """
+        Store a tile (temp file + rename).
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            x: Tile X coordinate
+            y: Tile Y coordinate
+            data: Tile JPEG bytes
+        
+        Returns:
+            Path to the tile file, or None if the store is disabled/failed
+        """
+        if not self.enabled:
+            return None
+        
+        path = self._get_path(pano_id, zoom, x, y)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[TileStore] Failed to write {pano_id}/{path.name}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return None
+        
+        with self._lock:
+            self.writes += 1
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - old_size
+            over = self.max_bytes > 0 and (self._total_bytes is None or self._total_bytes > self.max_bytes)
+        if over:
+            self.evict(keep=pano_id)
+        return path
+    
+    def delete(self, pano_id: str, zoom: Optional[int] = None) -> int:
+        """
+        Delete the stored tiles of a panorama.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Only this zoom level (default: all)
+        
+        Returns:
+            Number of tiles deleted
+        """
+        pano_dir = self.tiles_dir / pano_id
+        prefix = None if zoom is None else f"{zoom}_"
+        deleted = 0
+        freed = 0
+        try:
+            it = os.scandir(pano_dir)
+        except OSError:
+            return 0
+        with it:
+            for entry in it:
+                if prefix is not None and not entry.name.startswith(prefix):
+                    continue
+                try:
+                    size = entry.stat().st_size
+                    os.unlink(entry.path)
+                except OSError:
+                    continue
+                deleted += 1
+                freed += size
+        try:
+            pano_dir.rmdir()
+        except OSError:
+            pass  # Other zooms left
+        
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= freed
+        return deleted
+    
+    def evict(self, max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+        """
+        Delete the least recently written panoramas until the store fits the budget.
+        
+        Args:
+            max_bytes: Budget override (defaults to the configured budget)
+            keep: Panorama never evicted (e.g. the one being downloaded)
+        
+        Returns:
+            Number of panoramas deleted
+        """
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        if not self._evict_lock.acquire(blocking=False):
+            return 0  # Another thread is evicting
+        try:
+            entries = []
+            total = 0
+            try:
+                root = os.scandir(self.tiles_dir)
+            except FileNotFoundError:
+                return 0
+            with root:
+                for entry in root:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                    size = 0
+                    try:
+                        mtime = entry.stat().st_mtime
+                        with os.scandir(entry.path) as it:
+                            for f in it:
+                                size += f.stat().st_size
+                    except OSError:
+                        continue
+                    entries.append((mtime, size, entry.name))
+                    total += size
+            
+            deleted = 0
+            if budget and total > budget:
+                entries.sort()
+                for _, size, name in entries:
+                    if total <= budget:
+                        break
+                    if name == keep:
+                        continue
+                    shutil.rmtree(self.tiles_dir / name, ignore_errors=True)
+                    total -= size
+                    deleted += 1
+            
+            with self._lock:
+                self._total_bytes = total
+                self.evictions += deleted
+            return deleted
+        finally:
+            self._evict_lock.release()
+    
+    def zooms(self, pano_id: str) -> List[int]:
+        """Get the zoom levels with at least one stored tile for a panorama."""
+        pano_dir = self.tiles_dir / pano_id
+        if not self.enabled or not pano_dir.exists():
+            return []
+        zooms = set()
+        with os.scandir(pano_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.jpg'):
+                    zooms.add(int(entry.name.split('_', 1)[0]))
+        return sorted(zooms)
+    
+    def get_or_derive(self, pano_id: str, zoom: int, x: int, y: int) -> Optional[bytes]:
+        """
+        Get a stored tile, or derive it from a higher stored zoom.
+        
+        Derived tiles (and the intermediate ones) are stored too.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            x: Tile X coordinate
+            y: Tile Y coordinate
+        
+        Returns:
+            Tile JPEG bytes or None if neither stored nor derivable
+        """
+        data = self.get(pano_id, zoom, x, y)
+        if data is not None or zoom < 1 or cv2 is None:
+            return data
+        
+        higher = [z for z in self.zooms(pano_id) if z > zoom]
+        if not higher:
+            return None
+        return self._derive(pano_id, zoom, x, y, max(higher))
+    
+    def _derive(self, pano_id: str, zoom: int, x: int, y: int, max_zoom: int) -> Optional[bytes]:
+        """Build a tile by downsampling its four children at zoom + 1."""
+        if zoom >= max_zoom:
+            return None
+        
+        block = np.zeros((2 * TILE_SIZE, 2 * TILE_SIZE, 3), dtype=np.uint8)
+        for dy in (0, 1):
+            for dx in (0, 1):
+                cx, cy = 2 * x + dx, 2 * y + dy
+                data = self.get(pano_id, zoom + 1, cx, cy)
+                if data is None:
+                    data = self._derive(pano_id, zoom + 1, cx, cy, max_zoom)
+                if data is None:
+                    return None
+                child = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                if child is None:
+                    return None
+                h = min(child.shape[0], TILE_SIZE)
+                w = min(child.shape[1], TILE_SIZE)
+                block[dy * TILE_SIZE:dy * TILE_SIZE + h, dx * TILE_SIZE:dx * TILE_SIZE + w] = child[:h, :w]
+        
+        tile = cv2.resize(block, (TILE_SIZE, TILE_SIZE), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ok:
+            return None
+        data = buf.tobytes()
+        self.put(pano_id, zoom, x, y, data)
+        with self._lock:
+            self.derived += 1
+        return data
+    
+    def get_stats(self) -> dict:
+        """Get store statistics."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'derived': self.derived,
+                'evictions': self.evictions
+            }
@@ -3,7 +3,7 @@ VLN Benchmark Platform - Global Configuration Settings
 """
 import os
 from pathlib import Path
-from typing import Tuple, List
+from typing import Tuple, List, Dict
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,6 +13,8 @@ load_dotenv()
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 PANORAMAS_DIR = DATA_DIR / "panoramas"
+PANORAMAS_RAW_DIR = DATA_DIR / "panoramas_raw"
+TILES_DIR = DATA_DIR / "tiles"
 CACHE_DB_PATH = DATA_DIR / "cache.db"
 TASKS_DIR = BASE_DIR / "tasks_1000"
 LOGS_DIR = BASE_DIR / "logs"
@@ -28,11 +30,20 @@ class Settings:
     GOOGLE_API_KEYS: List[str] = [
         k.strip() for k in os.getenv("GOOGLE_API_KEYS", "").split(",") if k.strip()
     ]
+    # Key pool: a 429 cools a key down (doubling per repeat), a 403 parks it
+    API_KEY_COOLDOWN: float = float(os.getenv("API_KEY_COOLDOWN", "5"))  # First cooldown after a 429 (seconds)
+    API_KEY_MAX_COOLDOWN: float = 300  # Cooldown cap for repeated 429s (seconds)
+    API_KEY_FORBIDDEN_COOLDOWN: float = float(os.getenv("API_KEY_FORBIDDEN_COOLDOWN", "900"))  # After a 403 (seconds)
+    API_KEY_MAX_WAIT: float = 30  # Longest wait for a cooling key before giving up (seconds)
+    PLACES_RATE_LIMIT: float = float(os.getenv("PLACES_RATE_LIMIT", "10"))  # Places requests per second per key
+    ROUTES_RATE_LIMIT: float = float(os.getenv("ROUTES_RATE_LIMIT", "10"))  # Routes requests per second per key
     
     # === Server ===
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     DEBUG: bool = os.getenv("DEBUG", "true").lower() == "true"
+    # Worker processes (reload is off with more than one; needs a shared SESSION_STORE)
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
     
     # === Panorama Quality ===
     # Zoom level: 0-5, higher = better resolution
@@ -45,12 +56,36 @@ class Settings:
     # | 4    | 8192×4096    | High precision       |
     # | 5    | 16384×8192   | Maximum quality      |
     PANORAMA_ZOOM_LEVEL: int = 2  # Default 2 for development, set to 3 for benchmark
+    PANORAMA_MEMORY_CACHE_MB: int = int(os.getenv("PANORAMA_MEMORY_CACHE_MB", "2048"))  # Decoded panorama LRU budget
+    # Keep a tiled mip-mapped .pyr next to each panorama and render from the
+    # tiles/level a view needs (build existing ones with scripts/build_pyramids.py)
+    PANORAMA_PYRAMID: bool = os.getenv("PANORAMA_PYRAMID", "false").lower() == "true"
+    # Lossless mode: store downloaded tiles verbatim as a .pyr instead of a
+    # re-encoded JPEG, stitched at render time (the web UI's full-panorama
+    # view gets a JPEG encoded per request from /api/panoramas)
+    PANORAMA_STORE_TILES: bool = os.getenv("PANORAMA_STORE_TILES", "false").lower() == "true"
+    # Memory-mapped decoded .npy tier in data/panoramas_raw (0 = disabled)
+    # Fill ahead of time with scripts/build_raw_panoramas.py
+    PANORAMA_RAW_CACHE_GB: float = float(os.getenv("PANORAMA_RAW_CACHE_GB", "0"))
+    # Keep every downloaded tile in data/tiles (resumable downloads, lower
+    # zooms derived locally from higher ones)
+    TILE_CACHE_ENABLED: bool = os.getenv("TILE_CACHE_ENABLED", "true").lower() == "true"
+    # Disk budget for data/tiles; least recently written panoramas go first (0 = unbounded)
+    TILE_CACHE_MAX_GB: float = float(os.getenv("TILE_CACHE_MAX_GB", "5"))
     
     # === Temporary Image Management ===
     # Policies: keep_all / keep_on_complete / delete_on_send / 
     #           delete_on_session_end / auto_expire
-    TEMP_IMAGE_CLEANUP_POLICY: str = "delete_on_session_end"
-    TEMP_IMAGE_EXPIRE_HOURS: int = 24  # For auto_expire policy
+    TEMP_IMAGE_CLEANUP_POLICY: str = os.getenv("TEMP_IMAGE_CLEANUP_POLICY", "delete_on_session_end")
+    TEMP_IMAGE_EXPIRE_HOURS: float = float(os.getenv("TEMP_IMAGE_EXPIRE_HOURS", "24"))  # auto_expire; also unknown sessions
+    # Janitor: one pass over temp_images/ every TEMP_IMAGE_SWEEP_INTERVAL
+    # seconds; beyond TEMP_IMAGE_QUOTA_GB the oldest images go first (0 = no quota)
+    TEMP_IMAGE_SWEEP_INTERVAL: float = float(os.getenv("TEMP_IMAGE_SWEEP_INTERVAL", "300"))
+    TEMP_IMAGE_QUOTA_GB: float = float(os.getenv("TEMP_IMAGE_QUOTA_GB", "0"))
+    # Sweep at server start instead of after the first interval
+    TEMP_IMAGE_SWEEP_ON_START: bool = os.getenv("TEMP_IMAGE_SWEEP_ON_START", "false").lower() == "true"
+    # How in-process sessions persist step images: "async" (replay) / "none"
+    REPLAY_IMAGE_WRITE: str = os.getenv("REPLAY_IMAGE_WRITE", "async")
     
     # === Server-side Rendering ===
     # Output size with 16:10 aspect ratio (1280/800 = 1.6)
@@ -58,6 +93,12 @@ class Settings:
     RENDER_OUTPUT_SIZE: Tuple[int, int] = (1280, 800)  # Agent observation size
     RENDER_DEFAULT_FOV: int = 90  # Default horizontal field of view (degrees)
     RENDER_DEFAULT_PITCH: int = 0  # Default pitch angle
+    RENDER_MAP_CACHE_SIZE: int = 32  # Cached remap tables (~8MB each at 1280x800)
+    RENDER_ANGLE_QUANTUM: float = 0.1  # Heading/pitch quantization for remap cache (degrees)
+    # "inline" renders in the calling thread; "process" sends projection+encode
+    # to worker processes (scales with cores instead of the GIL)
+    RENDER_BACKEND: str = os.getenv("RENDER_BACKEND", "inline")
+    RENDER_PROCESS_WORKERS: int = int(os.getenv("RENDER_PROCESS_WORKERS", "0"))  # 0 = CPU count
     
     # === Pre-download Settings ===
     PREFETCH_REQUEST_DELAY_MIN: float = 1.0  # Minimum delay between requests (seconds)
@@ -65,6 +106,58 @@ class Settings:
     PREFETCH_RETRY_MAX: int = 3  # Maximum retry attempts
     PREFETCH_RETRY_BACKOFF: float = 2.0  # Exponential backoff multiplier
     PREFETCH_PARALLEL_WORKERS: int = 4  # Number of parallel download workers
+    PRELOAD_CONCURRENCY_PER_KEY: int = 12  # Panoramas preloaded at once per configured API key (shared by all preload jobs)
+    PRELOAD_FLUSH_SIZE: int = 50  # Panorama results per preload job progress commit
+    PRELOAD_RESUME_ON_STARTUP: bool = os.getenv("PRELOAD_RESUME_ON_STARTUP", "true").lower() == "true"
+    # Running preload jobs touch updated_at this often; a job not touched for three
+    # heartbeats is no longer run by any worker and may be resumed elsewhere
+    PRELOAD_HEARTBEAT_SECONDS: float = float(os.getenv("PRELOAD_HEARTBEAT_SECONDS", "30"))
+    # Whitelist files searched (in order) for preload names not in the geofence config
+    PRELOAD_WHITELIST_PATHS: List[Path] = [
+        CONFIG_DIR / "geofence_config.json",
+        CONFIG_DIR / "height_whitelist.json",
+        CONFIG_DIR / "perception_whitelist.json",
+    ]
+    # Live sessions: after each step, download/decode the panoramas within
+    # SESSION_PREFETCH_DEPTH moves in the background (nearest ring first)
+    SESSION_PREFETCH_ENABLED: bool = os.getenv("SESSION_PREFETCH_ENABLED", "true").lower() == "true"
+    SESSION_PREFETCH_DEPTH: int = int(os.getenv("SESSION_PREFETCH_DEPTH", "2"))  # BFS rings around the agent
+    SESSION_PREFETCH_QUEUE_SIZE: int = 64  # Queued panoramas (farthest dropped first)
+    SESSION_PREFETCH_CONCURRENCY: int = 4  # Panoramas downloaded at once
+    
+    # === Action Pipeline ===
+    # Action execution, rendering and logging run in a bounded thread pool;
+    # requests that find ACTION_WORKERS busy and ACTION_QUEUE_SIZE queued wait
+    # up to ACTION_QUEUE_TIMEOUT seconds, then get 503
+    ACTION_WORKERS: int = int(os.getenv("ACTION_WORKERS", "8"))  # Actions run at once
+    ACTION_QUEUE_SIZE: int = int(os.getenv("ACTION_QUEUE_SIZE", "64"))  # Actions waiting for a worker
+    ACTION_QUEUE_TIMEOUT: float = float(os.getenv("ACTION_QUEUE_TIMEOUT", "10"))  # Seconds
+    
+    # === Session Store ===
+    # Where live sessions are kept: "memory" (this process only),
+    # "shm" (shared memory, all workers on this host) or "sqlite" (cache
+    # database, all workers sharing data/; writes are group-committed)
+    SESSION_STORE: str = os.getenv("SESSION_STORE", "memory")
+    SESSION_SHM_NAME: str = os.getenv("SESSION_SHM_NAME", "vln_sessions")  # Shared memory block name
+    SESSION_SHM_SLOTS: int = int(os.getenv("SESSION_SHM_SLOTS", "1024"))  # Live sessions it can hold
+    SESSION_SHM_SLOT_SIZE: int = 32768  # Bytes per session (compressed record)
+    SESSION_STORE_BATCH_WINDOW: float = 0.002  # SQLite writer: seconds to gather a batch
+    # Write sessions of the memory/shm stores to the sessions table in the
+    # background (coalesced per session, one commit per interval and on
+    # shutdown), so paused sessions can be resumed after a restart
+    SESSION_PERSIST: bool = os.getenv("SESSION_PERSIST", "true").lower() == "true"
+    SESSION_PERSIST_INTERVAL_MS: int = int(os.getenv("SESSION_PERSIST_INTERVAL_MS", "500"))
+    
+    # === Session Eviction ===
+    # Sessions leave memory after SESSION_IDLE_TTL seconds without a change
+    # (ended ones after SESSION_ENDED_TTL; paused ones stay resumable from
+    # the database) or, least recently used first, beyond SESSION_MAX_SESSIONS.
+    # Their temp images follow TEMP_IMAGE_CLEANUP_POLICY.
+    SESSION_IDLE_TTL: float = float(os.getenv("SESSION_IDLE_TTL", "3600"))  # Seconds
+    SESSION_ENDED_TTL: float = float(os.getenv("SESSION_ENDED_TTL", "300"))  # Seconds
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    SESSION_REAP_INTERVAL: float = 60  # Seconds between sweeps (0 = only when creating sessions)
+    TASK_CONFIG_CACHE_SIZE: int = 256  # Task configs kept in memory (LRU)
     
     # === Session Settings ===
     SESSION_DEFAULT_MAX_STEPS: int = 100  # Default max steps if not specified in task
@@ -72,10 +165,37 @@ class Settings:
     
     # === Geofence ===
     GEOFENCE_CONFIG_PATH: Path = CONFIG_DIR / "perception_whitelist.json"
+    MOVE_TABLE_CACHE_SIZE: int = 20000  # Move tables of panoramas outside warmed graphs (LRU)
+    
+    # === Metadata Fetching ===
+    # Links source: "selenium" (Maps JS API in headless Chrome) or "replay"
+    # (METADATA_LINKS_FIXTURE JSON, or the metadata cache when unset)
+    METADATA_LINKS_BACKEND: str = os.getenv("METADATA_LINKS_BACKEND", "selenium")
+    METADATA_LINKS_FIXTURE: str = os.getenv("METADATA_LINKS_FIXTURE", "")
+    METADATA_LINKS_BATCH_SIZE: int = int(os.getenv("METADATA_LINKS_BATCH_SIZE", "25"))  # Pano IDs per page call
+    METADATA_LINKS_BATCH_WINDOW: float = 0.05  # Seconds to wait for a batch to fill
+    METADATA_HOST_CONCURRENCY: int = int(os.getenv("METADATA_HOST_CONCURRENCY", "32"))  # Static API pooled connections per key
+    METADATA_RATE_LIMIT: float = float(os.getenv("METADATA_RATE_LIMIT", "50"))  # Static API requests per second per key
+    METADATA_WRITE_BATCH_SIZE: int = 100  # Records per metadata_cache group commit
+    METADATA_WRITE_BATCH_WINDOW: float = 0.2  # Seconds to wait for a group commit to fill
+    
+    # === Negative Cache ===
+    # Failed/empty lookups are remembered per reason code for this long (seconds)
+    NEGATIVE_CACHE_ENABLED: bool = os.getenv("NEGATIVE_CACHE_ENABLED", "true").lower() == "true"
+    NEGATIVE_CACHE_TTL: Dict[str, int] = {
+        "ZERO_RESULTS": 30 * 86400,  # Panorama does not exist
+        "NOT_FOUND": 30 * 86400,  # No tiles / metadata for the panorama
+        "OLD_CAPTURE": 180 * 86400,  # Rejected by the whitelist capture-date filter
+        "ERROR": 3600,  # Failed after all retries (transient)
+    }
+    NEGATIVE_CACHE_DEFAULT_TTL: int = 86400
     
     # === Tiles API ===
     TILES_API_BASE_URL: str = "https://tile.googleapis.com/v1"
     TILES_SESSION_REFRESH_BUFFER: int = 60  # Refresh session 60 seconds before expiry
+    TILES_HOST_CONCURRENCY: int = int(os.getenv("TILES_HOST_CONCURRENCY", "16"))  # Pooled connections per host per key (async)
+    TILES_RATE_LIMIT: float = float(os.getenv("TILES_RATE_LIMIT", "25"))  # Tile requests per second per key (0 = unlimited)
+    TILES_RATE_BURST: int = int(os.getenv("TILES_RATE_BURST", "50"))  # Requests allowed in a burst
     
     # === Static API ===
     STATIC_API_BASE_URL: str = "https://maps.googleapis.com/maps/api/streetview"
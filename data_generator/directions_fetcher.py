@@ -5,14 +5,21 @@ Fetches navigation routes and simplifies instructions (removes street names).
 """
 
 import os
+import sys
 import re
 import asyncio
 import aiohttp
 import logging
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass, field
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from engine.api_key_pool import get_key_pool
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -56,7 +63,9 @@ class DirectionsFetcher:
     
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
+        # Requests are spread over GOOGLE_API_KEY and GOOGLE_API_KEYS
+        self.key_pool = get_key_pool(self.api_key)
+        if not len(self.key_pool):
             raise ValueError("Google API key is required. Set GOOGLE_API_KEY environment variable.")
         
         self.max_retries = 3
@@ -88,7 +97,6 @@ class DirectionsFetcher:
         # Use same FieldMask as working old implementation
         headers = {
             "Content-Type": "application/json",
-            "X-Goog-Api-Key": self.api_key,
             "X-Goog-FieldMask": "routes.legs.steps.navigationInstruction,routes.legs.steps.distanceMeters,routes.legs.steps.staticDuration,routes.legs.steps.startLocation,routes.legs.steps.endLocation,routes.legs.distanceMeters,routes.legs.duration"
         }
         
@@ -110,9 +118,17 @@ class DirectionsFetcher:
         }
         
         for attempt in range(self.max_retries + 1):
+            key = await self.key_pool.acquire('routes')
+            if key is None:
+                break
+            headers["X-Goog-Api-Key"] = key
             try:
                 async with aiohttp.ClientSession() as session:
                     async with session.post(url, headers=headers, json=body) as response:
+                        self.key_pool.report(key, 'routes', response.status)
+                        if response.status in (429, 403):
+                            # Key throttled or refused - fail over to another key
+                            continue
                         if response.status == 200:
                             data = await response.json()
                             return self._parse_routes_response(data)
@@ -120,6 +136,7 @@ class DirectionsFetcher:
                             error_text = await response.text()
                             logger.warning(f"Routes API error (attempt {attempt + 1}): {response.status} - {error_text}")
             except Exception as e:
+                self.key_pool.report(key, 'routes', 0)
                 logger.warning(f"Routes API exception (attempt {attempt + 1}): {e}")
             
             if attempt < self.max_retries:
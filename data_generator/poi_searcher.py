@@ -6,6 +6,7 @@ Supports both Text Search (for keyword-based) and Nearby Search (for type-based)
 """
 
 import os
+import sys
 import json
 import asyncio
 import aiohttp
@@ -15,6 +16,11 @@ from pathlib import Path
 from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from engine.api_key_pool import KEY_STATUSES, get_key_pool
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -51,7 +57,9 @@ class POISearcher:
     
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
+        # Requests are spread over GOOGLE_API_KEY and GOOGLE_API_KEYS
+        self.key_pool = get_key_pool(self.api_key)
+        if not len(self.key_pool):
             raise ValueError("Google API key is required. Set GOOGLE_API_KEY environment variable.")
         
         # Load POI config
@@ -119,7 +127,6 @@ class POISearcher:
         
         headers = {
             "Content-Type": "application/json",
-            "X-Goog-Api-Key": self.api_key,
             "X-Goog-FieldMask": "places.id,places.displayName,places.location,places.formattedAddress"
         }
         
@@ -135,9 +142,17 @@ class POISearcher:
         }
         
         for attempt in range(self.max_retries + 1):
+            key = await self.key_pool.acquire('places')
+            if key is None:
+                break
+            headers["X-Goog-Api-Key"] = key
             try:
                 async with aiohttp.ClientSession() as session:
                     async with session.post(url, headers=headers, json=body) as response:
+                        self.key_pool.report(key, 'places', response.status)
+                        if response.status in (429, 403):
+                            # Key throttled or refused - fail over to another key
+                            continue
                         if response.status == 200:
                             data = await response.json()
                             return self._parse_places_response(data)
@@ -145,6 +160,7 @@ class POISearcher:
                             error_text = await response.text()
                             logger.warning(f"Text Search API error (attempt {attempt + 1}): {response.status} - {error_text}")
             except Exception as e:
+                self.key_pool.report(key, 'places', 0)
                 logger.warning(f"Text Search API exception (attempt {attempt + 1}): {e}")
             
             if attempt < self.max_retries:
@@ -165,7 +181,6 @@ class POISearcher:
         
         headers = {
             "Content-Type": "application/json",
-            "X-Goog-Api-Key": self.api_key,
             "X-Goog-FieldMask": "places.id,places.displayName,places.location,places.formattedAddress"
         }
         
@@ -190,9 +205,17 @@ class POISearcher:
         }
         
         for attempt in range(self.max_retries + 1):
+            key = await self.key_pool.acquire('places')
+            if key is None:
+                break
+            headers["X-Goog-Api-Key"] = key
             try:
                 async with aiohttp.ClientSession() as session:
                     async with session.post(url, headers=headers, json=body) as response:
+                        self.key_pool.report(key, 'places', response.status)
+                        if response.status in (429, 403):
+                            # Key throttled or refused - fail over to another key
+                            continue
                         if response.status == 200:
                             data = await response.json()
                             return self._parse_places_response(data)
@@ -200,6 +223,7 @@ class POISearcher:
                             error_text = await response.text()
                             logger.warning(f"Nearby Search API error (attempt {attempt + 1}): {response.status} - {error_text}")
             except Exception as e:
+                self.key_pool.report(key, 'places', 0)
                 logger.warning(f"Nearby Search API exception (attempt {attempt + 1}): {e}")
             
             if attempt < self.max_retries:
@@ -245,16 +269,24 @@ class POISearcher:
         url = f"https://maps.googleapis.com/maps/api/streetview/metadata"
         params = {
             "location": f"{lat},{lng}",
-            "key": self.api_key,
             "source": "outdoor"
         }
         
         for attempt in range(self.max_retries + 1):
+            key = await self.key_pool.acquire('metadata')
+            if key is None:
+                break
+            params["key"] = key
             try:
                 async with aiohttp.ClientSession() as session:
                     async with session.get(url, params=params) as response:
+                        data = await response.json() if response.status == 200 else {}
+                        status = KEY_STATUSES.get(data.get("status"), response.status)
+                        self.key_pool.report(key, 'metadata', status)
+                        if status in (429, 403):
+                            # Key throttled or refused - fail over to another key
+                            continue
                         if response.status == 200:
-                            data = await response.json()
                             if data.get("status") == "OK":
                                 return data.get("pano_id")
                             else:
@@ -263,6 +295,7 @@ class POISearcher:
                         else:
                             logger.warning(f"Street View metadata error (attempt {attempt + 1}): {response.status}")
             except Exception as e:
+                self.key_pool.report(key, 'metadata', 0)
                 logger.warning(f"Street View metadata exception (attempt {attempt + 1}): {e}")
             
             if attempt < self.max_retries:
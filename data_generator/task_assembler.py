@@ -1227,20 +1227,20 @@ class TaskAssembler:
         with open(cache_file, "w", encoding="utf-8") as f:
             json.dump(cache, f, indent=2)
         
-        # Also save to SQLite database for Human Evaluation
-        for pano_id, meta in metadata_map.items():
-            lat = meta.get("lat")
-            lng = meta.get("lng")
-            if lat is not None and lng is not None:
-                sqlite_cache.save(
-                    pano_id=pano_id,
-                    lat=lat,
-                    lng=lng,
-                    capture_date=meta.get("date") or meta.get("capture_date"),
-                    links=meta.get("links"),
-                    center_heading=meta.get("center_heading"),
-                    source="task_generation"
-                )
+        # Also save to SQLite database for Human Evaluation (one transaction)
+        sqlite_cache.save_many([
+            {
+                "pano_id": pano_id,
+                "lat": meta.get("lat"),
+                "lng": meta.get("lng"),
+                "capture_date": meta.get("date") or meta.get("capture_date"),
+                "links": meta.get("links"),
+                "center_heading": meta.get("center_heading"),
+                "source": "task_generation"
+            }
+            for pano_id, meta in metadata_map.items()
+            if meta.get("lat") is not None and meta.get("lng") is not None
+        ])
         
         logger.debug(f"Updated metadata cache: {len(metadata_map)} entries (JSON + SQLite)")
 
@@ -19,6 +19,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from engine.metadata_fetcher import MetadataFetcher
+from cache.negative_cache import negative_cache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -214,7 +215,8 @@ class WhitelistGenerator:
             queue = self._sort_queue_by_direction_diversity(queue)
             
             # Take a batch of nodes to process in parallel
-            batch_size = min(self.parallel_workers, len(queue), max_nodes - len(result))
+            # (as many as the links backend resolves at once: workers x page batch)
+            batch_size = min(self.metadata_fetcher.max_in_flight, len(queue), max_nodes - len(result))
             batch = []
             batch_directions = []
             
@@ -226,6 +228,13 @@ class WhitelistGenerator:
                         batch_directions.append(direction)
                         visited.add(pano_id)
             
+            # Skip panos already known to fail or to be filtered out
+            known = await asyncio.to_thread(negative_cache.get_many, batch, ('metadata', 'links', 'whitelist'))
+            if known:
+                print(f"      [Batch {batch_num}] Skipping {len(known)} known-negative panos")
+                batch_directions = [d for p, d in zip(batch, batch_directions) if p not in known]
+                batch = [p for p in batch if p not in known]
+            
             if not batch:
                 continue
             
@@ -269,6 +278,7 @@ class WhitelistGenerator:
                         year = int(capture_date.split("-")[0])
                         if year < 2020:
                             print(f"        [-] {pano_id[:20]}... Old pano {capture_date} < 2020 (skipped)")
+                            await asyncio.to_thread(negative_cache.add, pano_id, 'whitelist', 'OLD_CAPTURE')
                             continue
                     except ValueError:
                         print(f"DEBUG: Date parse error for {pano_id}: {capture_date}")
@@ -380,10 +390,8 @@ class WhitelistGenerator:
         # uses the worker queue to manage concurrency.
         
         # Fetch basic metadata (lat, lng, date)
-        # This is fast and synchronous (using requests), run in thread
-        basic = await asyncio.to_thread(
-            self.metadata_fetcher.fetch_basic_metadata, pano_id
-        )
+        # Pooled async client; duplicate in-flight requests are shared
+        basic = await self.metadata_fetcher.fetch_basic_metadata_async(pano_id)
         
         if not basic:
             print(f"        [!] {pano_id[:20]}... No basic metadata")
@@ -15,6 +15,7 @@ from .session_manager import session_manager, Session, SessionState
 from .direction_calculator import direction_calculator
 from .geofence_checker import geofence_checker
 from .observation_generator import get_observation_generator
+from .prefetcher import panorama_prefetcher
 
 
 class ActionResult:
@@ -51,9 +52,16 @@ class ActionExecutor:
     Supported actions:
     - move: Move to an adjacent panorama
     - rotation: Change view angle (heading, pitch, fov)
+    - look_around: Observe front/right/back/left views at once (state unchanged)
     - stop: End the session with an optional answer
+    
+    After every step that leaves the session running, the panoramas around
+    the new position are queued for background prefetch.
     """
     
+    # look_around views: (label, heading offset from the agent's heading)
+    LOOK_AROUND_VIEWS = (("front", 0), ("right", 90), ("back", 180), ("left", 270))
+    
     def execute(
         self,
         session_id: str,
@@ -69,6 +77,12 @@ class ActionExecutor:
         Returns:
             ActionResult with success status and new observation
         """
+        # Another worker process may be serving the same session
+        with session_manager.lock(session_id):
+            return self._execute(session_id, action)
+    
+    def _execute(self, session_id: str, action: Dict[str, Any]) -> ActionResult:
+        """Execute an action (caller holds the session lock)."""
         session = session_manager.get_session(session_id)
         if session is None:
             return ActionResult(False, error="Session not found")
@@ -79,13 +93,28 @@ class ActionExecutor:
         action_type = action.get('type')
         
         if action_type == 'move':
-            return self._execute_move(session, action)
+            result = self._execute_move(session, action)
         elif action_type == 'rotation':
-            return self._execute_rotation(session, action)
+            result = self._execute_rotation(session, action)
+        elif action_type == 'look_around':
+            result = self._execute_look_around(session, action)
         elif action_type == 'stop':
             return self._execute_stop(session, action)
         else:
             return ActionResult(False, error=f"Unknown action type: {action_type}")
+        
+        if result.success and not result.done:
+            self.prefetch(session)
+        return result
+    
+    def prefetch(self, session: Session):
+        """Queue the panoramas around the session's position for background download."""
+        panorama_prefetcher.schedule(
+            session.session_id,
+            session.geofence,
+            session.state.pano_id,
+            session.state.heading
+        )
     
     def _execute_move(self, session: Session, action: Dict) -> ActionResult:
         """Execute a move action."""
@@ -197,6 +226,21 @@ class ActionExecutor:
             done=False
         )
     
+    def _execute_look_around(self, session: Session, action: Dict) -> ActionResult:
+        """Execute a look_around action (four views from the current pose)."""
+        # Pose is unchanged; counted as a step like rotation
+        session_manager.update_session_state(
+            session.session_id,
+            session.state,
+            increment_step=True
+        )
+        
+        return ActionResult(
+            success=True,
+            observation=self._generate_observation(session, session.state, look_around=True),
+            done=False
+        )
+    
     def _execute_stop(self, session: Session, action: Dict) -> ActionResult:
         """Execute a stop action."""
         answer = action.get('answer', '')
@@ -213,65 +257,48 @@ class ActionExecutor:
     
     def _get_available_moves(self, session: Session) -> list:
         """Get available moves for current position."""
-        current_pano_id = session.state.pano_id
-        
-        # Get metadata including center_heading
-        metadata = metadata_cache.get(current_pano_id)
-        if not metadata:
-            return []
-        
-        links = metadata.get('links', [])
-        if not links:
-            return []
-        
-        # Filter by geofence
-        links = geofence_checker.filter_links(session.geofence, links)
-        
-        # Get current location for distance calculation
-        current_location = (session.state.lat, session.state.lng)
-        if current_location[0] is None:
-            current_location = metadata_cache.get_location(current_pano_id)
-        
-        # Get locations for all link targets
-        link_pano_ids = [l.get('panoId') or l.get('pano_id') for l in links]
-        locations = metadata_cache.get_all_locations(link_pano_ids)
-        
-        # Calculate available moves with directions
+        # Geofence filtering, distances and headings are precomputed per pano;
+        # only the relative direction depends on the current heading.
         # Note: link.heading is already true north reference (verified)
-        moves = direction_calculator.calculate_available_moves(
-            links,
-            session.state.heading,
-            current_location,
-            locations
-        )
-        
-        # Sort by direction (front first)
-        moves = direction_calculator.sort_moves_by_direction(moves)
+        table = geofence_checker.get_move_table(session.geofence, session.state.pano_id)
         
-        return moves
+        # Sorted by direction (front first)
+        return direction_calculator.moves_from_table(table, session.state.heading)
     
     def _generate_observation(
         self,
         session: Session,
-        state: SessionState
+        state: SessionState,
+        look_around: bool = False
     ) -> Dict:
         """Generate observation dict for agent."""
         from .session_manager import SessionMode
         
-        # Generate view image
+        # Generate view image(s)
+        # In-process sessions get the JPEG bytes directly; the file is only
+        # written (in the background) for replay.
+        # look_around renders all four views from one decode; the front view
+        # doubles as the step's current image.
+        write_mode = settings.REPLAY_IMAGE_WRITE if session.in_process else "sync"
+        step = session.step_count
+        view_specs = self.LOOK_AROUND_VIEWS if look_around else self.LOOK_AROUND_VIEWS[:1]
+        names = [f"step_{step}" if offset == 0 else f"step_{step}_{label}" for label, offset in view_specs]
         try:
             generator = get_observation_generator()
-            image_result = generator.generate_observation(
+            view_results = generator.generate_observations_batch(
                 pano_id=state.pano_id,
-                heading=state.heading,
-                pitch=state.pitch,
+                views=[((state.heading + offset) % 360, state.pitch) for _, offset in view_specs],
                 fov=state.fov,
                 session_id=session.session_id,
-                step=session.step_count
+                step=step,
+                write=write_mode,
+                names=names
             )
-            image_url = f"/temp_images/{session.session_id}/step_{session.step_count}.jpg"
+            image_result = view_results[0]
+            image_url = f"/temp_images/{session.session_id}/step_{step}.jpg"
         except Exception as e:
             # If image generation fails, return None for image
+            view_results = [None] * len(view_specs)
             image_result = None
             image_url = None
         
@@ -303,6 +330,22 @@ class ActionExecutor:
             'center_heading': center_heading
         }
         
+        if session.in_process:
+            observation['image_bytes'] = image_result['image_bytes'] if image_result else None
+        
+        if look_around:
+            views = []
+            for (label, offset), name, result in zip(view_specs, names, view_results):
+                view = {
+                    'direction': label,
+                    'heading': (state.heading + offset) % 360,
+                    'image': f"/temp_images/{session.session_id}/{name}.jpg" if result else None
+                }
+                if session.in_process:
+                    view['image_bytes'] = result['image_bytes'] if result else None
+                views.append(view)
+            observation['look_around'] = views
+        
         # Add panorama_url for human mode (360° interactive viewing)
         is_human_mode = (session.mode == SessionMode.HUMAN or 
                          session.mode.value == "human" or 
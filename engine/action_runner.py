@@ -0,0 +1,165 @@
+"""
+ActionRunner - Runs blocking session work off the event loop.
+
+Executing an action reads SQLite, decodes a panorama, projects and encodes
+JPEGs and appends to the session log. The API routes hand that work to a
+bounded thread pool instead of running it on the event loop, so one slow
+render no longer stalls every other session served by the same worker.
+Work for one session runs one call at a time, in arrival order. Admission
+is bounded: when all workers are busy and the queue is full, callers wait
+up to a timeout and are then rejected instead of queueing without limit.
+"""
+import time
+import asyncio
+import weakref
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings
+
+
+class ActionQueueFull(Exception):
+    """Raised when the runner cannot admit more work within the queue timeout."""
+    pass
+
+
+class ActionRunner:
+    """
+    Bounded thread pool for per-session blocking work.
+    
+    At most `workers` calls run at once and at most `queue_size` more wait
+    for a worker. Rendering (OpenCV/NumPy) and SQLite release the GIL, so
+    threads overlap well; with RENDER_BACKEND="process" a worker thread
+    just waits for the render process.
+    """
+    
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        queue_timeout: Optional[float] = None
+    ):
+        """
+        Initialize the runner (the pool starts on first use).
+        
+        Args:
+            workers: Calls run at once (default: settings.ACTION_WORKERS)
+            queue_size: Calls waiting for a worker (default: settings.ACTION_QUEUE_SIZE)
+            queue_timeout: Seconds to wait for admission (default: settings.ACTION_QUEUE_TIMEOUT)
+        """
+        self.workers = workers or settings.ACTION_WORKERS
+        self.queue_size = queue_size if queue_size is not None else settings.ACTION_QUEUE_SIZE
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.ACTION_QUEUE_TIMEOUT
+        
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Session ID -> lock; a lock lives as long as some call holds or awaits it
+        self._session_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.active = 0  # Submitted to the pool (running or waiting for a thread)
+        self.waiting = 0  # Admitted, waiting for an earlier call of the same session
+        self._wait_total = 0.0
+        self._run_total = 0.0
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="action")
+        return self._executor
+    
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        return self._slots
+    
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
+    
+    async def run(self, session_id: Optional[str], func: Callable, *args, **kwargs) -> Any:
+        """
+        Run func(*args, **kwargs) in the pool.
+        
+        Args:
+            session_id: Session the call belongs to (calls for the same
+                session never overlap); None for unrelated work
+            func: Blocking callable
+        
+        Returns:
+            Return value of func
+        
+        Raises:
+            ActionQueueFull: If no slot frees up within the queue timeout
+        """
+        slots = self._get_slots()
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ActionQueueFull(
+                f"Action queue is full ({self.workers} running, {self.queue_size} queued)"
+            )
+        
+        lock = self._session_lock(session_id) if session_id is not None else None
+        self.waiting += 1
+        try:
+            if lock is not None:
+                await lock.acquire()
+        except BaseException:
+            slots.release()
+            raise
+        finally:
+            self.waiting -= 1
+        
+        started_at = time.monotonic()
+        self._wait_total += started_at - queued_at
+        self.admitted += 1
+        self.active += 1
+        
+        def release(_):
+            # Runs when the thread finishes, even if the awaiting request was cancelled
+            self.active -= 1
+            self.completed += 1
+            self._run_total += time.monotonic() - started_at
+            if lock is not None:
+                lock.release()
+            slots.release()
+        
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        future.add_done_callback(release)
+        return await asyncio.shield(future)
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the pool (running calls finish first if wait is True)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+    
+    def get_stats(self) -> dict:
+        """Get queue statistics."""
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self._wait_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+            'avg_run_ms': round(self._run_total / self.completed * 1000, 1) if self.completed else 0.0
+        }
+
+
+# Global instance
+action_runner = ActionRunner()
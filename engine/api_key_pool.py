@@ -0,0 +1,290 @@
+"""
+ApiKeyPool - Schedules outbound Google API requests across several keys.
+
+Every key has its own request budget per service (token bucket), so the
+aggregate rate scales with the number of configured keys. A key that
+answers 429 is cooled down with exponential backoff and a key that answers
+403 is parked for longer; requests fail over to the remaining keys in the
+meantime. Per-key usage counters are exposed for monitoring.
+"""
+import time
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings
+
+
+# Google API statuses that mean the key (not the request) failed, as HTTP codes for report()
+KEY_STATUSES = {"OVER_QUERY_LIMIT": 429, "REQUEST_DENIED": 403}
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter.
+    
+    Callers reserve a token and sleep until it becomes available, so bursts
+    up to `burst` requests go out immediately and the sustained rate never
+    exceeds `rate` requests per second.
+    """
+    
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: Tokens per second (<= 0 disables limiting)
+            burst: Bucket capacity
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def reserve(self) -> float:
+        """Take one token, returning how long the caller must wait for it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            # A negative balance is a queue of reservations ahead of us
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+    
+    def available(self) -> float:
+        """Get the current token balance (negative while reservations queue)."""
+        if self.rate <= 0:
+            return float('inf')
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+    
+    async def acquire(self):
+        """Wait for one token."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _service_limits() -> Dict[str, Tuple[float, int]]:
+    """Per-key (rate, burst) of each service, from settings."""
+    return {
+        'tiles': (settings.TILES_RATE_LIMIT, settings.TILES_RATE_BURST),
+        'metadata': (settings.METADATA_RATE_LIMIT, max(1, int(settings.METADATA_RATE_LIMIT))),
+        'maps_js': (0, 1),  # One page call per links batch; quota is enforced by Google
+        'places': (settings.PLACES_RATE_LIMIT, max(1, int(settings.PLACES_RATE_LIMIT))),
+        'routes': (settings.ROUTES_RATE_LIMIT, max(1, int(settings.ROUTES_RATE_LIMIT))),
+    }
+
+
+class _KeyBudget:
+    """Rate budget, cooldown and counters of one key for one service."""
+    
+    def __init__(self, rate: float, burst: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.requests = 0
+        self.ok = 0
+        self.rate_limited = 0
+        self.forbidden = 0
+        self.errors = 0
+    
+    def to_dict(self, now: float) -> dict:
+        return {
+            'requests': self.requests,
+            'ok': self.ok,
+            'rate_limited': self.rate_limited,
+            'forbidden': self.forbidden,
+            'errors': self.errors,
+            'cooldown_seconds': round(max(0.0, self.cooldown_until - now), 1)
+        }
+
+
+class ApiKeyPool:
+    """
+    Pool of API keys with per-key, per-service budgets.
+    
+    Services: 'tiles', 'metadata' (Static API), 'maps_js' (links pages),
+    'places' and 'routes'. Usage:
+    
+        key = await pool.acquire('tiles')   # None if no key is usable
+        ... send the request with `key` ...
+        pool.report(key, 'tiles', status)   # HTTP status of the response
+    """
+    
+    def __init__(self, keys: List[str]):
+        """
+        Initialize the pool.
+        
+        Args:
+            keys: API keys (duplicates and empty values are dropped)
+        """
+        self.keys: List[str] = list(dict.fromkeys(k for k in keys if k))
+        self._limits = _service_limits()
+        self._budgets: Dict[Tuple[str, str], _KeyBudget] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    def _budget(self, key: str, service: str) -> _KeyBudget:
+        budget = self._budgets.get((key, service))
+        if budget is None:
+            rate, burst = self._limits.get(service, (0, 1))
+            budget = self._budgets[(key, service)] = _KeyBudget(rate, burst)
+        return budget
+    
+    def reserve(self, service: str) -> Tuple[Optional[str], float]:
+        """
+        Pick a key for one request and reserve its budget.
+        
+        Prefers keys that are not cooling down and have the most budget
+        left (then the fewest requests so far). If every key is cooling down, the one that recovers first is
+        used, unless that takes longer than settings.API_KEY_MAX_WAIT.
+        
+        Args:
+            service: Service name
+        
+        Returns:
+            Tuple of (key or None, seconds to wait before sending)
+        """
+        with self._lock:
+            if not self.keys:
+                return None, 0.0
+            now = time.monotonic()
+            budgets = [(key, self._budget(key, service)) for key in self.keys]
+            ready = [(key, b) for key, b in budgets if b.cooldown_until <= now]
+            if ready:
+                key, budget = min(ready, key=lambda item: (-item[1].bucket.available(), item[1].requests))
+                wait = 0.0
+            else:
+                key, budget = min(budgets, key=lambda item: item[1].cooldown_until)
+                wait = budget.cooldown_until - now
+                if wait > settings.API_KEY_MAX_WAIT:
+                    return None, 0.0
+            budget.requests += 1
+        return key, wait + budget.bucket.reserve()
+    
+    async def acquire(self, service: str) -> Optional[str]:
+        """
+        Wait for a key with budget for one request.
+        
+        Args:
+            service: Service name
+        
+        Returns:
+            API key, or None if every key is unusable for now
+        """
+        key, wait = self.reserve(service)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return key
+    
+    def acquire_sync(self, service: str) -> Optional[str]:
+        """Blocking version of acquire()."""
+        key, wait = self.reserve(service)
+        if wait > 0:
+            time.sleep(wait)
+        return key
+    
+    def is_ready(self, key: str, service: str) -> bool:
+        """Check whether a key is not cooling down for a service."""
+        with self._lock:
+            return self._budget(key, service).cooldown_until <= time.monotonic()
+    
+    def record(self, key: str, service: str):
+        """Count a request sent with a fixed key (e.g. a loaded Maps JS page)."""
+        with self._lock:
+            self._budget(key, service).requests += 1
+    
+    def report(self, key: str, service: str, status: int):
+        """
+        Record the outcome of a request.
+        
+        Args:
+            key: Key the request was sent with
+            service: Service name
+            status: HTTP status (429 cools the key down, 403 parks it,
+                0 or other non-2xx count as errors)
+        """
+        with self._lock:
+            budget = self._budget(key, service)
+            now = time.monotonic()
+            if 200 <= status < 300:
+                budget.ok += 1
+                budget.strikes = 0
+            elif status == 429:
+                budget.rate_limited += 1
+                # Requests already in flight when the key was cooled down do not escalate
+                if budget.cooldown_until <= now:
+                    budget.strikes += 1
+                cooldown = min(
+                    settings.API_KEY_COOLDOWN * 2 ** (budget.strikes - 1),
+                    settings.API_KEY_MAX_COOLDOWN
+                )
+                budget.cooldown_until = max(budget.cooldown_until, now + cooldown)
+            elif status == 403:
+                budget.forbidden += 1
+                budget.cooldown_until = now + settings.API_KEY_FORBIDDEN_COOLDOWN
+            else:
+                budget.errors += 1
+    
+    @staticmethod
+    def mask(key: str) -> str:
+        """Shorten a key for display."""
+        return f"{key[:4]}...{key[-4:]}" if len(key) > 8 else "***"
+    
+    def get_usage(self) -> dict:
+        """Get per-key usage counters (keys masked)."""
+        with self._lock:
+            now = time.monotonic()
+            keys = []
+            totals: Dict[str, int] = {}
+            for key in self.keys:
+                services = {}
+                for (k, service), budget in self._budgets.items():
+                    if k != key:
+                        continue
+                    services[service] = budget.to_dict(now)
+                    for name in ('requests', 'ok', 'rate_limited', 'forbidden', 'errors'):
+                        totals[name] = totals.get(name, 0) + services[service][name]
+                keys.append({'key': self.mask(key), 'services': services})
+            return {'key_count': len(self.keys), 'keys': keys, 'totals': totals}
+
+
+def _configured_keys() -> List[str]:
+    """GOOGLE_API_KEY followed by GOOGLE_API_KEYS."""
+    return [settings.GOOGLE_API_KEY] + settings.GOOGLE_API_KEYS
+
+
+# Pools for explicitly passed keys that are not configured in settings
+_extra_pools: Dict[str, ApiKeyPool] = {}
+
+
+def get_key_pool(api_key: Optional[str] = None) -> ApiKeyPool:
+    """
+    Get the pool to use for a component.
+    
+    Args:
+        api_key: Explicit key passed to the component. Configured keys (or
+            None) map to the shared pool; any other key gets its own pool.
+    
+    Returns:
+        ApiKeyPool
+    """
+    if not api_key or api_key in api_key_pool.keys:
+        return api_key_pool
+    if api_key not in _extra_pools:
+        _extra_pools[api_key] = ApiKeyPool([api_key])
+    return _extra_pools[api_key]
+
+
+# Global instance
+api_key_pool = ApiKeyPool(_configured_keys())
@@ -0,0 +1,169 @@
+"""
+CoverageAudit - Finds required panoramas that lack cached assets.
+
+For a set of required panoramas (whitelist lists, whole whitelist files or
+the geofences of a task directory) computes which ones have no metadata,
+no links or no image at a zoom level. Instead of PanoramaCache.has per
+panorama (a stat plus a query each), the audit joins a temporary table of
+the required IDs against the cache tables in one query and scans the
+panorama directory once. The result can be handed to a preload job.
+"""
+import os
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings
+from cache.cache_manager import cache_manager
+from cache.negative_cache import negative_cache
+from cache.panorama_cache import panorama_cache
+from .preload_jobs import load_whitelist_file, resolve_whitelist
+
+
+def task_geofence(task_config: Dict) -> Optional[str]:
+    """Get the geofence name of a task (navigation: 'geofence', others: 'geofence_id')."""
+    return task_config.get('geofence') or task_config.get('geofence_id')
+
+
+def required_panos_for_tasks(tasks_dir: Path, task_ids: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Collect the panoramas the tasks of a directory can visit.
+    
+    Args:
+        tasks_dir: Directory of task JSON files
+        task_ids: Only these tasks (default: every *.json in the directory)
+    
+    Returns:
+        Geofence panoramas plus spawn/target panoramas, without duplicates
+    
+    Raises:
+        ValueError: If a requested task does not exist
+    """
+    if task_ids is None:
+        paths = sorted(Path(tasks_dir).glob('*.json'))
+    else:
+        paths = [Path(tasks_dir) / f"{task_id}.json" for task_id in task_ids]
+        missing = [path.stem for path in paths if not path.exists()]
+        if missing:
+            raise ValueError(f"Task not found: {', '.join(missing)}")
+    
+    required: Dict[str, None] = {}
+    geofences = set()
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                task_config = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[CoverageAudit] Skipping {path.name}: {e}")
+            continue
+        for key in ('spawn_point', 'spawn_pano_id', 'target_pano_id'):
+            if task_config.get(key):
+                required[task_config[key]] = None
+        for pano_id in task_config.get('target_pano_ids') or []:
+            required[pano_id] = None
+        geofence = task_geofence(task_config)
+        if geofence:
+            geofences.add(geofence)
+    
+    for geofence in sorted(geofences):
+        for pano_id in resolve_whitelist(geofence) or []:
+            required[pano_id] = None
+    return list(required)
+
+
+def required_panos_for_file(path: Path) -> List[str]:
+    """Collect the panoramas of every list in a whitelist file, without duplicates."""
+    required: Dict[str, None] = {}
+    for pano_ids in load_whitelist_file(path).values():
+        for pano_id in pano_ids:
+            required[pano_id] = None
+    return list(required)
+
+
+def _scan_images(zoom: int) -> set:
+    """Pano IDs with an image (JPEG or tile set) at a zoom, from one directory scan."""
+    suffixes = (f"_z{zoom}.jpg", f"_z{zoom}.pyr")
+    found = set()
+    try:
+        with os.scandir(panorama_cache.panoramas_dir) as it:
+            for entry in it:
+                for suffix in suffixes:
+                    if entry.name.endswith(suffix):
+                        found.add(entry.name[:-len(suffix)])
+                        break
+    except FileNotFoundError:
+        pass
+    return found
+
+
+def audit_coverage(pano_ids: Iterable[str], zoom: Optional[int] = None) -> dict:
+    """
+    Find which required panoramas lack metadata, links or an image.
+    
+    Args:
+        pano_ids: Required panoramas
+        zoom: Zoom level of the images (default: settings.PANORAMA_ZOOM_LEVEL)
+    
+    Returns:
+        Dict with:
+        - required: number of distinct required panoramas
+        - missing_metadata / missing_links / missing_images: pano ID lists
+          (links are only checked where metadata exists; an image counts
+          as cached only with both the file and its database record,
+          like PanoramaCache.has)
+        - unrecorded_images: files on disk without a database record
+        - known_failures: {pano_id: reason} from the negative cache
+        - missing: pano IDs a preload job should fetch (no metadata or no image)
+    """
+    zoom = zoom if zoom is not None else settings.PANORAMA_ZOOM_LEVEL
+    pano_ids = list(dict.fromkeys(pano_ids))
+    start = time.time()
+    
+    on_disk = _scan_images(zoom)
+    
+    with cache_manager.get_connection() as conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS coverage_audit (pano_id TEXT PRIMARY KEY)')
+        conn.execute('DELETE FROM coverage_audit')
+        conn.executemany('INSERT OR IGNORE INTO coverage_audit (pano_id) VALUES (?)', [(p,) for p in pano_ids])
+        cursor = conn.execute('''
+            SELECT a.pano_id,
+                   m.pano_id IS NOT NULL AS has_metadata,
+                   m.links IS NOT NULL AND m.links NOT IN ('', '[]', 'null') AS has_links,
+                   p.pano_id IS NOT NULL AS has_record
+            FROM coverage_audit a
+            LEFT JOIN metadata m ON m.pano_id = a.pano_id
+            LEFT JOIN panoramas p ON p.pano_id = a.pano_id AND p.zoom = ?
+        ''', (zoom,))
+        rows = cursor.fetchall()
+        conn.execute('DROP TABLE coverage_audit')
+    
+    missing_metadata, missing_links, missing_images = [], [], []
+    unrecorded = 0
+    for row in rows:
+        pano_id = row['pano_id']
+        if not row['has_metadata']:
+            missing_metadata.append(pano_id)
+        elif not row['has_links']:
+            missing_links.append(pano_id)
+        if pano_id not in on_disk or not row['has_record']:
+            missing_images.append(pano_id)
+            if pano_id in on_disk:
+                unrecorded += 1
+    
+    missing = sorted(set(missing_metadata) | set(missing_images))
+    known_failures = negative_cache.get_many(missing, ('metadata', 'links', f'tiles_z{zoom}'))
+    
+    return {
+        'zoom': zoom,
+        'required': len(pano_ids),
+        'missing_metadata': sorted(missing_metadata),
+        'missing_links': sorted(missing_links),
+        'missing_images': sorted(missing_images),
+        'unrecorded_images': unrecorded,
+        'known_failures': known_failures,
+        'missing': missing,
+        'audit_ms': round((time.time() - start) * 1000, 1)
+    }
@@ -5,7 +5,7 @@ Converts absolute headings to human-readable relative directions
 based on the agent's current heading.
 """
 import math
-from typing import Tuple, List, Dict, Optional
+from typing import Tuple, List, Dict, Optional, Sequence
 from dataclasses import dataclass
 
 
@@ -195,6 +195,82 @@ class DirectionCalculator:
         
         return moves
     
+    @staticmethod
+    def direction_sort_key(relative_angle: float) -> float:
+        """
+        Numeric sort key for a relative angle (front first, then clockwise).
+        
+        Gives the same order as sort_moves_by_direction without formatting
+        and re-parsing the direction string: cardinal bands snap to 0/90/180/270
+        and other angles use the rounded offset shown in the description.
+        
+        Args:
+            relative_angle: Angle from agent's perspective (0-360)
+        
+        Returns:
+            Sort key in degrees
+        """
+        angle = relative_angle % 360
+        threshold = 10
+        
+        if angle <= threshold or angle >= 360 - threshold:
+            return 0
+        elif 90 - threshold <= angle <= 90 + threshold:
+            return 90
+        elif 180 - threshold <= angle <= 180 + threshold:
+            return 180
+        elif 270 - threshold <= angle <= 270 + threshold:
+            return 270
+        
+        if angle < 90:
+            return round(angle)
+        elif angle < 180:
+            return 90 + round(angle - 90)
+        elif angle < 270:
+            return 270 - round(270 - angle)
+        else:
+            return 360 - round(360 - angle)
+    
+    def moves_from_table(
+        self,
+        table: Sequence[Tuple[str, float, Optional[float]]],
+        agent_heading: float
+    ) -> List[Dict]:
+        """
+        Build sorted available moves from a precomputed move table.
+        
+        Only the relative angle depends on the agent heading; filtering,
+        distances and headings come precomputed
+        (see GeofenceChecker.get_move_table).
+        
+        Args:
+            table: Tuple of (pano_id, heading, distance_or_None) in link order
+            agent_heading: Agent's current heading (true north reference)
+        
+        Returns:
+            List of available moves sorted front first, then clockwise
+            (same format as calculate_available_moves)
+        """
+        keyed = []
+        for order, (pano_id, heading, distance) in enumerate(table):
+            relative_angle = self.get_relative_angle(heading, agent_heading)
+            keyed.append((self.direction_sort_key(relative_angle), order, relative_angle, pano_id, heading, distance))
+        keyed.sort()
+        
+        moves = []
+        for idx, (_, _, relative_angle, pano_id, heading, distance) in enumerate(keyed, start=1):
+            move = {
+                "id": idx,
+                "pano_id": pano_id,
+                "direction": self.angle_to_direction(relative_angle),
+                "heading": heading
+            }
+            if distance is not None:
+                move["distance"] = round(distance, 1)
+            moves.append(move)
+        
+        return moves
+    
     @staticmethod
     def sort_moves_by_direction(moves: List[Dict]) -> List[Dict]:
         """
@@ -5,12 +5,17 @@ Ensures agents can only navigate within the defined whitelist of panoramas
 for each task.
 """
 import json
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Set, Optional
+from typing import Dict, List, Set, Optional, Tuple
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config.settings import settings
+from cache.metadata_cache import metadata_cache
+from .geofence_graph import GeofenceGraph
+from .direction_calculator import calculate_distance
 
 
 class GeofenceChecker:
@@ -30,6 +35,19 @@ class GeofenceChecker:
         """
         self.config_path = config_path or settings.GEOFENCE_CONFIG_PATH
         self._geofences: Dict[str, Set[str]] = {}
+        
+        # Warmed adjacency graphs; rebuilt lazily when marked stale
+        self._graphs: Dict[str, GeofenceGraph] = {}
+        self._stale_graphs: Set[str] = set()
+        self._building_graphs: Set[str] = set()
+        # Move tables for geofences that are not warmed: (geofence, pano_id) -> edges (LRU)
+        self._move_tables: OrderedDict = OrderedDict()
+        self._move_lock = threading.Lock()
+        # Bumped on every invalidation so in-flight builds can't store stale tables
+        self._move_generation = 0
+        self._graph_lock = threading.Lock()
+        metadata_cache.add_invalidation_listener(self._on_metadata_changed)
+        
         self._load_config()
     
     def _load_config(self):
@@ -49,6 +67,7 @@ class GeofenceChecker:
             task_id: set(pano_ids) 
             for task_id, pano_ids in config.items()
         }
+        self._mark_stale(None)
     
     def reload_config(self):
         """Reload configuration from file."""
@@ -123,6 +142,7 @@ class GeofenceChecker:
             save: Whether to save to config file
         """
         self._geofences[geofence_name] = set(pano_ids)
+        self._mark_stale(geofence_name)
         
         if save:
             self._save_config()
@@ -140,10 +160,176 @@ class GeofenceChecker:
             self._geofences[geofence_name] = set()
         
         self._geofences[geofence_name].add(pano_id)
+        self._mark_stale(geofence_name)
         
         if save:
             self._save_config()
     
+    def warm_geofence(self, geofence_name: str, force: bool = False) -> Optional[GeofenceGraph]:
+        """
+        Load a whole geofence into an in-memory adjacency graph.
+        
+        Reads all metadata/location rows of the whitelist in batched queries,
+        after which move and distance lookups for the geofence never hit SQLite.
+        
+        Args:
+            geofence_name: Geofence list name (e.g., "list001")
+            force: Rebuild even if a current graph exists
+        
+        Returns:
+            GeofenceGraph, or None if the geofence is not defined
+        """
+        pano_ids = self._geofences.get(geofence_name)
+        if not pano_ids:
+            return None
+        
+        with self._graph_lock:
+            graph = self._graphs.get(geofence_name)
+            if graph is not None and not force and geofence_name not in self._stale_graphs:
+                return graph
+            self._stale_graphs.discard(geofence_name)
+            self._building_graphs.add(geofence_name)
+        
+        try:
+            graph = GeofenceGraph(geofence_name, list(pano_ids))
+        finally:
+            with self._graph_lock:
+                self._building_graphs.discard(geofence_name)
+        
+        with self._graph_lock:
+            # A change during the build leaves it marked stale for the next lookup
+            self._graphs[geofence_name] = graph
+        
+        print(f"[GeofenceChecker] Warmed {geofence_name}: {graph.with_metadata}/{len(graph)} panos, "
+              f"{graph.edge_count} edges in {graph.build_ms:.0f}ms")
+        return graph
+    
+    def get_graph(self, geofence_name: Optional[str]) -> Optional[GeofenceGraph]:
+        """
+        Get the warmed graph for a geofence, rebuilding it if stale.
+        
+        Args:
+            geofence_name: Geofence list name (e.g., "list001")
+        
+        Returns:
+            GeofenceGraph, or None if the geofence was never warmed
+        """
+        if not geofence_name:
+            return None
+        
+        graph = self._graphs.get(geofence_name)
+        if graph is None:
+            return None
+        if geofence_name in self._stale_graphs:
+            return self.warm_geofence(geofence_name)
+        return graph
+    
+    def get_move_table(
+        self,
+        geofence_name: Optional[str],
+        pano_id: str
+    ) -> Tuple[Tuple[str, float, Optional[float]], ...]:
+        """
+        Get the precomputed moves out of a panorama within a geofence.
+        
+        Uses the warmed graph when available; otherwise builds the table from
+        the metadata cache once and keeps it (up to
+        settings.MOVE_TABLE_CACHE_SIZE tables) until the metadata changes.
+        
+        Args:
+            geofence_name: Geofence list name (None = no restriction)
+            pano_id: Current panorama ID
+        
+        Returns:
+            Tuple of (neighbor_pano_id, heading, distance_or_None) in link
+            order (empty if the panorama has no metadata or links)
+        """
+        graph = self.get_graph(geofence_name)
+        if graph is not None:
+            table = graph.edges(pano_id)
+            if table is not None:
+                return table
+        
+        key = (geofence_name, pano_id)
+        with self._move_lock:
+            table = self._move_tables.get(key)
+            if table is not None:
+                self._move_tables.move_to_end(key)
+                return table
+            generation = self._move_generation
+        
+        table = self._build_move_table(geofence_name, pano_id)
+        with self._move_lock:
+            if generation == self._move_generation:
+                self._move_tables[key] = table
+                while len(self._move_tables) > settings.MOVE_TABLE_CACHE_SIZE:
+                    self._move_tables.popitem(last=False)
+        return table
+    
+    def _build_move_table(
+        self,
+        geofence_name: Optional[str],
+        pano_id: str
+    ) -> Tuple[Tuple[str, float, Optional[float]], ...]:
+        """Build one pano's move table from the metadata cache."""
+        record = metadata_cache.get_record(pano_id)
+        if record is None or not record.links:
+            return ()
+        
+        links = self.filter_links(geofence_name, record.links)
+        current_location = metadata_cache.get_location(pano_id)
+        link_pano_ids = [l.get('panoId') or l.get('pano_id') for l in links]
+        locations = metadata_cache.get_all_locations(link_pano_ids)
+        
+        table = []
+        for link_pano_id, link in zip(link_pano_ids, links):
+            distance = None
+            target_location = locations.get(link_pano_id)
+            if current_location and target_location:
+                distance = calculate_distance(
+                    current_location[0], current_location[1],
+                    target_location[0], target_location[1]
+                )
+            table.append((link_pano_id, float(link.get('heading', 0)), distance))
+        
+        return tuple(table)
+    
+    def _mark_stale(self, geofence_name: Optional[str]):
+        """Mark one (or, with None, every) warmed graph for rebuild."""
+        with self._move_lock:
+            self._move_generation += 1
+            if geofence_name is None:
+                self._move_tables.clear()
+            else:
+                for key in [k for k in self._move_tables if k[0] == geofence_name]:
+                    del self._move_tables[key]
+        with self._graph_lock:
+            warm = set(self._graphs) | self._building_graphs
+            if geofence_name is None:
+                self._stale_graphs.update(warm)
+            elif geofence_name in warm:
+                self._stale_graphs.add(geofence_name)
+    
+    def _on_metadata_changed(self, pano_id: Optional[str]):
+        """Metadata cache listener: invalidate graphs containing the panorama."""
+        if pano_id is None:
+            self._mark_stale(None)
+            return
+        
+        # Tables hold neighbor distances too: drop the panorama's and its neighbors'
+        with self._move_lock:
+            self._move_generation += 1
+            for key in [
+                k for k, table in self._move_tables.items()
+                if k[1] == pano_id or any(edge[0] == pano_id for edge in table)
+            ]:
+                del self._move_tables[key]
+        
+        with self._graph_lock:
+            for name in set(self._graphs) | self._building_graphs:
+                if pano_id in self._geofences.get(name, ()):
+                    self._stale_graphs.add(name)
+    
     def _save_config(self):
         """Save current configuration to file."""
         config = {
@@ -161,6 +347,10 @@ class GeofenceChecker:
             'geofence_sizes': {
                 geofence_name: len(pano_ids) 
                 for geofence_name, pano_ids in self._geofences.items()
+            },
+            'warm_graphs': {
+                name: graph.get_stats()
+                for name, graph in list(self._graphs.items())
             }
         }
 
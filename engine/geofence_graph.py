@@ -0,0 +1,158 @@
+"""
+GeofenceGraph - In-memory adjacency structure for one geofence whitelist.
+
+Built once from a batched metadata read, it answers "which panoramas can I
+move to from here, at what heading and distance" without touching SQLite.
+Edges are stored in CSR form (offsets + flat neighbor/heading/distance arrays).
+"""
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Iterable
+
+import numpy as np
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from cache.metadata_cache import metadata_cache
+from .direction_calculator import calculate_distance
+
+
+class GeofenceGraph:
+    """
+    Adjacency arrays for the panoramas of a geofence.
+    
+    Layout:
+    - pano_ids[i] / index[pano_id]: pano index mapping
+    - lat[i], lng[i], center_heading[i]: per-pano attributes (NaN if unknown)
+    - offsets[i]:offsets[i+1] slices the edge arrays for pano i
+    - neighbors[e], headings[e], distances[e]: per-edge data in link order,
+      restricted to targets inside the geofence (distance NaN if unknown)
+    """
+    
+    def __init__(self, name: str, pano_ids: Iterable[str]):
+        """
+        Build the graph for a whitelist.
+        
+        Args:
+            name: Geofence name
+            pano_ids: Whitelisted panorama IDs
+        """
+        start = time.perf_counter()
+        
+        self.name = name
+        self.pano_ids: List[str] = sorted(pano_ids)
+        self.index: Dict[str, int] = {p: i for i, p in enumerate(self.pano_ids)}
+        n = len(self.pano_ids)
+        
+        # One batched read of every metadata row in the whitelist
+        metadata_cache.preload(self.pano_ids)
+        locations = metadata_cache.get_all_locations(self.pano_ids)
+        
+        self.lat = np.full(n, np.nan, dtype=np.float64)
+        self.lng = np.full(n, np.nan, dtype=np.float64)
+        self.center_heading = np.zeros(n, dtype=np.float64)
+        for pano_id, (lat, lng) in locations.items():
+            i = self.index[pano_id]
+            self.lat[i] = lat
+            self.lng[i] = lng
+        
+        offsets = [0]
+        neighbors: List[int] = []
+        headings: List[float] = []
+        distances: List[float] = []
+        self.with_metadata = 0
+        
+        for i, pano_id in enumerate(self.pano_ids):
+            record = metadata_cache.get_record(pano_id)
+            if record is not None:
+                self.with_metadata += 1
+                self.center_heading[i] = record.center_heading
+                for link in record.links:
+                    j = self.index.get(link.get('panoId') or link.get('pano_id'))
+                    if j is None:
+                        continue
+                    neighbors.append(j)
+                    headings.append(float(link.get('heading', 0)))
+                    if np.isnan(self.lat[i]) or np.isnan(self.lat[j]):
+                        distances.append(np.nan)
+                    else:
+                        distances.append(calculate_distance(
+                            self.lat[i], self.lng[i], self.lat[j], self.lng[j]
+                        ))
+            offsets.append(len(neighbors))
+        
+        self.offsets = np.asarray(offsets, dtype=np.int32)
+        self.neighbors = np.asarray(neighbors, dtype=np.int32)
+        self.headings = np.asarray(headings, dtype=np.float64)
+        self.distances = np.asarray(distances, dtype=np.float64)
+        
+        # Per-pano edge tuples, materialized on first use
+        self._tables: Dict[str, Tuple] = {}
+        
+        self.build_ms = (time.perf_counter() - start) * 1000
+    
+    def __contains__(self, pano_id: str) -> bool:
+        return pano_id in self.index
+    
+    def __len__(self) -> int:
+        return len(self.pano_ids)
+    
+    @property
+    def edge_count(self) -> int:
+        return len(self.neighbors)
+    
+    def edges(self, pano_id: str) -> Optional[Tuple[Tuple[str, float, Optional[float]], ...]]:
+        """
+        Get outgoing edges (the move table) of a panorama.
+        
+        Args:
+            pano_id: Panorama ID
+        
+        Returns:
+            Tuple of (neighbor_pano_id, heading, distance_or_None) in link
+            order, or None if the panorama is not in this geofence
+        """
+        table = self._tables.get(pano_id)
+        if table is not None:
+            return table
+        
+        i = self.index.get(pano_id)
+        if i is None:
+            return None
+        
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        table = tuple(
+            (
+                self.pano_ids[j],
+                float(h),
+                None if np.isnan(d) else float(d)
+            )
+            for j, h, d in zip(self.neighbors[lo:hi], self.headings[lo:hi], self.distances[lo:hi])
+        )
+        self._tables[pano_id] = table
+        return table
+    
+    def get_location(self, pano_id: str) -> Optional[Tuple[float, float]]:
+        """Get (lat, lng) of a panorama in this geofence."""
+        i = self.index.get(pano_id)
+        if i is None or np.isnan(self.lat[i]):
+            return None
+        return (float(self.lat[i]), float(self.lng[i]))
+    
+    def distance(self, pano_a: str, pano_b: str) -> Optional[float]:
+        """Haversine distance between two panoramas of this geofence (meters)."""
+        a = self.get_location(pano_a)
+        b = self.get_location(pano_b)
+        if a is None or b is None:
+            return None
+        return calculate_distance(a[0], a[1], b[0], b[1])
+    
+    def get_stats(self) -> Dict:
+        """Get graph statistics."""
+        return {
+            'name': self.name,
+            'pano_count': len(self.pano_ids),
+            'with_metadata': self.with_metadata,
+            'edge_count': self.edge_count,
+            'build_ms': round(self.build_ms, 1)
+        }
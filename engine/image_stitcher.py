@@ -2,20 +2,26 @@
 ImageStitcher - Stitches panorama tiles into a complete equirectangular image.
 
 Takes downloaded tiles and combines them into a single panorama image.
+Tiles are decoded in parallel into one NumPy buffer, JPEG-encoded once and
+written once; with settings.PANORAMA_STORE_TILES the tiles themselves are
+stored losslessly instead.
 """
-import io
+import os
+import asyncio
+import tempfile
 from pathlib import Path
 from typing import Dict, Tuple, Optional
 
 try:
-    from PIL import Image
+    import cv2
 except ImportError:
-    Image = None
+    cv2 = None
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config.settings import PANORAMAS_DIR
+from config.settings import settings, PANORAMAS_DIR
 from cache.panorama_cache import panorama_cache
+from cache.panorama_pyramid import stitch_tiles as stitch_tile_array
 
 
 class ImageStitcher:
@@ -30,11 +36,6 @@ class ImageStitcher:
     
     TILE_SIZE = 512  # Standard Google tile size
     
-    def __init__(self):
-        """Initialize the image stitcher."""
-        if Image is None:
-            raise ImportError("Pillow is required. Install with: pip install Pillow")
-    
     @staticmethod
     def get_grid_dimensions(zoom: int) -> Tuple[int, int]:
         """
@@ -66,48 +67,6 @@ class ImageStitcher:
         cols, rows = ImageStitcher.get_grid_dimensions(zoom)
         return (cols * ImageStitcher.TILE_SIZE, rows * ImageStitcher.TILE_SIZE)
     
-    def stitch_tiles(
-        self,
-        tiles: Dict[Tuple[int, int], bytes],
-        zoom: int
-    ) -> Optional[Image.Image]:
-        """
-        Stitch tiles into a complete panorama image.
-        
-        Args:
-            tiles: Dict mapping (x, y) to tile bytes
-            zoom: Zoom level
-            
-        Returns:
-            Stitched PIL Image or None if failed
-        """
-        cols, rows = self.get_grid_dimensions(zoom)
-        width, height = self.get_output_size(zoom)
-        
-        # Create output image
-        output = Image.new('RGB', (width, height))
-        
-        for y in range(rows):
-            for x in range(cols):
-                if (x, y) not in tiles:
-                    print(f"Missing tile at ({x}, {y})")
-                    return None
-                
-                try:
-                    tile_data = tiles[(x, y)]
-                    tile_img = Image.open(io.BytesIO(tile_data))
-                    
-                    # Paste tile at correct position
-                    paste_x = x * self.TILE_SIZE
-                    paste_y = y * self.TILE_SIZE
-                    output.paste(tile_img, (paste_x, paste_y))
-                    
-                except Exception as e:
-                    print(f"Error processing tile ({x}, {y}): {e}")
-                    return None
-        
-        return output
-    
     def stitch_and_save(
         self,
         tiles: Dict[Tuple[int, int], bytes],
@@ -118,6 +77,10 @@ class ImageStitcher:
         """
         Stitch tiles and save to file.
         
+        The panorama is encoded once; the cache copy is written atomically.
+        In lossless mode (settings.PANORAMA_STORE_TILES) the tile set is
+        cached as-is and no JPEG is produced.
+        
         Args:
             tiles: Dict mapping (x, y) to tile bytes
             pano_id: Panorama ID
@@ -127,25 +90,45 @@ class ImageStitcher:
         Returns:
             Path to saved image or None if failed
         """
-        output_dir = output_dir or PANORAMAS_DIR
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Stitch tiles
-        image = self.stitch_tiles(tiles, zoom)
+        cols, rows = self.get_grid_dimensions(zoom)
+        if output_dir is None and settings.PANORAMA_STORE_TILES:
+            try:
+                return panorama_cache.save_tiles(pano_id, zoom, tiles, cols, rows)
+            except ValueError as e:
+                print(f"Error saving tiles for {pano_id}: {e}")
+                return None
+        
+        # Stitch tiles (decoded in parallel)
+        image = stitch_tile_array(tiles, cols, rows, self.TILE_SIZE)
         if image is None:
             return None
         
-        # Save image
-        output_path = output_dir / f"{pano_id}_z{zoom}.jpg"
-        image.save(str(output_path), 'JPEG', quality=90)
+        image_bytes = self.encode(image)
+        if image_bytes is None:
+            print(f"Error encoding panorama {pano_id}")
+            return None
+        
+        output_path = panorama_cache.save(pano_id, zoom, image_bytes)
         
-        # Update cache database
-        with open(output_path, 'rb') as f:
-            image_bytes = f.read()
-        panorama_cache.save(pano_id, zoom, image_bytes)
+        if output_dir is not None and Path(output_dir).resolve() != PANORAMAS_DIR.resolve():
+            output_dir = Path(output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            output_path = output_dir / f"{pano_id}_z{zoom}.jpg"
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=output_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, output_path)
         
         return output_path
     
+    @staticmethod
+    def encode(image) -> Optional[bytes]:
+        """JPEG-encode a stitched BGR panorama (quality 90)."""
+        if cv2 is None:
+            raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+        ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        return buf.tobytes() if ok else None
+    
     def download_and_stitch(
         self,
         pano_id: str,
@@ -167,6 +150,11 @@ class ImageStitcher:
         if panorama_cache.has(pano_id, zoom):
             return panorama_cache.get(pano_id, zoom)
         
+        # Downsample a cached higher zoom instead of downloading
+        derived = panorama_cache.derive_lower_zoom(pano_id, zoom)
+        if derived is not None:
+            return derived
+        
         # Import here to avoid circular dependency
         from .tiles_downloader import get_tiles_downloader
         
@@ -179,6 +167,74 @@ class ImageStitcher:
         
         # Stitch and save
         return self.stitch_and_save(tiles, pano_id, zoom)
+    
+    def save_array(self, image, pano_id: str, zoom: int) -> Optional[Path]:
+        """
+        Encode a stitched BGR panorama once and store it in the cache.
+        
+        Args:
+            image: BGR numpy array
+            pano_id: Panorama ID
+            zoom: Zoom level
+        
+        Returns:
+            Path to saved image or None if encoding failed
+        """
+        image_bytes = self.encode(image)
+        if image_bytes is None:
+            print(f"Error encoding panorama {pano_id}")
+            return None
+        return panorama_cache.save(pano_id, zoom, image_bytes)
+    
+    async def download_and_stitch_async(
+        self,
+        pano_id: str,
+        zoom: int,
+        progress_callback=None,
+        downloader=None
+    ) -> Optional[Path]:
+        """
+        Download tiles and stitch into complete panorama (async).
+        
+        Tiles are decoded into the output buffer as they arrive; only the
+        final encode and write run in a worker thread.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            progress_callback: Optional callback(current, total)
+            downloader: TilesDownloader to use (default: the shared one);
+                callers on another event loop pass their own
+        
+        Returns:
+            Path to saved panorama or None if failed
+        """
+        if panorama_cache.has(pano_id, zoom):
+            return panorama_cache.get(pano_id, zoom)
+        
+        derived = await asyncio.to_thread(panorama_cache.derive_lower_zoom, pano_id, zoom)
+        if derived is not None:
+            return derived
+        
+        if cv2 is None:
+            raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+        
+        if downloader is None:
+            from .tiles_downloader import get_tiles_downloader
+            downloader = get_tiles_downloader()
+        
+        if settings.PANORAMA_STORE_TILES:
+            # Lossless: keep the encoded tiles, no decode at download time
+            tiles = await downloader.download_all_tiles_async(pano_id, zoom, progress_callback)
+            if tiles is None:
+                return None
+            return await asyncio.to_thread(self.stitch_and_save, tiles, pano_id, zoom)
+        
+        image = await downloader.download_panorama_async(pano_id, zoom, progress_callback)
+        if image is None:
+            return None
+        
+        return await asyncio.to_thread(self.save_array, image, pano_id, zoom)
 
 
 # Global instance
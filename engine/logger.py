@@ -4,6 +4,8 @@ Logger - Logs session events in JSON Lines format.
 Records actions, observations, and session summaries for analysis and replay.
 """
 import json
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Optional, Any, List
@@ -11,16 +13,24 @@ from dataclasses import asdict
 
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from config.settings import LOGS_DIR
+from config.settings import settings, LOGS_DIR
 from .session_manager import Session, SessionState
 
 
+# Write paths remembered per worker (sessions ended by another worker are never closed here)
+_LOG_PATHS_SIZE = 1024
+
+
 class SessionLogger:
     """
     Logs session events to JSON Lines files.
     
     Each session gets its own log file: {session_id}.jsonl
     Log entries include timestamps, actions, states, and observations.
+    
+    With a shared session store (several worker processes) a session's
+    entries may come from any worker, so files are opened in append mode
+    for each entry instead of staying open in the worker that started it.
     """
     
     def __init__(self, logs_dir: Optional[Path] = None):
@@ -33,6 +43,9 @@ class SessionLogger:
         self.logs_dir = logs_dir or LOGS_DIR
         self.logs_dir.mkdir(parents=True, exist_ok=True)
         self._file_handles: Dict[str, Any] = {}
+        self._log_paths: OrderedDict = OrderedDict()
+        self._paths_lock = threading.Lock()
+        self._keep_open = settings.SESSION_STORE == "memory"
     
     def _find_log_path(self, session_id: str) -> Path:
         """
@@ -54,6 +67,20 @@ class SessionLogger:
         """Get the log file path for a session."""
         return self._find_log_path(session_id)
     
+    def _get_write_path(self, session_id: str) -> Path:
+        """Get the log file path entries of a session are appended to (LRU of resolved paths)."""
+        with self._paths_lock:
+            log_path = self._log_paths.get(session_id)
+            if log_path is not None:
+                self._log_paths.move_to_end(session_id)
+                return log_path
+        log_path = self._get_log_path(session_id)
+        with self._paths_lock:
+            self._log_paths[session_id] = log_path
+            while len(self._log_paths) > _LOG_PATHS_SIZE:
+                self._log_paths.popitem(last=False)
+        return log_path
+    
     def _get_file_handle(self, session_id: str):
         """Get or create file handle for a session."""
         if session_id not in self._file_handles:
@@ -63,8 +90,14 @@ class SessionLogger:
     
     def _write_entry(self, session_id: str, entry: Dict):
         """Write a log entry."""
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        if not self._keep_open:
+            # One append per entry: lines from different workers never interleave
+            with open(self._get_write_path(session_id), 'a', encoding='utf-8') as f:
+                f.write(line)
+            return
         f = self._get_file_handle(session_id)
-        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.write(line)
         f.flush()
     
     def log_session_start(self, session: Session):
@@ -161,8 +194,19 @@ class SessionLogger:
         # Close file handle
         self._close_session_log(session.session_id)
     
+    def close_session_log(self, session_id: str):
+        """Close the log file of a session that leaves memory without a session end."""
+        self._close_session_log(session_id)
+    
+    @property
+    def open_files(self) -> int:
+        """Number of log files held open."""
+        return len(self._file_handles)
+    
     def _close_session_log(self, session_id: str):
         """Close the log file for a session."""
+        with self._paths_lock:
+            self._log_paths.pop(session_id, None)
         if session_id in self._file_handles:
             self._file_handles[session_id].close()
             del self._file_handles[session_id]
@@ -2,8 +2,14 @@
 Metadata Fetcher - Downloads panorama metadata from Google APIs.
 
 Fetches:
-- Coordinates (lat/lng) and capture date via Static API
-- Adjacent panorama links via Maps JS API (Selenium)
+- Coordinates (lat/lng) and capture date via Static API (async client on a
+  shared keep-alive pool, one in-flight request per pano_id)
+- Adjacent panorama links via a pluggable LinksBackend:
+  - SeleniumLinksBackend: Maps JS API StreetViewService in headless Chrome;
+    each page loads the API once and resolves a whole batch of pano IDs
+    with concurrent getPanorama calls
+  - ReplayLinksBackend: local stand-in serving a JSON fixture or the
+    metadata cache (tests, offline runs)
 """
 import os
 import sys
@@ -12,7 +18,9 @@ import time
 import random
 import requests
 import asyncio
+import aiohttp
 import threading
+from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
@@ -21,17 +29,65 @@ from concurrent.futures import ThreadPoolExecutor
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config.settings import settings
 from cache.metadata_cache import metadata_cache
+from cache.negative_cache import negative_cache
+from engine.api_key_pool import ApiKeyPool, KEY_STATUSES, get_key_pool
 
 
+BASIC_METADATA_URL = "https://maps.googleapis.com/maps/api/streetview/metadata"
+
+# API statuses that mean the panorama does not exist (remembered in negative_cache)
+NEGATIVE_STATUSES = ("ZERO_RESULTS", "NOT_FOUND")
+
+# Failures that say nothing about the panorama itself: local (driver), key-level
+# or transient server errors. They are retried but never negative-cached.
+UNRECORDED_STATUSES = ("DRIVER_ERROR", "UNKNOWN_ERROR", *KEY_STATUSES)
+
+# Page that loads the Maps JS API once; window.fetchPanos(ids, done) resolves
+# a batch of panoramas concurrently and calls done([[pano_id, result], ...])
+_LINKS_PAGE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <script src="https://maps.googleapis.com/maps/api/js?key={api_key}"></script>
+</head>
+<body>
+    <script>
+        window.fetchPanos = function(ids, done) {{
+            const sv = new google.maps.StreetViewService();
+            Promise.all(ids.map(id => new Promise(resolve => {{
+                sv.getPanorama({{pano: id}}, function(data, status) {{
+                    if (status === "OK") {{
+                        const links = (data.links || []).map(link => ({{
+                            panoId: link.pano,
+                            heading: link.heading,
+                            description: link.description || ""
+                        }}));
+                        const centerHeading = data.tiles ? data.tiles.centerHeading : 0;
+                        resolve([id, {{links: links, centerHeading: centerHeading}}]);
+                    }} else {{
+                        resolve([id, {{status: String(status)}}]);
+                    }}
+                }});
+            }}))).then(done);
+        }};
+    </script>
+</body>
+</html>
+'''
+
 
 class MetadataFetcherWorker:
     """
     Single worker that manages one Selenium instance.
+    
+    The worker keeps one page with the Maps JS API loaded and reuses it for
+    every batch; the page is reloaded only after an error or a key change.
     """
     def __init__(self, api_key: str, driver_path: str = None):
         self.api_key = api_key
         self.driver_path = driver_path
         self.driver = None
+        self.page_ready = False
         self._init_driver()
         
     def _init_driver(self):
@@ -55,77 +111,72 @@ class MetadataFetcherWorker:
         except Exception as e:
             print(f"[Worker] Failed to init driver: {e}")
             self.driver = None
-
-    def fetch_links(self, pano_id: str) -> Optional[Dict]:
-        """Fetch links using this worker's Selenium instance."""
+        self.page_ready = False
+    
+    def _load_page(self):
+        """Load the Maps JS API page (once per driver)."""
+        from selenium.webdriver.support.ui import WebDriverWait
+        
+        # Using data URL to avoid file I/O
+        self.driver.get("data:text/html;charset=utf-8," + _LINKS_PAGE.format(api_key=self.api_key))
+        WebDriverWait(self.driver, 15).until(
+            lambda d: d.execute_script(
+                "return typeof google !== 'undefined' && !!google.maps && !!window.fetchPanos"
+            )
+        )
+        self.driver.set_script_timeout(30)
+        self.page_ready = True
+    
+    def use_key(self, api_key: str):
+        """Switch to another API key (the page is reloaded with it on the next batch)."""
+        if api_key != self.api_key:
+            self.api_key = api_key
+            self.page_ready = False
+    
+    def fetch_links_batch(self, pano_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Resolve a batch of panoramas on this worker's page.
+        
+        Args:
+            pano_ids: Panorama IDs
+        
+        Returns:
+            Dict mapping pano_id to {'links', 'centerHeading'} on success or
+            {'status': <StreetViewStatus>} on failure
+        """
         if not self.driver:
             self._init_driver()
             if not self.driver:
-                return None
-        
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.support.ui import WebDriverWait
-        from selenium.webdriver.support import expected_conditions as EC
-        
-        html_content = f'''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <script src="https://maps.googleapis.com/maps/api/js?key={self.api_key}"></script>
-        </head>
-        <body>
-            <div id="result"></div>
-            <script>
-                const sv = new google.maps.StreetViewService();
-                sv.getPanorama({{pano: "{pano_id}"}}, function(data, status) {{
-                    if (status === "OK") {{
-                        const links = data.links || [];
-                        const linksData = links.map(link => ({{
-                            panoId: link.pano,
-                            heading: link.heading,
-                            description: link.description || ""
-                        }}));
-                        const centerHeading = data.tiles ? data.tiles.centerHeading : 0;
-                        const result = {{
-                            links: linksData,
-                            centerHeading: centerHeading
-                        }};
-                        document.getElementById("result").textContent = JSON.stringify(result);
-                    }} else {{
-                        document.getElementById("result").textContent = "ERROR:" + status;
-                    }}
-                }});
-            </script>
-        </body>
-        </html>
-        '''
+                return {pano_id: {'status': 'DRIVER_ERROR'} for pano_id in pano_ids}
         
         try:
-            # Using data URL to avoid file I/O
-            self.driver.get("data:text/html;charset=utf-8," + html_content)
-            
-            # Wait for result to be populated (non-empty text)
-            WebDriverWait(self.driver, 10).until(
-                lambda d: d.find_element(By.ID, "result").text.strip() != ""
+            if not self.page_ready:
+                self._load_page()
+            pairs = self.driver.execute_async_script(
+                "window.fetchPanos(arguments[0], arguments[arguments.length - 1]);",
+                list(pano_ids)
             )
-            
-            element = self.driver.find_element(By.ID, "result")
-            
-            result_text = element.text
-            if result_text.startswith("ERROR:"):
-                # ZERO_RESULTS is common and not an error
-                if "ZERO_RESULTS" not in result_text:
-                     print(f"[Worker] API Error: {result_text}")
-                return None
-            
-            return json.loads(result_text)
-            
         except Exception as e:
             print(f"[Worker] Selenium error: {e}")
             # Restart driver on error
             self.quit()
             self._init_driver()
+            return {pano_id: {'status': 'DRIVER_ERROR'} for pano_id in pano_ids}
+        
+        results = {pano_id: result for pano_id, result in pairs}
+        for pano_id, result in results.items():
+            status = result.get('status')
+            # ZERO_RESULTS is common and not an error
+            if status and status != 'ZERO_RESULTS':
+                print(f"[Worker] API Error for {pano_id}: {status}")
+        return results
+    
+    def fetch_links(self, pano_id: str) -> Optional[Dict]:
+        """Fetch links for one panorama (None if not found or failed)."""
+        result = self.fetch_links_batch([pano_id]).get(pano_id)
+        if result is None or 'links' not in result:
             return None
+        return result
 
     def quit(self):
         """Clean up resources."""
@@ -135,78 +186,250 @@ class MetadataFetcherWorker:
             except:
                 pass
             self.driver = None
+        self.page_ready = False
+
+
+class LinksBackend(ABC):
+    """
+    Source of panorama links (StreetViewService.getPanorama results).
+    
+    fetch_batch() resolves up to `batch_size` pano IDs in one call and
+    returns, per ID, either {'links': [...], 'centerHeading': float} or
+    {'status': <error status>} (e.g. 'ZERO_RESULTS').
+    """
+    
+    batch_size: int = 1
+    concurrency: int = 1
+    # False for stand-ins whose misses say nothing about the real API
+    authoritative: bool = True
+    
+    async def start(self):
+        """Acquire resources (browsers, fixtures)."""
+    
+    async def close(self):
+        """Release resources."""
+    
+    @abstractmethod
+    async def fetch_batch(self, pano_ids: List[str]) -> Dict[str, Dict]:
+        """Resolve up to `batch_size` pano IDs (result per ID as above)."""
+
+
+class SeleniumLinksBackend(LinksBackend):
+    """
+    Resolves links with a pool of headless Chrome pages (one per worker).
+    
+    Workers load the Maps JS API with the pool's keys in turn, so quota is
+    spread over all configured keys. A worker whose key is cooling down
+    (OVER_QUERY_LIMIT / REQUEST_DENIED) reloads its page with a ready key
+    before its next batch.
+    """
+    
+    def __init__(self, key_pool: ApiKeyPool, num_workers: int = 4, batch_size: int = None):
+        """
+        Args:
+            key_pool: API keys to load pages with
+            num_workers: Number of parallel Selenium instances
+            batch_size: Pano IDs resolved per page call
+        """
+        self.key_pool = key_pool
+        self.concurrency = num_workers
+        self.batch_size = batch_size or settings.METADATA_LINKS_BATCH_SIZE
+        self.workers: List[MetadataFetcherWorker] = []
+        self.worker_queue = asyncio.Queue()
+    
+    async def start(self):
+        # 1. Resolve driver path ONCE
+        from webdriver_manager.chrome import ChromeDriverManager
+        print("[MetadataFetcher] Checking ChromeDriver version...")
+        # Use loop.run_in_executor because install() is blocking network IO
+        loop = asyncio.get_running_loop()
+        driver_path = await loop.run_in_executor(None, lambda: ChromeDriverManager().install())
+        print(f"[MetadataFetcher] Driver ready at: {driver_path}")
+        
+        print(f"[MetadataFetcher] Initializing {self.concurrency} Selenium workers...")
+        
+        # Create workers in thread pool to avoid blocking
+        keys = self.key_pool.keys or [""]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [
+                loop.run_in_executor(executor, MetadataFetcherWorker, keys[i % len(keys)], driver_path)
+                for i in range(self.concurrency)
+            ]
+            self.workers = await asyncio.gather(*futures)
+        
+        # Add to queue
+        self.worker_queue = asyncio.Queue()
+        for worker in self.workers:
+            self.worker_queue.put_nowait(worker)
+    
+    async def close(self):
+        # Graceful shutdown (Try to quit drivers first)
+        for i, worker in enumerate(self.workers):
+            try:
+                print(f"[MetadataFetcher] Closing worker {i+1}...")
+                # Run quit in thread to avoid blocking loop if it hangs
+                await asyncio.to_thread(worker.quit)
+            except Exception as e:
+                print(f"[MetadataFetcher] Error closing worker {i+1}: {e}")
+        self.workers = []
+    
+    async def fetch_batch(self, pano_ids: List[str]) -> Dict[str, Dict]:
+        # Borrow a worker; the blocking Selenium call runs in a thread
+        worker = await self.worker_queue.get()
+        try:
+            if self.key_pool.keys and not self.key_pool.is_ready(worker.api_key, 'maps_js'):
+                key = await self.key_pool.acquire('maps_js')
+                if key is None:
+                    # Every key is cooling down for longer than API_KEY_MAX_WAIT
+                    return {pano_id: {'status': 'OVER_QUERY_LIMIT'} for pano_id in pano_ids}
+                worker.use_key(key)
+            else:
+                self.key_pool.record(worker.api_key, 'maps_js')
+            results = await asyncio.to_thread(worker.fetch_links_batch, pano_ids)
+        finally:
+            self.worker_queue.put_nowait(worker)
+        statuses = [KEY_STATUSES.get(r.get('status'), 200) for r in results.values()]
+        self.key_pool.report(worker.api_key, 'maps_js', max(statuses, default=200))
+        return results
+
+
+class ReplayLinksBackend(LinksBackend):
+    """
+    Local stand-in that never touches the network.
+    
+    Serves links from a JSON fixture ({pano_id: {"links": [...],
+    "centerHeading": ...} or null}) or, without a fixture, replays what is
+    already in the metadata cache. Unknown panoramas report ZERO_RESULTS.
+    """
+    
+    def __init__(self, fixture_path: Optional[Path] = None, batch_size: int = 100):
+        """
+        Args:
+            fixture_path: JSON fixture file (defaults to the metadata cache)
+            batch_size: Pano IDs resolved per call
+        """
+        self.fixture_path = Path(fixture_path) if fixture_path else None
+        self.batch_size = batch_size
+        self.concurrency = 1
+        self.authoritative = False
+        self.fixture: Optional[Dict[str, Optional[Dict]]] = None
+    
+    async def start(self):
+        if self.fixture_path is not None:
+            with open(self.fixture_path, 'r', encoding='utf-8') as f:
+                self.fixture = json.load(f)
+    
+    def _lookup(self, pano_id: str) -> Optional[Dict]:
+        if self.fixture is not None:
+            return self.fixture.get(pano_id)
+        record = metadata_cache.get(pano_id)
+        if record is None or record.get('source') != 'maps_js_api':
+            return None
+        return {'links': record['links'], 'centerHeading': record['center_heading'] or 0}
+    
+    async def fetch_batch(self, pano_ids: List[str]) -> Dict[str, Dict]:
+        results = {}
+        for pano_id in pano_ids:
+            result = self._lookup(pano_id)
+            results[pano_id] = result if result is not None else {'status': 'ZERO_RESULTS'}
+        return results
+
+
+def create_links_backend(key_pool: ApiKeyPool, num_workers: int = 4) -> LinksBackend:
+    """Build the links backend selected by settings.METADATA_LINKS_BACKEND."""
+    if settings.METADATA_LINKS_BACKEND == "replay":
+        return ReplayLinksBackend(settings.METADATA_LINKS_FIXTURE or None)
+    return SeleniumLinksBackend(key_pool, num_workers)
 
 
 class MetadataFetcher:
     """
-    Fetches panorama metadata using a pool of Selenium workers.
+    Fetches panorama metadata; links come from a LinksBackend.
+    
+    Concurrent fetch_links() calls are coalesced into backend batches:
+    requests arriving within METADATA_LINKS_BATCH_WINDOW seconds (or until
+    a batch is full) are resolved together. Results of fetch_and_cache_async()
+    are written to the metadata cache in group commits the same way.
     """
     
-    def __init__(self, api_key: Optional[str] = None, num_workers: int = 4):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        num_workers: int = 4,
+        links_backend: Optional[LinksBackend] = None
+    ):
         """
-        Initialize with API key and worker pool.
+        Initialize with API key and links backend.
         
         Args:
-            api_key: Google API Key
+            api_key: Google API Key (default: the configured key pool)
             num_workers: Number of parallel Selenium instances (default: 4)
+            links_backend: Links source (default: per settings)
         """
-        self.api_key = api_key or settings.GOOGLE_API_KEY
+        self.key_pool = get_key_pool(api_key)
         self.num_workers = num_workers
-        self.workers: List[MetadataFetcherWorker] = []
-        self.worker_queue = asyncio.Queue()
+        self.links_backend = links_backend or create_links_backend(self.key_pool, num_workers)
         self.is_initialized = False
         self._lock = asyncio.Lock()
+        
+        # Links batching state (pano_id -> future of its backend result)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: set = set()
+        self._batch_slots = asyncio.Semaphore(self.links_backend.concurrency)
+        
+        # Basic metadata: keep-alive pools (one per event loop) and
+        # single-flight requests
+        self.http_session = requests.Session()
+        self._aio_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._aio_lock = threading.Lock()
+        self._basic_inflight: Dict[str, asyncio.Future] = {}
+        
+        # Group-commit queue for metadata_cache writes
+        self._write_queue: List[Tuple[Dict, asyncio.Future]] = []
+        self._write_handle: Optional[asyncio.TimerHandle] = None
+    
+    @property
+    def max_in_flight(self) -> int:
+        """Number of pano lookups the backend can serve at once."""
+        return self.links_backend.concurrency * self.links_backend.batch_size
     
     async def initialize(self):
-        """Initialize worker pool asynchronously."""
+        """Initialize the links backend asynchronously."""
         async with self._lock:
             if self.is_initialized:
                 return
             
-            # 1. Resolve driver path ONCE
-            from webdriver_manager.chrome import ChromeDriverManager
-            print("[MetadataFetcher] Checking ChromeDriver version...")
             try:
-                # Use loop.run_in_executor because install() is blocking network IO
-                loop = asyncio.get_running_loop()
-                driver_path = await loop.run_in_executor(None, lambda: ChromeDriverManager().install())
-                print(f"[MetadataFetcher] Driver ready at: {driver_path}")
+                await self.links_backend.start()
             except Exception as e:
-                print(f"[MetadataFetcher] Failed to install driver: {e}")
+                print(f"[MetadataFetcher] Failed to start links backend: {e}")
                 return
-
-            print(f"[MetadataFetcher] Initializing {self.num_workers} Selenium workers...")
-            
-            # Create workers in thread pool to avoid blocking
-            # loop is already defined above
-            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-                futures = [
-                    loop.run_in_executor(executor, MetadataFetcherWorker, self.api_key, driver_path)
-                    for _ in range(self.num_workers)
-                ]
-                self.workers = await asyncio.gather(*futures)
-            
-            # Add to queue
-            for worker in self.workers:
-                self.worker_queue.put_nowait(worker)
             
             self.is_initialized = True
-            print(f"[MetadataFetcher] Worker pool ready.")
+            print(f"[MetadataFetcher] Links backend ready ({type(self.links_backend).__name__}).")
     
     async def cleanup(self):
-        """Close all workers gracefully."""
+        """Close the links backend gracefully."""
         print("[MetadataFetcher] Cleaning up workers...")
-        
-        # Graceful shutdown (Try to quit drivers first)
-        for i, worker in enumerate(self.workers):
-            try:
-                print(f"[MetadataFetcher] Closing worker {i+1}...")
-                # Run quit in thread to avoid blocking loop if it hangs
-                await asyncio.to_thread(worker.quit)
-            except Exception as e:
-                print(f"[MetadataFetcher] Error closing worker {i+1}: {e}")
-        
-        self.workers = []
+        await self.links_backend.close()
+        self._flush_writes()
+        if self._batch_tasks:
+            await asyncio.gather(*list(self._batch_tasks), return_exceptions=True)
+        with self._aio_lock:
+            sessions = list(self._aio_sessions.items())
+            self._aio_sessions.clear()
+        loop = asyncio.get_running_loop()
+        for owner, session in sessions:
+            if session.closed:
+                continue
+            if owner is loop:
+                await session.close()
+            elif owner.is_running():
+                # Still serving another thread: close it on its own loop
+                asyncio.run_coroutine_threadsafe(session.close(), owner)
+            else:
+                session.detach()
         self.is_initialized = False
         print("[MetadataFetcher] Worker pool shutdown complete.")
     
@@ -215,65 +438,233 @@ class MetadataFetcher:
         Fetch basic metadata (coords, date) via Static API.
         This is lightweight and doesn't need Selenium workers.
         """
-        if not self.api_key:
+        if not len(self.key_pool) or negative_cache.get(pano_id, 'metadata'):
             return None
         
-        url = "https://maps.googleapis.com/maps/api/streetview/metadata"
-        params = {"pano": pano_id, "key": self.api_key}
+        # One attempt per key: throttled or refused keys fail over
+        for _ in range(len(self.key_pool)):
+            key = self.key_pool.acquire_sync('metadata')
+            if key is None:
+                return None
+            params = {"pano": pano_id, "key": key}
+            try:
+                response = self.http_session.get(BASIC_METADATA_URL, params=params, timeout=10)
+                data = response.json() if response.status_code == 200 else {}
+            except Exception:
+                self.key_pool.report(key, 'metadata', 0)
+                return None
+            status = KEY_STATUSES.get(data.get("status"), response.status_code)
+            self.key_pool.report(key, 'metadata', status)
+            if status not in (429, 403):
+                return self._parse_basic_metadata(pano_id, data) if data else None
+        return None
+    
+    @staticmethod
+    def _parse_basic_metadata(pano_id: str, data: Dict) -> Optional[Dict]:
+        """Convert a Static API metadata response to the basic metadata dict."""
+        status = data.get("status")
+        if status in NEGATIVE_STATUSES:
+            negative_cache.add(pano_id, 'metadata', status)
+        if status != "OK":
+            return None
+        return {
+            "pano_id": data["pano_id"],
+            "lat": data["location"]["lat"],
+            "lng": data["location"]["lng"],
+            "capture_date": data.get("date", "")
+        }
+    
+    def _get_aio_session(self) -> aiohttp.ClientSession:
+        """Get the pooled aiohttp session of the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._aio_lock:
+            session = self._aio_sessions.get(loop)
+            if session is None or session.closed:
+                # Forget the pools of finished loops (their sockets close when collected)
+                for dead in [l for l in self._aio_sessions if l.is_closed()]:
+                    self._aio_sessions.pop(dead).detach()
+                connector = aiohttp.TCPConnector(
+                    limit_per_host=settings.METADATA_HOST_CONCURRENCY * max(1, len(self.key_pool)),
+                    ttl_dns_cache=300
+                )
+                session = self._aio_sessions[loop] = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=10)
+                )
+        return session
+    
+    async def _request_basic_metadata(self, pano_id: str) -> Optional[Dict]:
+        """Issue one Static API metadata request (failing over between keys)."""
+        for _ in range(len(self.key_pool)):
+            key = await self.key_pool.acquire('metadata')
+            if key is None:
+                return None
+            params = {"pano": pano_id, "key": key}
+            try:
+                async with self._get_aio_session().get(BASIC_METADATA_URL, params=params) as response:
+                    data = await response.json(content_type=None) if response.status == 200 else {}
+                    status = KEY_STATUSES.get(data.get("status"), response.status)
+            except Exception:
+                self.key_pool.report(key, 'metadata', 0)
+                return None
+            self.key_pool.report(key, 'metadata', status)
+            if status not in (429, 403):
+                return await asyncio.to_thread(self._parse_basic_metadata, pano_id, data) if data else None
+        return None
+    
+    async def fetch_basic_metadata_async(self, pano_id: str) -> Optional[Dict]:
+        """
+        Fetch basic metadata (coords, date) via Static API (async).
+        
+        Uses the shared keep-alive pool; concurrent callers asking for the
+        same pano share one request.
+        
+        Args:
+            pano_id: Panorama ID
+        
+        Returns:
+            Dict with pano_id, lat, lng, capture_date or None
+        """
+        if not len(self.key_pool) or await asyncio.to_thread(negative_cache.get, pano_id, 'metadata'):
+            return None
+        
+        future = self._basic_inflight.get(pano_id)
+        if future is None:
+            future = asyncio.ensure_future(self._request_basic_metadata(pano_id))
+            self._basic_inflight[pano_id] = future
+            future.add_done_callback(lambda _: self._basic_inflight.pop(pano_id, None))
+        return await asyncio.shield(future)
+    
+    def _flush_writes(self):
+        """Write all queued metadata records in one transaction (in a thread)."""
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._write_handle = None
         
+        batch = self._write_queue
+        self._write_queue = []
+        if batch:
+            task = asyncio.ensure_future(self._write_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _write_batch(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        """Persist one group commit and release its waiters."""
+        error = None
         try:
-            response = requests.get(url, params=params, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") == "OK":
-                    return {
-                        "pano_id": data["pano_id"],
-                        "lat": data["location"]["lat"],
-                        "lng": data["location"]["lng"],
-                        "capture_date": data.get("date", "")
-                    }
-        except Exception:
-            pass
-        return None
+            await asyncio.to_thread(metadata_cache.save_many, [record for record, _ in batch])
+        except Exception as e:
+            error = e
+        for _, future in batch:
+            if not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+    
+    async def _save_metadata(self, record: Dict):
+        """Queue a record for the next group commit and wait until it is written."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._write_queue.append((record, future))
+        if len(self._write_queue) >= settings.METADATA_WRITE_BATCH_SIZE:
+            self._flush_writes()
+        elif self._write_handle is None:
+            self._write_handle = loop.call_later(settings.METADATA_WRITE_BATCH_WINDOW, self._flush_writes)
+        await asyncio.shield(future)
+    
+    def _flush(self):
+        """Send all pending pano IDs to the backend in full batches."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        pending = list(self._pending.items())
+        self._pending = {}
+        size = self.links_backend.batch_size
+        for i in range(0, len(pending), size):
+            task = asyncio.ensure_future(self._run_batch(dict(pending[i:i + size])))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _run_batch(self, futures: Dict[str, asyncio.Future]):
+        """Resolve one batch and complete its waiters."""
+        results = {}
+        async with self._batch_slots:
+            try:
+                results = await self.links_backend.fetch_batch(list(futures))
+            except Exception as e:
+                print(f"[MetadataFetcher] Links batch failed: {e}")
+        for pano_id, future in futures.items():
+            if not future.done():
+                future.set_result(results.get(pano_id))
+    
+    async def _fetch_links_once(self, pano_id: str) -> Optional[Dict]:
+        """Queue a pano ID for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(pano_id)
+        if future is None:
+            future = loop.create_future()
+            self._pending[pano_id] = future
+            if len(self._pending) >= self.links_backend.batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(settings.METADATA_LINKS_BATCH_WINDOW, self._flush)
+        return await asyncio.shield(future)
     
     async def fetch_links(self, pano_id: str, max_retries: int = 2) -> Optional[Dict]:
         """
-        Fetch links using a worker from the pool.
+        Fetch links through the backend (batched with concurrent callers).
         
         Args:
             pano_id: Panorama ID
             max_retries: Retry attempts
+        
+        Returns:
+            {'links': [...], 'centerHeading': float} or None
         """
+        if await asyncio.to_thread(negative_cache.get, pano_id, 'links'):
+            return None
         if not self.is_initialized:
             await self.initialize()
-            
-        last_error = None
+        record_negative = self.links_backend.authoritative
+        pano_failed = False
         
         for attempt in range(max_retries + 1):
-            # 1. Borrow a worker
-            worker = await self.worker_queue.get()
-            
-            try:
-                # 2. Run in thread (blocking Selenium op)
-                result = await asyncio.to_thread(worker.fetch_links, pano_id)
-                
-                if result is not None:
+            result = await self._fetch_links_once(pano_id)
+            # None (batch failed) and UNRECORDED_STATUSES are not answers about the panorama
+            pano_failed = result is not None and result.get('status') not in (None, *UNRECORDED_STATUSES)
+            if result is not None:
+                if 'links' in result:
                     return result
-                else:
-                    last_error = "Empty response or API check failed"
-                    
-            except Exception as e:
-                last_error = str(e)
-            finally:
-                # 3. Return worker to queue
-                self.worker_queue.put_nowait(worker)
+                if result.get('status') in NEGATIVE_STATUSES:
+                    # Definitive: the panorama does not exist
+                    if record_negative:
+                        await asyncio.to_thread(negative_cache.add, pano_id, 'links', result['status'])
+                    return None
             
             # Retry delay
             if attempt < max_retries:
                 wait_time = random.uniform(0.5, 1.5)
                 await asyncio.sleep(wait_time)
         
+        if record_negative and pano_failed:
+            await asyncio.to_thread(negative_cache.add, pano_id, 'links', 'ERROR')
         return None
+    
+    async def fetch_links_batch(self, pano_ids: List[str], max_retries: int = 2) -> Dict[str, Optional[Dict]]:
+        """
+        Fetch links for many panoramas at once.
+        
+        Args:
+            pano_ids: Panorama IDs
+            max_retries: Retry attempts per panorama
+        
+        Returns:
+            Dict mapping pano_id to its links result (None if unavailable)
+        """
+        results = await asyncio.gather(*[self.fetch_links(p, max_retries) for p in pano_ids])
+        return dict(zip(pano_ids, results))
 
     async def fetch_and_cache_async(self, pano_id: str) -> bool:
         """
@@ -290,27 +681,26 @@ class MetadataFetcher:
             if metadata_cache.has(pano_id):
                 return True
                 
-            # 2. Fetch basic metadata (lightweight, sync)
-            basic = await asyncio.to_thread(self.fetch_basic_metadata, pano_id)
+            # 2. Fetch basic metadata (lightweight, pooled async client)
+            basic = await self.fetch_basic_metadata_async(pano_id)
             if not basic:
                 return False
                 
-            # 3. Fetch links (heavy, async worker)
+            # 3. Fetch links (heavy, batched backend)
             links_data = await self.fetch_links(pano_id)
             if not links_data:
                 return False
                 
-            # 4. Save to cache
-            await asyncio.to_thread(
-                metadata_cache.save,
-                pano_id=pano_id,
-                lat=basic['lat'],
-                lng=basic['lng'],
-                capture_date=basic['capture_date'],
-                links=links_data.get('links', []),
-                center_heading=links_data.get('centerHeading', 0),
-                source='maps_js_api'
-            )
+            # 4. Save to cache (group commit with concurrent callers)
+            await self._save_metadata({
+                'pano_id': pano_id,
+                'lat': basic['lat'],
+                'lng': basic['lng'],
+                'capture_date': basic['capture_date'],
+                'links': links_data.get('links', []),
+                'center_heading': links_data.get('centerHeading', 0),
+                'source': 'maps_js_api'
+            })
             return True
             
         except Exception as e:
@@ -1,12 +1,23 @@
 """
 ObservationGenerator - Generates agent observations from panorama images.
 
-Uses py360convert for Equirectangular to Perspective projection.
-Produces the view image that agents receive as input.
+Uses PerspectiveProjector (cached remap tables) for Equirectangular to
+Perspective projection, from the full decoded panorama or, with
+settings.PANORAMA_PYRAMID, from the tiles of a mip-mapped pyramid. Produces
+the view image that agents receive as input, as encoded JPEG bytes and
+optionally as a file under temp_images/.
+
+With settings.RENDER_BACKEND = "process", projection + JPEG encode run in
+worker processes (ProcessRenderBackend) while callers stay synchronous.
 """
 import os
+import zlib
+import threading
+import multiprocessing
 from pathlib import Path
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, List
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 
 try:
@@ -14,22 +25,18 @@ try:
 except ImportError:
     cv2 = None
 
-try:
-    import py360convert
-except ImportError:
-    py360convert = None
-
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config.settings import settings, TEMP_IMAGES_DIR
 from cache.panorama_cache import panorama_cache
+from .projection import get_projector
 
 
 class ObservationGenerator:
     """
     Generates perspective view images from equirectangular panoramas.
     
-    Uses py360convert for the projection and OpenCV for image I/O.
+    Uses PerspectiveProjector for the projection and OpenCV for image I/O.
     """
     
     def __init__(
@@ -50,21 +57,22 @@ class ObservationGenerator:
         # Validate dependencies
         if cv2 is None:
             raise ImportError("opencv-python is required. Install with: pip install opencv-python")
-        if py360convert is None:
-            raise ImportError("py360convert is required. Install with: pip install py360convert")
+        
+        self.projector = get_projector()
+        
+        # Background writer for replay images (write="async")
+        self._writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="obs-writer")
     
-    def generate_observation(
+    def render(
         self,
         pano_id: str,
         heading: float,
         pitch: float = 0,
         fov: float = None,
-        zoom: int = None,
-        session_id: Optional[str] = None,
-        step: Optional[int] = None
-    ) -> Optional[Dict]:
+        zoom: int = None
+    ) -> Optional[np.ndarray]:
         """
-        Generate a perspective observation from a panorama.
+        Render a perspective view from a panorama.
         
         Args:
             pano_id: Panorama ID
@@ -72,44 +80,67 @@ class ObservationGenerator:
             pitch: Vertical pitch (-85 to 85)
             fov: Field of view (30-100)
             zoom: Panorama zoom level
-            session_id: Session ID for temp image path
-            step: Step number for temp image naming
             
         Returns:
-            Dict with image_path and metadata, or None if failed
+            BGR image array, or None if the panorama is not cached
+        """
+        return self.render_batch(pano_id, [(heading, pitch)], fov, zoom)[0]
+    
+    def render_batch(
+        self,
+        pano_id: str,
+        views: List[Tuple[float, float]],
+        fov: float = None,
+        zoom: int = None,
+        center_heading: Optional[float] = None
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Render several perspective views from one panorama.
+        
+        The panorama is loaded and its metadata looked up once; all views are
+        sampled in a single remap pass.
+        
+        Args:
+            pano_id: Panorama ID
+            views: List of (heading, pitch) tuples
+            fov: Field of view (30-100)
+            zoom: Panorama zoom level
+            center_heading: Panorama north offset (looked up if None)
+        
+        Returns:
+            List of BGR image arrays (None entries if rendering failed)
         """
         fov = fov or self.default_fov
         zoom = zoom if zoom is not None else settings.PANORAMA_ZOOM_LEVEL
+        failed = [None] * len(views)
         
-        # Get panorama from cache
-        pano_path = panorama_cache.get(pano_id, zoom)
-        if pano_path is None:
-            return None
+        # Tile pyramid (or lossless tile set): decode only the tiles in view
+        # at the needed level
+        use_tiles = settings.PANORAMA_PYRAMID or settings.PANORAMA_STORE_TILES
+        pyramid = panorama_cache.get_pyramid(pano_id, zoom) if use_tiles else None
         
-        # Get centerHeading for coordinate conversion
-        from cache.metadata_cache import metadata_cache
-        metadata = metadata_cache.get(pano_id)
-        center_heading = 0.0
-        if metadata:
-            center_heading = metadata.get('center_heading', 0.0) or 0.0
-        
-        # Load equirectangular image
-        equi_img = cv2.imread(str(pano_path))
-        if equi_img is None:
-            return None
+        # Load equirectangular image (decoded once, shared across sessions)
+        equi_img = None
+        if pyramid is None:
+            equi_img = panorama_cache.get_decoded(pano_id, zoom)
+            if equi_img is None:
+                return failed
         
-        # Convert BGR to RGB for py360convert
-        equi_img = cv2.cvtColor(equi_img, cv2.COLOR_BGR2RGB)
+        # Get centerHeading for coordinate conversion
+        if center_heading is None:
+            center_heading = self._get_center_heading(pano_id)
         
         # Perform projection
-        # py360convert uses:
-        # - h_fov, v_fov for field of view
-        # - u_deg (yaw/heading) and v_deg (pitch)
+        # The projector follows py360convert.e2p conventions:
+        # - (h_fov, v_fov) for field of view
+        # - yaw (heading) and pitch
         # Note: heading in SVS is 0=North, increases clockwise
-        # py360convert uses 0=center of image
+        # The projector uses 0=center of image
         # Convert true north heading to panorama image coordinates
-        # image_u = heading - centerHeading (no 180 offset - py360convert has same convention)
-        image_u = heading - center_heading
+        # image_u = heading - centerHeading (no 180 offset - same convention)
+        # Sampling is channel-agnostic, so the BGR image is used as-is.
+        # pitch: positive=UP, negative=DOWN (matching system prompt)
+        image_views = [(heading - center_heading, pitch) for heading, pitch in views]
         
         # Calculate vertical FOV based on aspect ratio
         width, height = self.output_size
@@ -117,44 +148,215 @@ class ObservationGenerator:
         v_fov = fov / aspect
         
         try:
-            perspective = py360convert.e2p(
+            if pyramid is not None:
+                # Source width that gives ~1 panorama pixel per output pixel
+                level = pyramid.choose_level(width * 360.0 / fov)
+                return [
+                    self.projector.project_tiled(
+                        lambda tx, ty: panorama_cache.get_pyramid_tile(pano_id, zoom, level, tx, ty),
+                        pyramid.level_shape(level),
+                        pyramid.tile_size,
+                        fov_deg=(fov, v_fov),
+                        yaw=image_u,
+                        pitch=pitch,
+                        out_hw=(height, width)
+                    )
+                    for image_u, pitch in image_views
+                ]
+            
+            return self.projector.project_batch(
                 equi_img,
                 fov_deg=(fov, v_fov),
-                u_deg=image_u,
-                v_deg=pitch,  # positive=UP, negative=DOWN (matching system prompt)
-                out_hw=(height, width),
-                mode='bilinear'
+                views=image_views,
+                out_hw=(height, width)
             )
         except Exception as e:
             print(f"Error generating perspective view: {e}")
+            return failed
+    
+    @staticmethod
+    def _get_center_heading(pano_id: str) -> float:
+        """Get the panorama's north offset (0 if unknown)."""
+        from cache.metadata_cache import metadata_cache
+        return metadata_cache.get_center_heading(pano_id) or 0.0
+    
+    def _route(self, pano_id: str) -> int:
+        """Index of the worker that renders a panorama."""
+        return zlib.crc32(pano_id.encode('utf-8')) % self.workers
+    
+    def _on_invalidated(self, pano_id: str, zoom: int):
+        """Panorama cache listener: queue the drop ahead of later renders (same FIFO worker)."""
+        if self._closed:
+            return
+        try:
+            self._pools[self._route(pano_id)].submit(_invalidate_job, pano_id, zoom)
+        except (BrokenProcessPool, RuntimeError):
+            pass  # A restarted worker starts with an empty cache
+    
+    def warm(self, pano_id: str, zoom: int) -> bool:
+        """Load a panorama into the cache of the worker that renders it (blocking)."""
+        try:
+            return self._pools[self._route(pano_id)].submit(warm_panorama, pano_id, zoom).result()
+        except BrokenProcessPool:
+            return False
+    
+    def render_jpeg_batch(
+        self,
+        pano_id: str,
+        views: List[Tuple[float, float]],
+        fov: float = None,
+        zoom: int = None,
+        center_heading: Optional[float] = None
+    ) -> List[Optional[bytes]]:
+        """
+        Render and JPEG-encode several views of one panorama in this process.
+        
+        Args:
+            pano_id: Panorama ID
+            views: List of (heading, pitch) tuples
+            fov: Field of view (30-100)
+            zoom: Panorama zoom level
+            center_heading: Panorama north offset (looked up if None)
+        
+        Returns:
+            List of JPEG bytes (None entries if rendering failed)
+        """
+        images = self.render_batch(pano_id, views, fov, zoom, center_heading)
+        return [self.encode_jpeg(image) if image is not None else None for image in images]
+    
+    @staticmethod
+    def encode_jpeg(image: np.ndarray, quality: int = 90) -> Optional[bytes]:
+        """Encode a BGR image as JPEG bytes."""
+        ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
             return None
+        return buf.tobytes()
+    
+    @staticmethod
+    def _write_file(path: Path, data: bytes):
+        """Write image bytes to disk (used by the background writer)."""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Error writing observation image {path}: {e}")
+    
+    def generate_observation(
+        self,
+        pano_id: str,
+        heading: float,
+        pitch: float = 0,
+        fov: float = None,
+        zoom: int = None,
+        session_id: Optional[str] = None,
+        step: Optional[int] = None,
+        write: str = "sync"
+    ) -> Optional[Dict]:
+        """
+        Generate a perspective observation from a panorama.
         
-        # Convert back to BGR for cv2
-        perspective = cv2.cvtColor(perspective, cv2.COLOR_RGB2BGR)
+        Args:
+            pano_id: Panorama ID
+            heading: Horizontal heading (0-360)
+            pitch: Vertical pitch (-85 to 85)
+            fov: Field of view (30-100)
+            zoom: Panorama zoom level
+            session_id: Session ID for temp image path
+            step: Step number for temp image naming
+            write: How to persist the image file:
+                - "sync": write before returning (served via /temp_images)
+                - "async": queue the write on a background thread (replay only)
+                - "none": don't write; only return the encoded bytes
+        
+        Returns:
+            Dict with image_bytes, image_path and metadata, or None if failed
+        """
+        names = [f"step_{step}"] if step is not None else None
+        return self.generate_observations_batch(
+            pano_id, [(heading, pitch)], fov, zoom,
+            session_id=session_id, step=step, write=write, names=names
+        )[0]
+    
+    def generate_observations_batch(
+        self,
+        pano_id: str,
+        views: List[Tuple[float, float]],
+        fov: float = None,
+        zoom: int = None,
+        session_id: Optional[str] = None,
+        step: Optional[int] = None,
+        write: str = "sync",
+        names: Optional[List[str]] = None
+    ) -> List[Optional[Dict]]:
+        """
+        Generate several perspective observations from one panorama.
+        
+        The panorama is decoded once and all views are rendered in one pass
+        (see render_batch).
+        
+        Args:
+            pano_id: Panorama ID
+            views: List of (heading, pitch) tuples
+            fov: Field of view (30-100)
+            zoom: Panorama zoom level
+            session_id: Session ID for temp image paths
+            step: Step number for temp image naming
+            write: "sync" / "async" / "none" (see generate_observation)
+            names: File stems under temp_images/{session_id}/ per view
+                (default: step_{step}_view{i})
+        
+        Returns:
+            List of observation dicts (None entries for failed views)
+        """
+        fov = fov or self.default_fov
         
-        # Generate output path
-        if session_id and step is not None:
-            session_dir = TEMP_IMAGES_DIR / session_id
-            session_dir.mkdir(parents=True, exist_ok=True)
-            output_path = session_dir / f"step_{step}.jpg"
+        backend = get_render_backend()
+        if backend is not None:
+            encoded = backend.render_jpeg_batch(
+                pano_id, views, fov, zoom,
+                center_heading=self._get_center_heading(pano_id),
+                output_size=self.output_size
+            )
         else:
-            # Temp file for one-off generation
-            import tempfile
-            fd, temp_path = tempfile.mkstemp(suffix='.jpg')
-            os.close(fd)
-            output_path = Path(temp_path)
-        
-        # Save image
-        cv2.imwrite(str(output_path), perspective, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        
-        return {
-            'image_path': str(output_path),
-            'pano_id': pano_id,
-            'heading': heading,
-            'pitch': pitch,
-            'fov': fov,
-            'size': self.output_size
-        }
+            encoded = self.render_jpeg_batch(pano_id, views, fov, zoom)
+        
+        results = []
+        for i, ((heading, pitch), image_bytes) in enumerate(zip(views, encoded)):
+            if image_bytes is None:
+                results.append(None)
+                continue
+            
+            # Generate output path
+            output_path = None
+            if write != "none":
+                if session_id and step is not None:
+                    name = names[i] if names else f"step_{step}_view{i}"
+                    output_path = TEMP_IMAGES_DIR / session_id / f"{name}.jpg"
+                else:
+                    # Temp file for one-off generation
+                    import tempfile
+                    fd, temp_path = tempfile.mkstemp(suffix='.jpg')
+                    os.close(fd)
+                    output_path = Path(temp_path)
+                
+                # Save image
+                if write == "async":
+                    self._writer.submit(self._write_file, output_path, image_bytes)
+                else:
+                    self._write_file(output_path, image_bytes)
+            
+            results.append({
+                'image_bytes': image_bytes,
+                'image_path': str(output_path) if output_path else None,
+                'pano_id': pano_id,
+                'heading': heading,
+                'pitch': pitch,
+                'fov': fov,
+                'size': self.output_size
+            })
+        
+        return results
     
     def generate_observation_base64(
         self,
@@ -179,15 +381,11 @@ class ObservationGenerator:
         """
         import base64
         
-        result = self.generate_observation(pano_id, heading, pitch, fov, zoom)
+        result = self.generate_observation(pano_id, heading, pitch, fov, zoom, write="none")
         if result is None:
             return None
         
-        # Read and encode
-        with open(result['image_path'], 'rb') as f:
-            image_data = f.read()
-        
-        return base64.b64encode(image_data).decode('utf-8')
+        return base64.b64encode(result['image_bytes']).decode('utf-8')
     
     def cleanup_session_images(self, session_id: str):
         """
@@ -196,10 +394,8 @@ class ObservationGenerator:
         Args:
             session_id: Session ID
         """
-        session_dir = TEMP_IMAGES_DIR / session_id
-        if session_dir.exists():
-            import shutil
-            shutil.rmtree(session_dir)
+        from .temp_images import delete_session_images
+        delete_session_images(session_id)
     
     @staticmethod
     def get_session_images(session_id: str) -> list:
@@ -216,12 +412,185 @@ class ObservationGenerator:
         if not session_dir.exists():
             return []
         
-        images = list(session_dir.glob("step_*.jpg"))
+        # Only the main view per step (look-around extras are step_N_<view>.jpg)
+        images = [p for p in session_dir.glob("step_*.jpg") if p.stem[5:].isdigit()]
         # Sort by step number
         images.sort(key=lambda p: int(p.stem.split('_')[1]))
         return [str(p) for p in images]
 
 
+# === Process-pool rendering ===
+
+# Per-process generators inside render workers, keyed by output size
+_worker_generators: Dict[Tuple[int, int], ObservationGenerator] = {}
+_in_render_worker = False
+
+
+def _init_render_worker(memory_budget_bytes: int):
+    """Render worker initializer: split the decoded-panorama budget between workers."""
+    global _in_render_worker
+    _in_render_worker = True
+    panorama_cache.memory.max_bytes = memory_budget_bytes
+
+
+def warm_panorama(pano_id: str, zoom: int) -> bool:
+    """Load a stored panorama into this process's memory cache (what its renders read)."""
+    if settings.PANORAMA_PYRAMID or settings.PANORAMA_STORE_TILES:
+        return panorama_cache.get_pyramid(pano_id, zoom) is not None
+    return panorama_cache.get_decoded(pano_id, zoom) is not None
+
+
+def _invalidate_job(pano_id: str, zoom: int):
+    """Render worker job: drop a panorama the parent replaced or deleted."""
+    panorama_cache.invalidate(pano_id, zoom)
+
+
+def _render_jpeg_batch_job(
+    pano_id: str,
+    views: List[Tuple[float, float]],
+    fov: float,
+    zoom: Optional[int],
+    center_heading: float,
+    output_size: Tuple[int, int]
+) -> List[Optional[bytes]]:
+    """Render worker job: project + encode, return JPEG bytes."""
+    generator = _worker_generators.get(output_size)
+    if generator is None:
+        generator = ObservationGenerator(output_size=output_size)
+        _worker_generators[output_size] = generator
+    return generator.render_jpeg_batch(pano_id, views, fov, zoom, center_heading)
+
+
+class ProcessRenderBackend:
+    """
+    Runs projection + JPEG encode in worker processes.
+    
+    Each worker is its own single-process pool, and a panorama is always
+    routed to the same worker so that worker's decoded-panorama LRU stays
+    hot. When the parent's panorama cache replaces or deletes a panorama,
+    the owning worker is told to drop it before its next render. With the
+    raw memmap tier enabled, workers also share panorama pages through the
+    OS page cache. Calls block until the result is ready, so callers keep a
+    synchronous API.
+    """
+    
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Start the worker processes.
+        
+        Args:
+            workers: Number of worker processes (default: settings or CPU count)
+        """
+        self.workers = workers or settings.RENDER_PROCESS_WORKERS or os.cpu_count() or 1
+        # Each worker gets an equal share of the decoded-panorama budget
+        self._worker_budget = (settings.PANORAMA_MEMORY_CACHE_MB * 1024 * 1024) // self.workers
+        self._pools = [self._new_pool() for _ in range(self.workers)]
+        self._lock = threading.Lock()
+        self._closed = False
+        panorama_cache.add_invalidation_listener(self._on_invalidated)
+    
+    def _new_pool(self) -> ProcessPoolExecutor:
+        """Start one single-process worker."""
+        # spawn: forking a heavily threaded parent is unsafe
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_worker,
+            initargs=(self._worker_budget,)
+        )
+    
+    def _route(self, pano_id: str) -> int:
+        """Index of the worker that renders a panorama."""
+        return zlib.crc32(pano_id.encode('utf-8')) % self.workers
+    
+    def _on_invalidated(self, pano_id: str, zoom: int):
+        """Panorama cache listener: queue the drop ahead of later renders (same FIFO worker)."""
+        if self._closed:
+            return
+        try:
+            self._pools[self._route(pano_id)].submit(_invalidate_job, pano_id, zoom)
+        except (BrokenProcessPool, RuntimeError):
+            pass  # A restarted worker starts with an empty cache
+    
+    def warm(self, pano_id: str, zoom: int) -> bool:
+        """Load a panorama into the cache of the worker that renders it (blocking)."""
+        try:
+            return self._pools[self._route(pano_id)].submit(warm_panorama, pano_id, zoom).result()
+        except BrokenProcessPool:
+            return False
+    
+    def render_jpeg_batch(
+        self,
+        pano_id: str,
+        views: List[Tuple[float, float]],
+        fov: float,
+        zoom: Optional[int],
+        center_heading: float,
+        output_size: Tuple[int, int]
+    ) -> List[Optional[bytes]]:
+        """
+        Render and encode views in a worker process (blocking).
+        
+        Args:
+            pano_id: Panorama ID
+            views: List of (heading, pitch) tuples
+            fov: Field of view (30-100)
+            zoom: Panorama zoom level
+            center_heading: Panorama north offset
+            output_size: Output image size (width, height)
+        
+        Returns:
+            List of JPEG bytes (None entries if rendering failed)
+        """
+        index = self._route(pano_id)
+        args = (pano_id, list(views), fov, zoom, center_heading, tuple(output_size))
+        pool = self._pools[index]
+        try:
+            return pool.submit(_render_jpeg_batch_job, *args).result()
+        except BrokenProcessPool:
+            # Worker died (e.g. out of memory); replace it and retry once
+            print(f"[RenderBackend] Worker {index} died, restarting")
+            with self._lock:
+                if self._pools[index] is pool:
+                    self._pools[index] = self._new_pool()
+            return self._pools[index].submit(_render_jpeg_batch_job, *args).result()
+    
+    def shutdown(self):
+        """Stop all worker processes."""
+        self._closed = True
+        for pool in self._pools:
+            pool.shutdown(wait=True)
+
+
+_render_backend: Optional[ProcessRenderBackend] = None
+_render_backend_lock = threading.Lock()
+
+
+def get_render_backend() -> Optional[ProcessRenderBackend]:
+    """
+    Get the process render backend if settings.RENDER_BACKEND is "process".
+    
+    Returns None for the inline backend and inside render workers.
+    """
+    global _render_backend
+    if settings.RENDER_BACKEND != "process" or _in_render_worker:
+        return None
+    if _render_backend is None:
+        with _render_backend_lock:
+            if _render_backend is None:
+                _render_backend = ProcessRenderBackend()
+    return _render_backend
+
+
+def close_render_backend():
+    """Stop the render worker processes, if the process backend was started."""
+    global _render_backend
+    with _render_backend_lock:
+        backend, _render_backend = _render_backend, None
+    if backend is not None:
+        backend.shutdown()
+
+
 # Global instance (lazy initialization to avoid import errors)
 _observation_generator: Optional[ObservationGenerator] = None
 
@@ -0,0 +1,347 @@
+"""
+PanoramaPrefetcher - Background download of panoramas an agent may visit next.
+
+After each step the panoramas reachable from the agent's position are
+queued in BFS-ring order (ring 0 is the current panorama, ring 1 its linked
+neighbors, ...; within a ring, the ones closest to the agent's heading
+first). A worker thread with its own event loop downloads, stitches and
+decodes them into the memory cache, so the next move rarely lands on a cold
+panorama.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings
+from cache.panorama_cache import panorama_cache
+from .geofence_checker import geofence_checker
+
+
+# Panoramas remembered as already on disk (pyramid mode has no whole-image LRU entry;
+# in JPEG mode the memory LRU alone tells whether a panorama is warm)
+_READY_SIZE = 4096
+
+
+class _QueueEntry:
+    """A queued panorama with its best priority and the sessions that want it."""
+    
+    def __init__(self, priority: Tuple[int, float]):
+        self.priority = priority
+        self.owners: Set[str] = set()
+
+
+class PanoramaPrefetcher:
+    """
+    Bounded, prioritized prefetch queue shared by all sessions.
+    
+    Each session has one plan: scheduling from a new position replaces the
+    session's queued entries. Entries wanted by several sessions are fetched
+    once. When the queue is full the farthest entries are dropped. Ending a
+    session drops its entries and cancels downloads nobody else wants.
+    """
+    
+    def __init__(
+        self,
+        depth: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        """
+        Initialize the prefetcher (the worker thread starts on first use).
+        
+        Args:
+            depth: BFS rings to prefetch (default: settings)
+            max_queue: Queue capacity (default: settings)
+            concurrency: Panoramas fetched at once (default: settings)
+        """
+        self.depth = depth if depth is not None else settings.SESSION_PREFETCH_DEPTH
+        self.max_queue = max_queue or settings.SESSION_PREFETCH_QUEUE_SIZE
+        self.concurrency = concurrency or settings.SESSION_PREFETCH_CONCURRENCY
+        self.enabled = settings.SESSION_PREFETCH_ENABLED
+        
+        self._lock = threading.Lock()
+        self._queued: Dict[Tuple[str, int], _QueueEntry] = {}
+        self._running: Dict[Tuple[str, int], Tuple[asyncio.Task, Set[str]]] = {}
+        self._ready: OrderedDict = OrderedDict()
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._downloader = None
+        panorama_cache.add_invalidation_listener(self._forget)
+        
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.cancelled = 0
+    
+    # === Scheduling (any thread) ===
+    
+    @staticmethod
+    def _angle_between(a: float, b: float) -> float:
+        return abs((a - b + 180) % 360 - 180)
+    
+    def _plan(
+        self,
+        geofence: Optional[str],
+        pano_id: str,
+        heading: float
+    ) -> List[Tuple[str, Tuple[int, float]]]:
+        """BFS over the move tables: (pano_id, (ring, angle of first hop from heading))."""
+        plan = [(pano_id, (0, 0.0))]
+        seen = {pano_id}
+        frontier: List[Tuple[str, Optional[float]]] = [(pano_id, None)]
+        for ring in range(1, self.depth + 1):
+            next_frontier = []
+            for current, angle in frontier:
+                for neighbor, link_heading, _ in geofence_checker.get_move_table(geofence, current):
+                    if neighbor in seen:
+                        continue
+                    seen.add(neighbor)
+                    # Later rings inherit the direction of the move that leads to them
+                    first_hop = angle if angle is not None else self._angle_between(link_heading, heading)
+                    plan.append((neighbor, (ring, first_hop)))
+                    next_frontier.append((neighbor, first_hop))
+            frontier = next_frontier
+        return plan
+    
+    @staticmethod
+    def _pyramid_mode() -> bool:
+        return settings.PANORAMA_PYRAMID or settings.PANORAMA_STORE_TILES
+    
+    def _is_warm(self, key: Tuple[str, int]) -> bool:
+        """Check (without I/O) whether a panorama needs no prefetch."""
+        if key in panorama_cache.memory:
+            return True
+        # Decoded images can be evicted from the LRU behind our back; on-disk pyramids stay
+        return self._pyramid_mode() and key in self._ready
+    
+    def _forget(self, pano_id: str, zoom: int):
+        """Panorama cache listener: the stored panorama changed or was deleted."""
+        with self._lock:
+            self._ready.pop((pano_id, zoom), None)
+    
+    def schedule(
+        self,
+        session_id: str,
+        geofence: Optional[str],
+        pano_id: str,
+        heading: float = 0.0,
+        zoom: Optional[int] = None
+    ) -> int:
+        """
+        Queue the panoramas around a session's position.
+        
+        Args:
+            session_id: Session the plan belongs to
+            geofence: Geofence the session moves in
+            pano_id: Current panorama
+            heading: Agent heading (neighbors ahead come first)
+            zoom: Zoom level (default: settings.PANORAMA_ZOOM_LEVEL)
+        
+        Returns:
+            Number of panoramas queued for this session
+        """
+        if not self.enabled:
+            return 0
+        zoom = zoom if zoom is not None else settings.PANORAMA_ZOOM_LEVEL
+        plan = self._plan(geofence, pano_id, heading)
+        
+        queued = 0
+        with self._lock:
+            self._drop_owner(session_id)
+            for plan_pano_id, priority in plan:
+                key = (plan_pano_id, zoom)
+                if key in self._running:
+                    self._running[key][1].add(session_id)
+                    continue
+                if self._is_warm(key):
+                    continue
+                entry = self._queued.get(key)
+                if entry is None:
+                    entry = self._queued[key] = _QueueEntry(priority)
+                    self.scheduled += 1
+                entry.priority = min(entry.priority, priority)
+                entry.owners.add(session_id)
+                queued += 1
+            
+            # Bounded queue: drop the farthest panoramas
+            while len(self._queued) > self.max_queue:
+                key = max(self._queued, key=lambda k: self._queued[k].priority)
+                del self._queued[key]
+                self.dropped += 1
+        
+        if queued:
+            self._ensure_started()
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return queued
+    
+    def _drop_owner(self, session_id: str):
+        """Remove a session from queued entries (caller holds the lock)."""
+        for key in list(self._queued):
+            entry = self._queued[key]
+            entry.owners.discard(session_id)
+            if not entry.owners:
+                del self._queued[key]
+    
+    def cancel_session(self, session_id: str):
+        """
+        Forget a session's plan and cancel downloads only it wanted.
+        
+        Args:
+            session_id: Session ID
+        """
+        with self._lock:
+            self._drop_owner(session_id)
+            orphaned = []
+            for task, owners in self._running.values():
+                if session_id in owners:
+                    owners.discard(session_id)
+                    if not owners:
+                        orphaned.append(task)
+        for task in orphaned:
+            self._loop.call_soon_threadsafe(task.cancel)
+    
+    # === Worker (prefetch thread) ===
+    
+    def _ensure_started(self):
+        """Start the worker thread and its event loop."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._wakeup = asyncio.Event()
+            self._thread = threading.Thread(target=self._run, name="panorama-prefetch", daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        for _ in range(self.concurrency):
+            self._loop.create_task(self._worker())
+        self._loop.run_forever()
+    
+    def _pop(self) -> Optional[Tuple[Tuple[str, int], Set[str]]]:
+        """Take the nearest queued panorama."""
+        with self._lock:
+            if not self._queued:
+                return None
+            key = min(self._queued, key=lambda k: self._queued[k].priority)
+            entry = self._queued.pop(key)
+            return key, entry.owners
+    
+    async def _worker(self):
+        while True:
+            item = self._pop()
+            if item is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            
+            key, owners = item
+            task = asyncio.ensure_future(self._fetch(*key))
+            with self._lock:
+                self._running[key] = (task, owners)
+            try:
+                await asyncio.wait([task])
+            finally:
+                with self._lock:
+                    self._running.pop(key, None)
+            
+            if task.cancelled():
+                self.cancelled += 1
+            elif task.exception() is not None or not task.result():
+                if task.exception() is not None:
+                    print(f"[Prefetcher] Error prefetching {key[0]}: {task.exception()}")
+                self.failed += 1
+            else:
+                self.completed += 1
+    
+    def _get_downloader(self):
+        """TilesDownloader bound to this thread's event loop (own connection pool)."""
+        if self._downloader is None:
+            from .tiles_downloader import TilesDownloader
+            try:
+                self._downloader = TilesDownloader()
+            except ValueError:
+                return None  # No API key: only panoramas already on disk are warmed
+        return self._downloader
+    
+    @staticmethod
+    def _warm(pano_id: str, zoom: int) -> bool:
+        """Load a stored panorama into the memory cache the renderer reads."""
+        from .observation_generator import get_render_backend, warm_panorama
+        # Process backend: the routed render worker's cache, not this process's
+        backend = get_render_backend()
+        if backend is not None:
+            return backend.warm(pano_id, zoom)
+        return warm_panorama(pano_id, zoom)
+    
+    async def _fetch(self, pano_id: str, zoom: int) -> bool:
+        """Download (if needed) and decode one panorama."""
+        from .image_stitcher import image_stitcher
+        
+        if not await asyncio.to_thread(panorama_cache.has, pano_id, zoom):
+            downloader = self._get_downloader()
+            if downloader is None:
+                return False
+            path = await image_stitcher.download_and_stitch_async(pano_id, zoom, downloader=downloader)
+            if path is None:
+                return False
+        
+        if not await asyncio.to_thread(self._warm, pano_id, zoom):
+            return False
+        if not self._pyramid_mode():
+            return True
+        with self._lock:
+            self._ready[(pano_id, zoom)] = True
+            self._ready.move_to_end((pano_id, zoom))
+            while len(self._ready) > _READY_SIZE:
+                self._ready.popitem(last=False)
+        return True
+    
+    async def _close(self):
+        for task in asyncio.all_tasks():
+            if task is not asyncio.current_task():
+                task.cancel()
+        if self._downloader is not None:
+            await self._downloader.close()
+    
+    def shutdown(self, timeout: float = 5.0):
+        """Cancel all prefetches and stop the worker thread."""
+        with self._lock:
+            self._queued.clear()
+            thread, loop = self._thread, self._loop
+            self._thread = None
+        if thread is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._close(), loop)
+        try:
+            future.result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        self._downloader = None
+    
+    def get_stats(self) -> dict:
+        """Get prefetch statistics."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queued': len(self._queued),
+                'running': len(self._running),
+                'scheduled': self.scheduled,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'cancelled': self.cancelled
+            }
+
+
+# Global instance
+panorama_prefetcher = PanoramaPrefetcher()
@@ -0,0 +1,571 @@
+"""
+PreloadJobManager - Persistent, resumable panorama preload jobs.
+
+A job downloads the metadata and image of a list of panoramas at one zoom
+level. Jobs and the state of each of their panoramas ('pending', 'done',
+'failed') are stored in the SQLite cache, so after a restart unfinished jobs
+continue with the panoramas still pending instead of starting from zero.
+All jobs share one concurrency budget, a panorama wanted by several running
+jobs (overlapping geofences) is fetched once, and jobs can be cancelled.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings, DATA_DIR
+from cache.cache_manager import cache_manager
+from .api_key_pool import api_key_pool
+from .geofence_checker import geofence_checker
+
+
+# Job statuses that still have work to do
+ACTIVE_STATUSES = ('pending', 'in_progress')
+
+
+def load_whitelist_file(path: Path) -> Dict[str, List[str]]:
+    """
+    Load a whitelist file ({list_name: [pano_id, ...]}).
+    
+    Args:
+        path: Path to the JSON file
+    
+    Returns:
+        Dict of lists (empty if the file is missing or invalid)
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def resolve_whitelist(name: str) -> Optional[List[str]]:
+    """
+    Get the panoramas of a named list.
+    
+    Looks in the loaded geofence config first, then in
+    settings.PRELOAD_WHITELIST_PATHS (geofence, height and perception
+    whitelists).
+    
+    Args:
+        name: Geofence / whitelist list name
+    
+    Returns:
+        List of panorama IDs or None if no list has this name
+    """
+    geofence = geofence_checker.get_geofence(name)
+    if geofence:
+        return sorted(geofence)
+    for path in settings.PRELOAD_WHITELIST_PATHS:
+        lists = load_whitelist_file(path)
+        if name in lists:
+            return list(lists[name])
+    return None
+
+
+class _JobRun:
+    """In-memory state of a running job."""
+    
+    def __init__(self, job_id: str, name: str, zoom: int, total: int, done: int, failed: int):
+        self.job_id = job_id
+        self.name = name
+        self.zoom = zoom
+        self.total = total
+        self.done = done
+        self.failed = failed
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+        # (state, pano_id) results not yet committed
+        self.results: List[Tuple[str, str]] = []
+
+
+class PreloadJobManager:
+    """
+    Runs preload jobs on the server's event loop.
+    
+    Progress is committed in groups of settings.PRELOAD_FLUSH_SIZE
+    panoramas; after a crash at most one group is fetched again (cheaply,
+    since the files are already cached). A job submitted for a name and
+    zoom that is already running returns the running job. Running jobs
+    touch their row every PRELOAD_HEARTBEAT_SECONDS, so a job that another
+    worker process is running is not resumed a second time.
+    """
+    
+    def __init__(self, concurrency: Optional[int] = None):
+        """
+        Initialize the manager.
+        
+        Args:
+            concurrency: Panoramas fetched at once across all jobs
+                (default: PRELOAD_CONCURRENCY_PER_KEY per configured API key)
+        """
+        self.concurrency = concurrency or settings.PRELOAD_CONCURRENCY_PER_KEY * max(1, len(api_key_pool))
+        self.flush_size = settings.PRELOAD_FLUSH_SIZE
+        self._runs: Dict[str, _JobRun] = {}
+        # (pano_id, zoom) -> (fetch task, job IDs waiting for it)
+        self._inflight: Dict[Tuple[str, int], Tuple[asyncio.Task, Set[str]]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._resume_lock_fd: Optional[int] = None
+        # (name, zoom) -> set once a job being submitted has started
+        self._creating: Dict[Tuple[str, int], asyncio.Event] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._resuming: Set[str] = set()
+        self._deferred: Set[asyncio.Task] = set()
+        self.stale_after = 3 * settings.PRELOAD_HEARTBEAT_SECONDS
+    
+    # === Jobs ===
+    
+    def _generate_job_id(self, name: str, zoom: int) -> str:
+        """Generate a unique job ID."""
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        return f"{name}_z{zoom}_{timestamp}"
+    
+    async def submit(self, name: str, pano_ids: Iterable[str], zoom: Optional[int] = None) -> dict:
+        """
+        Create a job and start it (the panorama rows are inserted in a thread).
+        
+        Args:
+            name: Job name (task ID, geofence or whitelist name)
+            pano_ids: Panoramas to preload (duplicates are dropped)
+            zoom: Zoom level (default: settings.PANORAMA_ZOOM_LEVEL)
+        
+        Returns:
+            Job dict (the running job if one exists for this name and zoom)
+        """
+        zoom = zoom if zoom is not None else settings.PANORAMA_ZOOM_LEVEL
+        key = (name, zoom)
+        while key in self._creating:
+            await self._creating[key].wait()
+        for run in self._runs.values():
+            if run.name == name and run.zoom == zoom and not run.cancelled:
+                return await asyncio.to_thread(self.get_job, run.job_id)
+        
+        created = self._creating[key] = asyncio.Event()
+        try:
+            pano_ids = list(dict.fromkeys(pano_ids))
+            job_id = self._generate_job_id(name, zoom)
+            await asyncio.to_thread(self._insert_job, job_id, name, zoom, pano_ids)
+            self._start(job_id, name, zoom, len(pano_ids), 0, 0)
+        finally:
+            del self._creating[key]
+            created.set()
+        return await asyncio.to_thread(self.get_job, job_id)
+    
+    def _start(self, job_id: str, name: str, zoom: int, total: int, done: int, failed: int):
+        run = _JobRun(job_id, name, zoom, total, done, failed)
+        self._runs[job_id] = run
+        run.task = asyncio.create_task(self._run(run))
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._beat())
+    
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job. Downloads that other running jobs also wait for continue.
+        
+        Args:
+            job_id: Job ID
+        
+        Returns:
+            True if the job was running or waiting to be resumed
+        """
+        run = self._runs.get(job_id)
+        if run is not None:
+            run.cancelled = True
+            run.task.cancel()
+            return True
+        return await asyncio.to_thread(self._cancel_stored, job_id)
+    
+    def _cancel_stored(self, job_id: str) -> bool:
+        job = self.get_job(job_id)
+        if job is None or job['status'] not in ACTIVE_STATUSES:
+            return False
+        self._set_status(job_id, 'cancelled', "Cancelled")
+        return True
+    
+    async def resume(self, job_id: str, retry_failed: bool = True) -> Optional[dict]:
+        """
+        Restart an unfinished, cancelled or partly failed job.
+        
+        Args:
+            job_id: Job ID
+            retry_failed: Also fetch the panoramas that failed before
+        
+        Returns:
+            Job dict or None if the job does not exist
+        """
+        if job_id in self._runs or job_id in self._resuming:
+            return await asyncio.to_thread(self.get_job, job_id)
+        self._resuming.add(job_id)
+        try:
+            job, start = await asyncio.to_thread(self._prepare_resume, job_id, retry_failed)
+            if not start:
+                return job
+            self._start(job_id, job['name'], job['zoom'], job['total'], job['done'], job['failed'])
+        finally:
+            self._resuming.discard(job_id)
+        return await asyncio.to_thread(self.get_job, job_id)
+    
+    def _prepare_resume(self, job_id: str, retry_failed: bool) -> Tuple[Optional[dict], bool]:
+        """Reset a job's stored state for a restart: (job, whether to start it)."""
+        job = self.get_job(job_id)
+        if job is None:
+            return None, False
+        if self._running_elsewhere(job_id):
+            return job, False
+        
+        if retry_failed and job['failed']:
+            with cache_manager.get_connection() as conn:
+                conn.execute(
+                    "UPDATE preload_job_panos SET state = 'pending' WHERE job_id = ? AND state = 'failed'",
+                    (job_id,)
+                )
+                conn.execute('UPDATE preload_jobs SET failed = 0 WHERE job_id = ?', (job_id,))
+            job['failed'] = 0
+        if job['done'] + job['failed'] >= job['total']:
+            return job, False
+        
+        self._set_status(job_id, 'pending', f"Resuming at {job['done'] + job['failed']}/{job['total']}")
+        return job, True
+    
+    def _claim_resume(self) -> bool:
+        """
+        With several worker processes, let only one of them resume jobs.
+        The first worker to start takes a lock file and keeps it until it exits.
+        """
+        if fcntl is None or self._resume_lock_fd is not None:
+            return True
+        fd = os.open(str(DATA_DIR / "preload.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._resume_lock_fd = fd
+        return True
+    
+    async def resume_all(self) -> int:
+        """
+        Restart the jobs left unfinished by a previous run of the server.
+        
+        Returns:
+            Number of jobs resumed (0 in all but one worker process)
+        """
+        if not self._claim_resume():
+            return 0
+        job_ids = await asyncio.to_thread(self._active_job_ids)
+        
+        resumed = 0
+        for job_id in job_ids:
+            job = await self.resume(job_id, retry_failed=False)
+            if job_id in self._runs:
+                resumed += 1
+            elif job is not None and job['status'] in ACTIVE_STATUSES:
+                # Another worker, or a process that just died: look again once it would be stale
+                task = asyncio.create_task(self._resume_later(job_id))
+                self._deferred.add(task)
+                task.add_done_callback(self._deferred.discard)
+        if resumed:
+            print(f"[Preload] Resumed {resumed} unfinished preload jobs")
+        return resumed
+    
+    async def _resume_later(self, job_id: str):
+        await asyncio.sleep(self.stale_after)
+        await self.resume(job_id, retry_failed=False)
+    
+    async def shutdown(self):
+        """Stop all jobs; they stay unfinished and are resumed on next start."""
+        for task in list(self._deferred):
+            task.cancel()
+        runs = list(self._runs.values())
+        for run in runs:
+            run.task.cancel()
+        await asyncio.gather(*(run.task for run in runs), return_exceptions=True)
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+    
+    # === Worker (event loop) ===
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+    
+    async def _run(self, run: _JobRun):
+        """Fetch the pending panoramas of a job."""
+        waiters: Set[asyncio.Task] = set()
+        try:
+            pano_ids = await asyncio.to_thread(self._pending_panos, run.job_id)
+            await asyncio.to_thread(
+                self._set_status, run.job_id, 'in_progress', f"Processed {run.done + run.failed}/{run.total} panoramas"
+            )
+            print(f"[Preload] Job {run.job_id}: {len(pano_ids)}/{run.total} panoramas pending (zoom {run.zoom})")
+            
+            semaphore = self._get_semaphore()
+            for pano_id in pano_ids:
+                key = (pano_id, run.zoom)
+                if key not in self._inflight:
+                    await semaphore.acquire()
+                    if key in self._inflight:
+                        # Another job started it while we waited for the budget
+                        semaphore.release()
+                    else:
+                        fetch = asyncio.create_task(self._fetch(pano_id, run.zoom))
+                        self._inflight[key] = (fetch, set())
+                        fetch.add_done_callback(lambda _, key=key, fetch=fetch: self._fetch_done(key, fetch))
+                
+                fetch, owners = self._inflight[key]
+                owners.add(run.job_id)
+                waiter = asyncio.create_task(self._wait(run, pano_id, fetch))
+                waiters.add(waiter)
+                waiter.add_done_callback(waiters.discard)
+            
+            if waiters:
+                await asyncio.gather(*waiters)
+            await asyncio.to_thread(self._flush, run)
+            
+            message = f"Completed preloading {run.total} panoramas."
+            if run.failed:
+                message = f"Completed preloading {run.total} panoramas ({run.failed} failed)."
+            await asyncio.to_thread(self._set_status, run.job_id, 'completed', message)
+            print(f"[Preload] Finished {run.job_id}: {run.done} done, {run.failed} failed")
+        
+        except asyncio.CancelledError:
+            for waiter in list(waiters):
+                waiter.cancel()
+            self._release(run.job_id)
+            await asyncio.to_thread(self._flush, run)
+            if run.cancelled:
+                await asyncio.to_thread(
+                    self._set_status, run.job_id, 'cancelled', f"Cancelled at {run.done + run.failed}/{run.total}"
+                )
+                print(f"[Preload] Cancelled {run.job_id}")
+            raise
+        
+        except Exception as e:
+            print(f"[Preload] Job {run.job_id} failed: {e}")
+            for waiter in list(waiters):
+                waiter.cancel()
+            self._release(run.job_id)
+            await asyncio.to_thread(self._flush, run)
+            await asyncio.to_thread(self._set_status, run.job_id, 'failed', str(e))
+        
+        finally:
+            self._runs.pop(run.job_id, None)
+    
+    async def _beat(self):
+        """Touch the rows of this process's running jobs while there are any."""
+        while self._runs:
+            await asyncio.sleep(settings.PRELOAD_HEARTBEAT_SECONDS)
+            job_ids = list(self._runs)
+            if job_ids:
+                await asyncio.to_thread(self._touch, job_ids)
+    
+    def _fetch_done(self, key: Tuple[str, int], fetch: asyncio.Task):
+        """Return the budget and forget a finished fetch."""
+        self._get_semaphore().release()
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is fetch:
+            del self._inflight[key]
+    
+    def _release(self, job_id: str):
+        """Drop a job from in-flight fetches and cancel those nobody else waits for."""
+        for fetch, owners in list(self._inflight.values()):
+            if job_id in owners:
+                owners.discard(job_id)
+                if not owners:
+                    fetch.cancel()
+    
+    async def _wait(self, run: _JobRun, pano_id: str, fetch: asyncio.Task):
+        """Wait for a (possibly shared) fetch and record its result."""
+        try:
+            ok = await asyncio.shield(fetch)
+        except asyncio.CancelledError:
+            if not fetch.cancelled():
+                raise
+            return  # The fetch itself was cancelled: the panorama stays pending
+        
+        if ok:
+            run.done += 1
+        else:
+            run.failed += 1
+        run.results.append(('done' if ok else 'failed', pano_id))
+        if len(run.results) >= self.flush_size:
+            status = await asyncio.to_thread(self._flush, run)
+            if status == 'cancelled' and not run.cancelled:
+                # Cancelled through another worker process
+                run.cancelled = True
+                run.task.cancel()
+    
+    @staticmethod
+    async def _fetch(pano_id: str, zoom: int) -> bool:
+        """Fetch metadata and image of one panorama (each is skipped if cached)."""
+        from .image_stitcher import image_stitcher
+        from .metadata_fetcher import metadata_fetcher
+        
+        try:
+            metadata_ok = await metadata_fetcher.fetch_and_cache_async(pano_id)
+            path = await image_stitcher.download_and_stitch_async(pano_id, zoom)
+            return metadata_ok and path is not None
+        except Exception as e:
+            print(f"[Preload] Error processing {pano_id}: {e}")
+            return False
+    
+    # === Storage ===
+    
+    @staticmethod
+    def _insert_job(job_id: str, name: str, zoom: int, pano_ids: List[str]):
+        with cache_manager.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO preload_jobs (job_id, name, zoom, status, total, message)
+                VALUES (?, ?, ?, 'pending', ?, ?)
+            ''', (job_id, name, zoom, len(pano_ids),
+                  f"Preloading {len(pano_ids)} panoramas at zoom level {zoom}"))
+            conn.executemany(
+                'INSERT INTO preload_job_panos (job_id, pano_id) VALUES (?, ?)',
+                [(job_id, pano_id) for pano_id in pano_ids]
+            )
+    
+    @staticmethod
+    def _active_job_ids() -> List[str]:
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                f"SELECT job_id FROM preload_jobs WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))}) ORDER BY rowid",
+                ACTIVE_STATUSES
+            )
+            return [row['job_id'] for row in cursor.fetchall()]
+    
+    @staticmethod
+    def _touch(job_ids: List[str]):
+        with cache_manager.get_connection() as conn:
+            conn.execute(
+                f"UPDATE preload_jobs SET updated_at = CURRENT_TIMESTAMP "
+                f"WHERE job_id IN ({','.join('?' * len(job_ids))}) AND status = 'in_progress'",
+                job_ids
+            )
+    
+    def _running_elsewhere(self, job_id: str) -> bool:
+        """Whether another worker process runs a job (active and touched within stale_after)."""
+        if job_id in self._runs:
+            return False
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                f"SELECT (julianday('now') - julianday(updated_at)) * 86400 AS age FROM preload_jobs "
+                f"WHERE job_id = ? AND status IN ({','.join('?' * len(ACTIVE_STATUSES))})",
+                (job_id, *ACTIVE_STATUSES)
+            )
+            row = cursor.fetchone()
+        return row is not None and row['age'] is not None and row['age'] < self.stale_after
+    
+    def _pending_panos(self, job_id: str) -> List[str]:
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT pano_id FROM preload_job_panos WHERE job_id = ? AND state = 'pending' ORDER BY rowid",
+                (job_id,)
+            )
+            return [row['pano_id'] for row in cursor.fetchall()]
+    
+    def _flush(self, run: _JobRun) -> Optional[str]:
+        """
+        Commit buffered panorama results and the job counters in one transaction.
+        
+        Returns:
+            Stored job status (None if nothing was buffered)
+        """
+        results, run.results = run.results, []
+        if not results:
+            return None
+        with cache_manager.get_connection() as conn:
+            conn.executemany(
+                'UPDATE preload_job_panos SET state = ? WHERE job_id = ? AND pano_id = ?',
+                [(state, run.job_id, pano_id) for state, pano_id in results]
+            )
+            conn.execute('''
+                UPDATE preload_jobs SET
+                    done = (SELECT COUNT(*) FROM preload_job_panos WHERE job_id = ? AND state = 'done'),
+                    failed = (SELECT COUNT(*) FROM preload_job_panos WHERE job_id = ? AND state = 'failed'),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ?
+            ''', (run.job_id, run.job_id, run.job_id))
+            cursor = conn.execute('SELECT status FROM preload_jobs WHERE job_id = ?', (run.job_id,))
+            row = cursor.fetchone()
+        return row['status'] if row else None
+    
+    def _set_status(self, job_id: str, status: str, message: Optional[str] = None):
+        with cache_manager.get_connection() as conn:
+            conn.execute('''
+                UPDATE preload_jobs SET status = ?, message = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE job_id = ?
+            ''', (status, message, job_id))
+    
+    def _row_to_job(self, row) -> dict:
+        job = dict(row)
+        run = self._runs.get(job['job_id'])
+        if run is not None:
+            # Counters of a running job include results not committed yet
+            job['done'], job['failed'] = run.done, run.failed
+        return job
+    
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """
+        Get a job.
+        
+        Returns:
+            Dict with job_id, name, zoom, status, total, done, failed,
+            message, created_at, updated_at (None if not found)
+        """
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute('SELECT * FROM preload_jobs WHERE job_id = ?', (job_id,))
+            row = cursor.fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def get_latest_job(self, name: str) -> Optional[dict]:
+        """Get the most recently created job with a name."""
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                'SELECT * FROM preload_jobs WHERE name = ? ORDER BY rowid DESC LIMIT 1',
+                (name,)
+            )
+            row = cursor.fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """
+        List jobs, newest first.
+        
+        Args:
+            status: Only jobs with this status
+            limit: Maximum number of jobs
+        """
+        with cache_manager.get_connection() as conn:
+            if status:
+                cursor = conn.execute(
+                    'SELECT * FROM preload_jobs WHERE status = ? ORDER BY rowid DESC LIMIT ?',
+                    (status, limit)
+                )
+            else:
+                cursor = conn.execute('SELECT * FROM preload_jobs ORDER BY rowid DESC LIMIT ?', (limit,))
+            return [self._row_to_job(row) for row in cursor.fetchall()]
+    
+    def get_stats(self) -> dict:
+        """Get scheduler statistics."""
+        return {
+            'running_jobs': len(self._runs),
+            'inflight': len(self._inflight),
+            'concurrency': self.concurrency
+        }
+
+
+# Global instance
+preload_manager = PreloadJobManager()
@@ -0,0 +1,433 @@
+"""
+PerspectiveProjector - Equirectangular to perspective projection with cached remap tables.
+
+The unit-ray grid for a given (out_hw, h_fov, v_fov) is computed once and
+reused; each view only rotates it with a single 3x3 matmul. The resulting
+float32 remap tables are cached per quantized (yaw, pitch) and sampled with
+cv2.remap. Output matches py360convert.e2p conventions.
+
+project_tiled() renders from a tiled panorama (see cache.panorama_pyramid),
+fetching only the tiles the view's remap tables actually touch.
+"""
+import math
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple, Optional, Callable, List
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings
+
+
+class PerspectiveProjector:
+    """
+    Renders perspective views from equirectangular panoramas.
+    
+    Caches:
+    - Unit-ray grids keyed by (out_hw, h_fov, v_fov)
+    - Remap tables keyed by (in_hw, out_hw, h_fov, v_fov, yaw, pitch),
+      with yaw/pitch quantized to settings.RENDER_ANGLE_QUANTUM degrees
+    """
+    
+    def __init__(
+        self,
+        max_cached_maps: Optional[int] = None,
+        angle_quantum: Optional[float] = None
+    ):
+        """
+        Initialize the projector.
+        
+        Args:
+            max_cached_maps: Maximum number of remap tables to keep (LRU)
+            angle_quantum: Yaw/pitch quantization step in degrees
+        """
+        if cv2 is None:
+            raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+        
+        self.max_cached_maps = max_cached_maps if max_cached_maps is not None else settings.RENDER_MAP_CACHE_SIZE
+        self.angle_quantum = angle_quantum or settings.RENDER_ANGLE_QUANTUM
+        
+        self._rays: dict = {}
+        self._maps: OrderedDict = OrderedDict()
+        self._plans: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _quantize(self, angle: float) -> float:
+        """Snap an angle (degrees) to the cache quantum."""
+        return round(angle / self.angle_quantum) * self.angle_quantum
+    
+    def _get_unit_rays(
+        self,
+        out_hw: Tuple[int, int],
+        h_fov: float,
+        v_fov: float
+    ) -> np.ndarray:
+        """
+        Get the camera-space ray grid for an output size and FOV.
+        
+        Args:
+            out_hw: Output (height, width)
+            h_fov: Horizontal FOV in degrees
+            v_fov: Vertical FOV in degrees
+        
+        Returns:
+            Read-only float32 array of shape (H*W, 3)
+        """
+        key = (out_hw, h_fov, v_fov)
+        rays = self._rays.get(key)
+        if rays is not None:
+            return rays
+        
+        out_h, out_w = out_hw
+        x_max = math.tan(math.radians(h_fov) / 2)
+        y_max = math.tan(math.radians(v_fov) / 2)
+        x_rng = np.linspace(-x_max, x_max, num=out_w, dtype=np.float32)
+        y_rng = np.linspace(y_max, -y_max, num=out_h, dtype=np.float32)
+        
+        rays = np.ones((out_h, out_w, 3), np.float32)
+        rays[..., 0] = x_rng[None, :]
+        rays[..., 1] = y_rng[:, None]
+        rays = rays.reshape(-1, 3)
+        rays.setflags(write=False)
+        
+        self._rays[key] = rays
+        return rays
+    
+    @staticmethod
+    def _rotation(yaw: float, pitch: float) -> np.ndarray:
+        """
+        Build the combined row-vector rotation (pitch about X, then yaw about Y).
+        
+        Args:
+            yaw: Heading in image coordinates (degrees, + right)
+            pitch: Pitch in degrees (+ up)
+        """
+        u = -math.radians(yaw)
+        v = math.radians(pitch)
+        cu, su = math.cos(u), math.sin(u)
+        cv, sv = math.cos(v), math.sin(v)
+        rx = np.array([[1, 0, 0], [0, cv, -sv], [0, sv, cv]], dtype=np.float32)
+        ry = np.array([[cu, 0, su], [0, 1, 0], [-su, 0, cu]], dtype=np.float32)
+        return rx @ ry
+    
+    def _build_maps(
+        self,
+        in_hw: Tuple[int, int],
+        out_hw: Tuple[int, int],
+        h_fov: float,
+        v_fov: float,
+        yaw: float,
+        pitch: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute float32 remap tables for one view."""
+        in_h, in_w = in_hw
+        out_h, out_w = out_hw
+        
+        xyz = self._get_unit_rays(out_hw, h_fov, v_fov) @ self._rotation(yaw, pitch)
+        x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+        
+        u = np.arctan2(x, z)
+        v = np.arctan2(y, np.hypot(x, z))
+        
+        map_x = (u * (in_w / (2 * np.pi)) + (0.5 * in_w - 0.5)).astype(np.float32)
+        map_y = (v * (-in_h / np.pi) + (0.5 * in_h - 0.5)).astype(np.float32)
+        # Rows never wrap; clamp so BORDER_WRAP only applies across the horizontal seam
+        np.clip(map_y, 0, in_h - 1, out=map_y)
+        
+        return map_x.reshape(out_h, out_w), map_y.reshape(out_h, out_w)
+    
+    def get_maps(
+        self,
+        in_hw: Tuple[int, int],
+        out_hw: Tuple[int, int],
+        h_fov: float,
+        v_fov: float,
+        yaw: float,
+        pitch: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get (possibly cached) remap tables for a view.
+        
+        Args:
+            in_hw: Panorama (height, width)
+            out_hw: Output (height, width)
+            h_fov: Horizontal FOV in degrees
+            v_fov: Vertical FOV in degrees
+            yaw: Heading in image coordinates (degrees)
+            pitch: Pitch in degrees
+        
+        Returns:
+            Tuple of (map_x, map_y) float32 arrays
+        """
+        yaw = self._quantize(((yaw + 180) % 360) - 180)
+        pitch = self._quantize(pitch)
+        key = (in_hw, out_hw, h_fov, v_fov, yaw, pitch)
+        
+        with self._lock:
+            maps = self._maps.get(key)
+            if maps is not None:
+                self._maps.move_to_end(key)
+                self.hits += 1
+                return maps
+            self.misses += 1
+        
+        maps = self._build_maps(in_hw, out_hw, h_fov, v_fov, yaw, pitch)
+        
+        if self.max_cached_maps > 0:
+            with self._lock:
+                self._maps[key] = maps
+                self._maps.move_to_end(key)
+                while len(self._maps) > self.max_cached_maps:
+                    self._maps.popitem(last=False)
+        
+        return maps
+    
+    def project(
+        self,
+        equi_img: np.ndarray,
+        fov_deg: Tuple[float, float],
+        yaw: float,
+        pitch: float,
+        out_hw: Tuple[int, int]
+    ) -> np.ndarray:
+        """
+        Render a perspective view (bilinear) from an equirectangular image.
+        
+        Channel order is preserved, so BGR input yields BGR output.
+        
+        Args:
+            equi_img: Equirectangular image (H, W[, C])
+            fov_deg: (h_fov, v_fov) in degrees
+            yaw: Heading in image coordinates (degrees, 0 = image center)
+            pitch: Pitch in degrees (positive = up)
+            out_hw: Output (height, width)
+        
+        Returns:
+            Perspective image of shape out_hw (+ channels)
+        """
+        map_x, map_y = self.get_maps(
+            equi_img.shape[:2], tuple(out_hw),
+            float(fov_deg[0]), float(fov_deg[1]),
+            yaw, pitch
+        )
+        return cv2.remap(
+            equi_img, map_x, map_y,
+            interpolation=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_WRAP
+        )
+    
+    def project_batch(
+        self,
+        equi_img: np.ndarray,
+        fov_deg: Tuple[float, float],
+        views: List[Tuple[float, float]],
+        out_hw: Tuple[int, int]
+    ) -> List[np.ndarray]:
+        """
+        Render several perspective views of one panorama into one buffer.
+        
+        Remap tables come from the shared cache and each view is sampled
+        straight into its slice of a single preallocated output array.
+        
+        Args:
+            equi_img: Equirectangular image (H, W[, C])
+            fov_deg: (h_fov, v_fov) in degrees
+            views: List of (yaw, pitch) in image coordinates (degrees)
+            out_hw: Output (height, width)
+        
+        Returns:
+            List of perspective images of shape out_hw, in view order
+        """
+        out_h, out_w = out_hw
+        out = np.empty((len(views), out_h, out_w) + equi_img.shape[2:], dtype=equi_img.dtype)
+        
+        for i, (yaw, pitch) in enumerate(views):
+            map_x, map_y = self.get_maps(
+                equi_img.shape[:2], (out_h, out_w),
+                float(fov_deg[0]), float(fov_deg[1]),
+                yaw, pitch
+            )
+            cv2.remap(
+                equi_img, map_x, map_y,
+                interpolation=cv2.INTER_LINEAR,
+                borderMode=cv2.BORDER_WRAP,
+                dst=out[i]
+            )
+        
+        return list(out)
+    
+    def get_tile_plan(
+        self,
+        in_hw: Tuple[int, int],
+        tile_size: int,
+        out_hw: Tuple[int, int],
+        h_fov: float,
+        v_fov: float,
+        yaw: float,
+        pitch: float
+    ) -> Tuple[range, List[int], np.ndarray, np.ndarray, bool]:
+        """
+        Work out which tiles a view needs and remap tables into their mosaic.
+        
+        Columns are the shortest circular run of tile columns covering every
+        pixel bilinear sampling reads; rows are a contiguous range.
+        
+        Args:
+            in_hw: Panorama level (height, width); width must be a multiple of tile_size
+            tile_size: Tile edge length
+            out_hw: Output (height, width)
+            h_fov: Horizontal FOV in degrees
+            v_fov: Vertical FOV in degrees
+            yaw: Heading in image coordinates (degrees)
+            pitch: Pitch in degrees
+        
+        Returns:
+            Tuple of (tile rows, tile columns in mosaic order, map_x, map_y,
+            wraps) where wraps is True if all columns are used (seam wraps)
+        """
+        yaw = self._quantize(((yaw + 180) % 360) - 180)
+        pitch = self._quantize(pitch)
+        key = (in_hw, tile_size, out_hw, h_fov, v_fov, yaw, pitch)
+        
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+        
+        in_h, in_w = in_hw
+        n_cols = in_w // tile_size
+        map_x, map_y = self._build_maps(in_hw, out_hw, h_fov, v_fov, yaw, pitch)
+        
+        # Bilinear sampling reads floor(x) and floor(x) + 1 (wrapped)
+        x0 = np.floor(map_x).astype(np.int32)
+        used = np.zeros(n_cols, dtype=bool)
+        used[np.unique((x0 % in_w) // tile_size)] = True
+        used[np.unique(((x0 + 1) % in_w) // tile_size)] = True
+        
+        y0 = np.floor(map_y).astype(np.int32)
+        rows = range(int(y0.min()) // tile_size, min(int(y0.max()) + 1, in_h - 1) // tile_size + 1)
+        
+        if used.all():
+            cols = list(range(n_cols))
+            wraps = True
+        else:
+            # Start right after the longest circular gap of unused columns
+            best_len, best_end, run = 0, 0, 0
+            for i in range(2 * n_cols):
+                if used[i % n_cols]:
+                    run = 0
+                else:
+                    run += 1
+                    if run > best_len:
+                        best_len, best_end = run, i
+            start = (best_end + 1) % n_cols
+            cols = [(start + k) % n_cols for k in range(n_cols - best_len)]
+            wraps = False
+        
+        local_x = np.mod(map_x - cols[0] * tile_size, in_w).astype(np.float32)
+        local_y = (map_y - rows.start * tile_size).astype(np.float32)
+        plan = (rows, cols, local_x, local_y, wraps)
+        
+        if self.max_cached_maps > 0:
+            with self._lock:
+                self._plans[key] = plan
+                self._plans.move_to_end(key)
+                while len(self._plans) > self.max_cached_maps:
+                    self._plans.popitem(last=False)
+        
+        return plan
+    
+    def project_tiled(
+        self,
+        get_tile: Callable[[int, int], Optional[np.ndarray]],
+        in_hw: Tuple[int, int],
+        tile_size: int,
+        fov_deg: Tuple[float, float],
+        yaw: float,
+        pitch: float,
+        out_hw: Tuple[int, int]
+    ) -> Optional[np.ndarray]:
+        """
+        Render a perspective view from a tiled equirectangular panorama.
+        
+        Only tiles intersecting the view are requested from get_tile.
+        
+        Args:
+            get_tile: Callable (tx, ty) -> BGR tile array or None
+            in_hw: Panorama level (height, width)
+            tile_size: Tile edge length
+            fov_deg: (h_fov, v_fov) in degrees
+            yaw: Heading in image coordinates (degrees, 0 = image center)
+            pitch: Pitch in degrees (positive = up)
+            out_hw: Output (height, width)
+        
+        Returns:
+            Perspective image of shape out_hw, or None if a tile is missing
+        """
+        rows, cols, map_x, map_y, wraps = self.get_tile_plan(
+            tuple(in_hw), tile_size, tuple(out_hw),
+            float(fov_deg[0]), float(fov_deg[1]),
+            yaw, pitch
+        )
+        
+        mosaic = None
+        for r, ty in enumerate(rows):
+            for c, tx in enumerate(cols):
+                tile = get_tile(tx, ty)
+                if tile is None:
+                    return None
+                if mosaic is None:
+                    mosaic_h = min(in_hw[0] - rows.start * tile_size, len(rows) * tile_size)
+                    mosaic = np.empty((mosaic_h, len(cols) * tile_size) + tile.shape[2:], dtype=tile.dtype)
+                h, w = tile.shape[:2]
+                mosaic[r * tile_size:r * tile_size + h, c * tile_size:c * tile_size + w] = tile
+        
+        return cv2.remap(
+            mosaic, map_x, map_y,
+            interpolation=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_WRAP if wraps else cv2.BORDER_REPLICATE
+        )
+    
+    def get_stats(self) -> dict:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                'ray_grids': len(self._rays),
+                'cached_maps': len(self._maps),
+                'cached_tile_plans': len(self._plans),
+                'max_cached_maps': self.max_cached_maps,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+    
+    def clear(self):
+        """Drop all cached grids and remap tables."""
+        with self._lock:
+            self._rays.clear()
+            self._maps.clear()
+            self._plans.clear()
+
+
+# Global instance (lazy initialization to avoid import errors)
+_projector: Optional[PerspectiveProjector] = None
+
+
+def get_projector() -> PerspectiveProjector:
+    """Get or create the perspective projector singleton."""
+    global _projector
+    if _projector is None:
+        _projector = PerspectiveProjector()
+    return _projector
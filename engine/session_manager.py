@@ -5,7 +5,10 @@ Handles session lifecycle: creation, state management, and cleanup.
 Supports concurrent sessions with isolated state.
 """
 import json
+import time
 import uuid
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, List, Any
@@ -63,10 +66,14 @@ class Session:
     task_config: Dict = field(default_factory=dict)
     done_reason: Optional[str] = None
     agent_answer: Optional[str] = None
+    in_process: bool = False  # Local client: observations carry JPEG bytes, files are replay-only
+    last_active: float = 0.0  # Unix time of the last change (for eviction)
     
     def __post_init__(self):
         if self.start_time is None:
             self.start_time = datetime.now()
+        if not self.last_active:
+            self.last_active = time.time()
     
     def to_dict(self) -> Dict:
         """Convert session to dictionary."""
@@ -85,6 +92,40 @@ class Session:
             'agent_answer': self.agent_answer
         }
     
+    def to_record(self) -> Dict:
+        """Convert session to a record a session store can rebuild it from."""
+        record = self.to_dict()
+        record['in_process'] = self.in_process
+        record['last_active'] = self.last_active
+        return record
+    
+    @classmethod
+    def from_record(cls, record: Dict, task_config: Optional[Dict] = None) -> 'Session':
+        """
+        Rebuild a session from a record (see to_record).
+        
+        Args:
+            record: Session record
+            task_config: Configuration of the session's task
+        """
+        return cls(
+            session_id=record['session_id'],
+            agent_id=record['agent_id'],
+            task_id=record['task_id'],
+            mode=SessionMode(record['mode']),
+            status=SessionStatus(record['status']),
+            state=SessionState(**record['state']) if record.get('state') else None,
+            step_count=record.get('step_count', 0),
+            start_time=datetime.fromisoformat(record['start_time']) if record.get('start_time') else None,
+            elapsed_time=record.get('elapsed_time', 0.0),
+            trajectory=list(record.get('trajectory') or []),
+            task_config=task_config or {},
+            done_reason=record.get('done_reason'),
+            agent_answer=record.get('agent_answer'),
+            in_process=record.get('in_process', False),
+            last_active=record.get('last_active', 0.0)
+        )
+    
     @property
     def geofence(self) -> Optional[str]:
         """Get the geofence list name for this session's task."""
@@ -101,12 +142,60 @@ class SessionManager:
     - State persistence in SQLite
     - Concurrent session support
     - Task configuration loading
+    
+    Sessions live in a session store (settings.SESSION_STORE). With a shared
+    store every change is written back to it under the session's lock, so
+    several worker processes can serve the same session. Changes are also
+    written to the sessions table by a background SessionWriter (unless the
+    store is the table itself), so sessions can be resumed after a restart.
+    
+    Sessions are evicted when idle or over the session limit (see reap) and,
+    if persisted, loaded back on their next request (see get_session);
+    task configurations are cached up to settings.TASK_CONFIG_CACHE_SIZE.
     """
     
-    def __init__(self):
-        """Initialize the session manager."""
-        self._sessions: Dict[str, Session] = {}
-        self._task_configs: Dict[str, Dict] = {}
+    def __init__(self, store: Optional[str] = None):
+        """
+        Initialize the session manager.
+        
+        Args:
+            store: Session store backend (default: settings.SESSION_STORE)
+        """
+        from .session_store import create_session_store, SessionWriter
+        self._task_configs: OrderedDict = OrderedDict()
+        self._task_lock = threading.Lock()
+        self.backend = store or settings.SESSION_STORE
+        self._store = create_session_store(self.backend, self._load_task_config)
+        self._writer = SessionWriter() if settings.SESSION_PERSIST and not self._store.persistent else None
+        
+        self._reaper: Optional[threading.Thread] = None
+        self._reaper_stop = threading.Event()
+        self.evicted: Dict[str, int] = {'idle': 0, 'ended': 0, 'limit': 0}
+    
+    @property
+    def shared(self) -> bool:
+        """Whether sessions are visible to other worker processes."""
+        return self._store.shared
+    
+    def lock(self, session_id: str):
+        """
+        Context manager serializing changes to a session (across worker
+        processes with a shared store; reentrant).
+        """
+        return self._store.lock(session_id)
+    
+    def _save(self, session: Session, wait: bool = False):
+        """
+        Store a new or changed session and queue it for the database.
+        
+        Args:
+            session: Session
+            wait: Return only once the database write is committed
+        """
+        session.last_active = time.time()
+        self._store.put(session)
+        if self._writer is not None:
+            self._writer.write(session.session_id, session.to_record(), wait=wait)
     
     def _generate_session_id(self, agent_id: str, task_id: str) -> str:
         """Generate a unique session ID."""
@@ -114,9 +203,12 @@ class SessionManager:
         return f"{agent_id}_{task_id}_{timestamp}"
     
     def _load_task_config(self, task_id: str) -> Optional[Dict]:
-        """Load task configuration from file."""
-        if task_id in self._task_configs:
-            return self._task_configs[task_id]
+        """Load task configuration from file (LRU cached)."""
+        with self._task_lock:
+            config = self._task_configs.get(task_id)
+            if config is not None:
+                self._task_configs.move_to_end(task_id)
+                return config
         
         task_path = TASKS_DIR / f"{task_id}.json"
         if not task_path.exists():
@@ -125,14 +217,18 @@ class SessionManager:
         with open(task_path, 'r', encoding='utf-8') as f:
             config = json.load(f)
         
-        self._task_configs[task_id] = config
+        with self._task_lock:
+            self._task_configs[task_id] = config
+            while len(self._task_configs) > settings.TASK_CONFIG_CACHE_SIZE:
+                self._task_configs.popitem(last=False)
         return config
     
     def create_session(
         self,
         agent_id: str,
         task_id: str,
-        mode: str = "agent"
+        mode: str = "agent",
+        in_process: bool = False
     ) -> Optional[Session]:
         """
         Create a new evaluation session.
@@ -141,6 +237,8 @@ class SessionManager:
             agent_id: Agent or player identifier
             task_id: Task identifier
             mode: 'agent' or 'human'
+            in_process: True when the agent runs in this process and consumes
+                observation bytes directly (no HTTP image fetch)
             
         Returns:
             Created Session or None if task not found
@@ -161,6 +259,12 @@ class SessionManager:
             print(f"[SessionManager] Error: No spawn point found in task config for {task_id}")
             return None
         
+        # Load the whole geofence graph once, so steps never hit SQLite
+        geofence_name = task_config.get('geofence') or task_config.get('geofence_id')
+        if geofence_name:
+            from .geofence_checker import geofence_checker
+            geofence_checker.warm_geofence(geofence_name)
+        
         # Try to get location from cache
         location = metadata_cache.get_location(spawn_pano_id)
         metadata = metadata_cache.get(spawn_pano_id)
@@ -184,21 +288,39 @@ class SessionManager:
             mode=SessionMode(mode),
             state=state,
             trajectory=[spawn_pano_id],
-            task_config=task_config
+            task_config=task_config,
+            in_process=in_process
         )
         
-        # Store in memory
-        self._sessions[session_id] = session
-        
-        # Persist to database
-        # DISABLED: Avoid database lock issues during parallel execution
-        # self._save_session_to_db(session)
+        # Make room first: the new session must not be the one evicted
+        if self._store.count() >= settings.SESSION_MAX_SESSIONS:
+            self.reap()
+        self._save(session)
+        self._ensure_reaper()
         
         return session
     
     def get_session(self, session_id: str) -> Optional[Session]:
-        """Get a session by ID."""
-        return self._sessions.get(session_id)
+        """
+        Get a session by ID.
+        
+        A running or paused session evicted from memory (idle TTL or the
+        session limit) is loaded back from the database, so its agent can
+        carry on; ended sessions are returned without being restored.
+        """
+        session = self._store.get(session_id)
+        if session is not None or not self._persisted:
+            return session
+        
+        with self._store.lock(session_id):
+            session = self._store.get(session_id)
+            if session is not None:
+                return session
+            self.flush()  # The evicted state may still be queued
+            session = self._load_session_from_db(session_id)
+            if session is not None and session.status in (SessionStatus.RUNNING, SessionStatus.PAUSED):
+                self._save(session)
+        return session
     
     def update_session_state(
         self,
@@ -217,25 +339,24 @@ class SessionManager:
         Returns:
             True if updated successfully
         """
-        session = self._sessions.get(session_id)
-        if session is None:
-            return False
-        
-        session.state = new_state
-        if increment_step:
-            session.step_count += 1
-        
-        # Update elapsed time
-        if session.start_time:
-            session.elapsed_time = (datetime.now() - session.start_time).total_seconds()
-        
-        # Add to trajectory if moved to new pano
-        if new_state.pano_id not in session.trajectory or session.trajectory[-1] != new_state.pano_id:
-            session.trajectory.append(new_state.pano_id)
-        
-        # Persist
-        # DISABLED: Avoid database lock issues during parallel execution
-        # self._save_session_to_db(session)
+        with self._store.lock(session_id):
+            session = self._store.get(session_id)
+            if session is None:
+                return False
+            
+            session.state = new_state
+            if increment_step:
+                session.step_count += 1
+            
+            # Update elapsed time
+            if session.start_time:
+                session.elapsed_time = (datetime.now() - session.start_time).total_seconds()
+            
+            # Add to trajectory if moved to new pano
+            if new_state.pano_id not in session.trajectory or session.trajectory[-1] != new_state.pano_id:
+                session.trajectory.append(new_state.pano_id)
+            
+            self._save(session)
         
         return True
     
@@ -256,52 +377,56 @@ class SessionManager:
         Returns:
             Ended session or None
         """
-        session = self._sessions.get(session_id)
-        if session is None:
-            return None
-        
-        session.status = SessionStatus.COMPLETED
-        session.done_reason = reason
-        session.agent_answer = answer
-        
-        if session.start_time:
-            session.elapsed_time = (datetime.now() - session.start_time).total_seconds()
+        with self._store.lock(session_id):
+            session = self._store.get(session_id)
+            if session is None:
+                return None
+            
+            session.status = SessionStatus.COMPLETED
+            session.done_reason = reason
+            session.agent_answer = answer
+            
+            if session.start_time:
+                session.elapsed_time = (datetime.now() - session.start_time).total_seconds()
+            
+            self._save(session)
         
-        # Persist
-        # DISABLED: Avoid database lock issues during parallel execution
-        # self._save_session_to_db(session)
+        # Stop prefetching panoramas for this session
+        from .prefetcher import panorama_prefetcher
+        panorama_prefetcher.cancel_session(session_id)
         
         return session
     
     def pause_session(self, session_id: str) -> bool:
         """Pause a human evaluation session."""
-        session = self._sessions.get(session_id)
-        if session is None or session.mode != SessionMode.HUMAN:
-            return False
-        
-        session.status = SessionStatus.PAUSED
-        # DISABLED: Avoid database lock issues during parallel execution
-        # self._save_session_to_db(session)
+        with self._store.lock(session_id):
+            session = self._store.get(session_id)
+            if session is None or session.mode != SessionMode.HUMAN:
+                return False
+            
+            session.status = SessionStatus.PAUSED
+            # Durable before answering: the server may be restarted while paused
+            self._save(session, wait=True)
         return True
     
     def resume_session(self, session_id: str) -> Optional[Session]:
         """Resume a paused session."""
-        # Try memory first
-        session = self._sessions.get(session_id)
-        
-        # Try database if not in memory
-        if session is None:
-            session = self._load_session_from_db(session_id)
-            if session:
-                self._sessions[session_id] = session
-        
-        if session is None:
-            return None
-        
-        if session.status == SessionStatus.PAUSED:
-            session.status = SessionStatus.RUNNING
-            # DISABLED: Avoid database lock issues during parallel execution
-            # self._save_session_to_db(session)
+        with self._store.lock(session_id):
+            # Try the session store first
+            session = self._store.get(session_id)
+            
+            # Try database if not in the store (e.g. after a restart)
+            if session is None:
+                session = self._load_session_from_db(session_id)
+                if session is None:
+                    return None
+                if session.status == SessionStatus.PAUSED:
+                    session.status = SessionStatus.RUNNING
+                self._save(session)
+            
+            elif session.status == SessionStatus.PAUSED:
+                session.status = SessionStatus.RUNNING
+                self._save(session)
         
         return session
     
@@ -312,7 +437,7 @@ class SessionManager:
         Returns:
             Termination reason or None if should continue
         """
-        session = self._sessions.get(session_id)
+        session = self._store.get(session_id)
         if session is None:
             return "session_not_found"
         
@@ -337,7 +462,7 @@ class SessionManager:
     
     def get_all_sessions(self, status: Optional[str] = None) -> List[Session]:
         """Get all sessions, optionally filtered by status."""
-        sessions = list(self._sessions.values())
+        sessions = self._store.sessions()
         if status:
             sessions = [s for s in sessions if s.status.value == status]
         return sessions
@@ -350,39 +475,143 @@ class SessionManager:
             session_id: Session ID
             delete_images: Whether to delete temporary images
         """
+        from .prefetcher import panorama_prefetcher
+        from .logger import session_logger
+        from .temp_images import delete_session_images
+        panorama_prefetcher.cancel_session(session_id)
+        session_logger.close_session_log(session_id)
+        
         if delete_images:
-            from .observation_generator import ObservationGenerator
-            generator = ObservationGenerator()
-            generator.cleanup_session_images(session_id)
+            delete_session_images(session_id)
         
-        # Remove from memory
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        # Remove from the session store (the database row is kept)
+        self._store.delete(session_id)
+        if self._writer is not None:
+            self._writer.write(session_id, None)
     
-    def _save_session_to_db(self, session: Session):
-        """Persist session to database."""
-        with cache_manager.get_connection() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO sessions 
-                (session_id, agent_id, task_id, mode, status,
-                 current_pano_id, current_heading, current_pitch, current_fov,
-                 step_count, elapsed_time, trajectory, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                session.session_id,
-                session.agent_id,
-                session.task_id,
-                session.mode.value,
-                session.status.value,
-                session.state.pano_id if session.state else None,
-                session.state.heading if session.state else 0,
-                session.state.pitch if session.state else 0,
-                session.state.fov if session.state else 90,
-                session.step_count,
-                session.elapsed_time,
-                json.dumps(session.trajectory),
-                datetime.now().isoformat()
+    # === Eviction ===
+    
+    @property
+    def _persisted(self) -> bool:
+        """Whether evicted sessions can be loaded back from the database."""
+        return self._writer is not None or self._store.persistent
+    
+    def _expiry_reason(self, session: Session, now: float) -> Optional[str]:
+        """Why a session should leave memory now ('idle' / 'ended'), if at all."""
+        idle = now - session.last_active
+        if session.status == SessionStatus.PAUSED and not self._persisted:
+            return None
+        if session.status in (SessionStatus.RUNNING, SessionStatus.PAUSED):
+            return 'idle' if idle > settings.SESSION_IDLE_TTL else None
+        return 'ended' if idle > settings.SESSION_ENDED_TTL else None
+    
+    def evict(self, session_id: str) -> bool:
+        """
+        Remove a session from memory: stop its prefetches, close its log file
+        and delete its temp images if TEMP_IMAGE_CLEANUP_POLICY says so.
+        The database row stays, so a paused session can still be resumed.
+        
+        Args:
+            session_id: Session ID
+        
+        Returns:
+            True if the session was in memory
+        """
+        from .temp_images import delete_on_evict
+        with self._store.lock(session_id):
+            session = self._store.get(session_id)
+            if session is None:
+                return False
+            self.cleanup_session(session_id, delete_images=delete_on_evict(session))
+        return True
+    
+    def reap(self) -> int:
+        """
+        Evict idle and ended sessions, then the least recently used ones
+        (ended first) while at or over settings.SESSION_MAX_SESSIONS.
+        
+        Returns:
+            Number of sessions evicted
+        """
+        sessions = self._store.sessions()
+        evicted = 0
+        keep = []
+        for session in sessions:
+            reason = self._expiry_reason(session, time.time())
+            if reason is None:
+                keep.append(session)
+                continue
+            with self._store.lock(session.session_id):
+                # Another request may have used it since the listing
+                session = self._store.get(session.session_id)
+                if session is None or self._expiry_reason(session, time.time()) != reason:
+                    continue
+                if self.evict(session.session_id):
+                    self.evicted[reason] += 1
+                    evicted += 1
+        
+        # Leave room for one new session
+        over = len(keep) - settings.SESSION_MAX_SESSIONS + 1
+        if over > 0:
+            candidates = [s for s in keep if s.status != SessionStatus.PAUSED or self._persisted]
+            candidates.sort(key=lambda s: (
+                s.status in (SessionStatus.RUNNING, SessionStatus.PAUSED), s.last_active
             ))
+            for session in candidates[:over]:
+                if self.evict(session.session_id):
+                    self.evicted['limit'] += 1
+                    evicted += 1
+        
+        if evicted:
+            print(f"[SessionManager] Evicted {evicted} sessions ({len(sessions) - evicted} in memory)")
+        return evicted
+    
+    def _ensure_reaper(self):
+        """Start the thread that reaps sessions every SESSION_REAP_INTERVAL seconds."""
+        if self._reaper is not None or settings.SESSION_REAP_INTERVAL <= 0:
+            return
+        with self._task_lock:
+            if self._reaper is not None:
+                return
+            self._reaper_stop.clear()
+            self._reaper = threading.Thread(target=self._run_reaper, name="session-reaper", daemon=True)
+            self._reaper.start()
+    
+    def _run_reaper(self):
+        while not self._reaper_stop.wait(settings.SESSION_REAP_INTERVAL):
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"[SessionManager] Error reaping sessions: {e}")
+    
+    def get_stats(self) -> dict:
+        """Get statistics of the sessions held in memory."""
+        from .logger import session_logger
+        statuses: Dict[str, int] = {}
+        for session in self._store.sessions():
+            statuses[session.status.value] = statuses.get(session.status.value, 0) + 1
+        return {
+            'store': self.backend,
+            'sessions': sum(statuses.values()),
+            'statuses': statuses,
+            'max_sessions': settings.SESSION_MAX_SESSIONS,
+            'task_configs': len(self._task_configs),
+            'open_log_files': session_logger.open_files,
+            'evicted': dict(self.evicted),
+            'persistence': self._writer.get_stats() if self._writer is not None else None
+        }
+    
+    def flush(self):
+        """Commit session changes still queued for the database."""
+        if self._writer is not None:
+            self._writer.flush()
+    
+    def close(self):
+        """Commit queued session changes and release the session store (call on shutdown)."""
+        self._reaper_stop.set()
+        if self._writer is not None:
+            self._writer.close()
+        self._store.close()
     
     def _load_session_from_db(self, session_id: str) -> Optional[Session]:
         """Load session from database."""
@@ -398,6 +627,10 @@ class SessionManager:
             # Load task config
             task_config = self._load_task_config(row['task_id'])
             
+            # Full record (written by SessionWriter / the SQLite store)
+            if row['record']:
+                return Session.from_record(json.loads(row['record']), task_config)
+            
             # Reconstruct session
             state = SessionState(
                 pano_id=row['current_pano_id'],
@@ -0,0 +1,769 @@
+"""
+SessionStore - Where SessionManager keeps live sessions.
+
+The in-process store is a dict of Session objects and only works with a
+single server process. The shared stores keep each session as a serialized
+record that every worker process can read, so requests of one session can
+be served by any uvicorn worker:
+
+- shm: a hash table in a named shared memory block (workers on one host)
+- sqlite: rows of the sessions table in the cache database, written by one
+  writer thread per process that group-commits concurrent writes
+
+SessionWriter is that writer thread; with the other stores SessionManager
+uses it to persist sessions write-behind, so they can be resumed after a
+restart.
+
+Shared stores also provide a per-session lock that holds across processes
+(fcntl byte-range locks on a lock file), so read-modify-write of a session
+never interleaves between workers.
+"""
+import os
+import json
+import atexit
+import time
+import zlib
+import struct
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one process can use a shared store safely
+    fcntl = None
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings, DATA_DIR
+from cache.cache_manager import cache_manager
+from .session_manager import Session
+
+
+# Lock file byte ranges: 0 guards the shared memory table, 1..N are session stripes
+_LOCK_STRIPES = 4096
+
+# Shared memory layout: header, then fixed-size slots of (state, key length,
+# data length, key, data)
+_MAGIC = b'VLNS'
+_HEADER = struct.Struct('<4sII')  # magic, slots, slot size
+_SLOT = struct.Struct('<BHI')
+_MAX_KEY = 256
+_EMPTY, _USED, _DELETED = 0, 1, 2
+
+
+class SessionStoreFull(Exception):
+    """Raised when the shared memory store has no free slot for a new session."""
+    pass
+
+
+class _FileLock:
+    """
+    Reentrant lock over one byte of a lock file.
+    
+    Threads of this process are serialized by an RLock and processes by an
+    fcntl lock, which is taken on the outermost acquire only (fcntl locks
+    belong to the process, not the thread).
+    """
+    
+    def __init__(self, fd: int, offset: int):
+        self._fd = fd
+        self._offset = offset
+        self._lock = threading.RLock()
+        self._depth = 0
+    
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and fcntl is not None:
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, self._offset)
+            except BaseException:
+                self._depth -= 1
+                self._lock.release()
+                raise
+        return self
+    
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._offset)
+        self._lock.release()
+
+
+class SessionStore(ABC):
+    """Interface of the session stores."""
+    
+    # Whether other processes see the sessions of this store
+    shared = False
+    # Whether sessions are kept in the sessions table already
+    persistent = False
+    
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Session]:
+        """Get a session by ID."""
+    
+    @abstractmethod
+    def put(self, session: Session):
+        """Store a new or changed session."""
+    
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Remove a session."""
+    
+    @abstractmethod
+    def sessions(self) -> List[Session]:
+        """Get all sessions."""
+    
+    def count(self) -> int:
+        """Number of sessions."""
+        return len(self.sessions())
+    
+    @abstractmethod
+    def lock(self, session_id: str):
+        """Context manager serializing read-modify-write of a session."""
+    
+    def close(self):
+        """Release the store's resources."""
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions of this process only (single worker)."""
+    
+    def __init__(self):
+        self._sessions: Dict[str, Session] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._guard = threading.Lock()
+    
+    def get(self, session_id: str) -> Optional[Session]:
+        return self._sessions.get(session_id)
+    
+    def put(self, session: Session):
+        self._sessions[session.session_id] = session
+    
+    def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        with self._guard:
+            self._locks.pop(session_id, None)
+    
+    def sessions(self) -> List[Session]:
+        return list(self._sessions.values())
+    
+    def count(self) -> int:
+        return len(self._sessions)
+    
+    def lock(self, session_id: str) -> threading.RLock:
+        # Requests of a session run in action pool threads concurrently
+        with self._guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = threading.RLock()
+            return lock
+
+
+class _SerializedSessionStore(SessionStore):
+    """
+    Base of the shared stores.
+    
+    Sessions are stored as records (Session.to_record). Each process keeps
+    the Session objects it built, keyed by the raw record: reading an
+    unchanged record returns the same object, and a record changed by
+    another worker updates that object in place.
+    """
+    
+    shared = True
+    
+    def __init__(self, load_task_config: Callable[[str], Optional[Dict]], lock_path: Optional[Path] = None):
+        """
+        Initialize the store.
+        
+        Args:
+            load_task_config: Returns the configuration of a task ID
+            lock_path: Lock file shared by all workers (default: data/sessions.lock)
+        """
+        self._load_task_config = load_task_config
+        self._lock_path = lock_path or DATA_DIR / "sessions.lock"
+        self._lock_fd: Optional[int] = None
+        self._locks: Dict[int, _FileLock] = {}
+        self._guard = threading.Lock()
+        self._objects: Dict[str, Tuple[object, Session]] = {}
+    
+    # === Backend ===
+    
+    @abstractmethod
+    def _dumps(self, record: Dict):
+        """Serialize a session record to the backend's raw form."""
+    
+    @abstractmethod
+    def _loads(self, raw) -> Dict:
+        """Deserialize a raw record."""
+    
+    @abstractmethod
+    def _read(self, session_id: str):
+        """Raw record of a session, or None."""
+    
+    @abstractmethod
+    def _read_all(self) -> List[Tuple[str, object]]:
+        """(session_id, raw record) of all sessions."""
+    
+    @abstractmethod
+    def _write(self, session_id: str, record: Dict, raw):
+        """Store a session's record."""
+    
+    @abstractmethod
+    def _remove(self, session_id: str):
+        """Delete a session's record."""
+    
+    # === Store ===
+    
+    def _file_lock(self, offset: int) -> _FileLock:
+        with self._guard:
+            lock = self._locks.get(offset)
+            if lock is None:
+                if self._lock_fd is None:
+                    self._lock_fd = os.open(str(self._lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+                lock = self._locks[offset] = _FileLock(self._lock_fd, offset)
+            return lock
+    
+    def lock(self, session_id: str) -> _FileLock:
+        return self._file_lock(1 + zlib.crc32(session_id.encode('utf-8')) % _LOCK_STRIPES)
+    
+    def _decode(self, session_id: str, raw) -> Session:
+        """Session object for a raw record (reused while the record is unchanged)."""
+        with self._guard:
+            cached = self._objects.get(session_id)
+        if cached is not None and cached[0] == raw:
+            return cached[1]
+        
+        record = self._loads(raw)
+        session = Session.from_record(record, self._load_task_config(record['task_id']))
+        with self._guard:
+            cached = self._objects.get(session_id)
+            if cached is not None:
+                # Callers may hold the old object: bring it up to date instead
+                cached[1].__dict__.update(session.__dict__)
+                session = cached[1]
+            self._objects[session_id] = (raw, session)
+        return session
+    
+    def get(self, session_id: str) -> Optional[Session]:
+        raw = self._read(session_id)
+        if raw is None:
+            with self._guard:
+                self._objects.pop(session_id, None)
+            return None
+        return self._decode(session_id, raw)
+    
+    def put(self, session: Session):
+        record = session.to_record()
+        raw = self._dumps(record)
+        self._write(session.session_id, record, raw)
+        with self._guard:
+            self._objects[session.session_id] = (raw, session)
+    
+    def delete(self, session_id: str):
+        self._remove(session_id)
+        with self._guard:
+            self._objects.pop(session_id, None)
+    
+    def sessions(self) -> List[Session]:
+        return [self._decode(session_id, raw) for session_id, raw in self._read_all()]
+    
+    def close(self):
+        with self._guard:
+            self._objects.clear()
+            self._locks.clear()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+
+class SharedMemorySessionStore(_SerializedSessionStore):
+    """
+    Sessions in a named shared memory block (open addressing hash table).
+    
+    The first worker creates the block, later ones attach to it. The block
+    outlives the workers, so sessions survive a restart of the server (not
+    of the host). Records are zlib-compressed JSON; a session whose record
+    exceeds a slot cannot be stored.
+    """
+    
+    def __init__(
+        self,
+        load_task_config: Callable[[str], Optional[Dict]],
+        name: Optional[str] = None,
+        slots: Optional[int] = None,
+        slot_size: Optional[int] = None,
+        lock_path: Optional[Path] = None
+    ):
+        """
+        Initialize the store (the block is attached on first use).
+        
+        Args:
+            load_task_config: Returns the configuration of a task ID
+            name: Shared memory block name (default: settings.SESSION_SHM_NAME)
+            slots: Sessions the block holds (default: settings.SESSION_SHM_SLOTS)
+            slot_size: Bytes per session (default: settings.SESSION_SHM_SLOT_SIZE)
+            lock_path: Lock file shared by all workers
+        """
+        super().__init__(load_task_config, lock_path)
+        self.name = name or settings.SESSION_SHM_NAME
+        self.slots = slots or settings.SESSION_SHM_SLOTS
+        self.slot_size = slot_size or settings.SESSION_SHM_SLOT_SIZE
+        self._max_data = self.slot_size - _SLOT.size - _MAX_KEY
+        self._shm = None
+    
+    def _dumps(self, record: Dict) -> bytes:
+        return zlib.compress(json.dumps(record, ensure_ascii=False).encode('utf-8'), 1)
+    
+    def _loads(self, raw: bytes) -> Dict:
+        return json.loads(zlib.decompress(raw).decode('utf-8'))
+    
+    def _table(self):
+        """Context manager for exclusive access to the table (all processes)."""
+        return self._file_lock(0)
+    
+    def _buffer(self) -> memoryview:
+        """Attach to (or create) the block."""
+        if self._shm is None:
+            from multiprocessing import shared_memory, resource_tracker
+            with self._table():
+                if self._shm is None:
+                    try:
+                        shm = shared_memory.SharedMemory(
+                            self.name, create=True, size=_HEADER.size + self.slots * self.slot_size
+                        )
+                        _HEADER.pack_into(shm.buf, 0, _MAGIC, self.slots, self.slot_size)
+                    except FileExistsError:
+                        shm = shared_memory.SharedMemory(self.name)
+                        if _HEADER.unpack_from(shm.buf, 0) != (_MAGIC, self.slots, self.slot_size):
+                            shm.close()
+                            raise RuntimeError(
+                                f"Shared memory block '{self.name}' has another layout; "
+                                f"stop all workers or set SESSION_SHM_NAME"
+                            )
+                    # Keep the block when this process exits: other workers still use it
+                    try:
+                        resource_tracker.unregister(shm._name, 'shared_memory')
+                    except Exception:
+                        pass
+                    self._shm = shm
+        return self._shm.buf
+    
+    def _offset(self, index: int) -> int:
+        return _HEADER.size + index * self.slot_size
+    
+    def _find(self, buf: memoryview, key: bytes) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Probe for a key (caller holds the table lock).
+        
+        Returns:
+            (slot of the key or None, slot a new key goes to or None if full)
+        """
+        start = zlib.crc32(key) % self.slots
+        free = None
+        for probe in range(self.slots):
+            index = (start + probe) % self.slots
+            offset = self._offset(index)
+            state, key_len, _ = _SLOT.unpack_from(buf, offset)
+            if state == _EMPTY:
+                return None, free if free is not None else index
+            if state == _DELETED:
+                if free is None:
+                    free = index
+                continue
+            data = offset + _SLOT.size
+            if key_len == len(key) and buf[data:data + key_len] == key:
+                return index, index
+        return None, free
+    
+    def _read(self, session_id: str) -> Optional[bytes]:
+        key = session_id.encode('utf-8')
+        buf = self._buffer()
+        with self._table():
+            index, _ = self._find(buf, key)
+            if index is None:
+                return None
+            offset = self._offset(index)
+            _, key_len, data_len = _SLOT.unpack_from(buf, offset)
+            data = offset + _SLOT.size + key_len
+            return bytes(buf[data:data + data_len])
+    
+    def _read_all(self) -> List[Tuple[str, bytes]]:
+        buf = self._buffer()
+        items = []
+        with self._table():
+            for index in range(self.slots):
+                offset = self._offset(index)
+                state, key_len, data_len = _SLOT.unpack_from(buf, offset)
+                if state == _USED:
+                    key = offset + _SLOT.size
+                    items.append((
+                        bytes(buf[key:key + key_len]).decode('utf-8'),
+                        bytes(buf[key + key_len:key + key_len + data_len])
+                    ))
+        return items
+    
+    def _write(self, session_id: str, record: Dict, raw: bytes):
+        key = session_id.encode('utf-8')
+        if len(key) > _MAX_KEY:
+            raise ValueError(f"Session ID longer than {_MAX_KEY} bytes: {session_id}")
+        if len(raw) > self._max_data:
+            raise ValueError(
+                f"Session {session_id} needs {len(raw)} bytes, slots hold {self._max_data} "
+                f"(raise SESSION_SHM_SLOT_SIZE)"
+            )
+        buf = self._buffer()
+        with self._table():
+            _, index = self._find(buf, key)
+            if index is None:
+                raise SessionStoreFull(f"Shared session store is full ({self.slots} sessions)")
+            offset = self._offset(index)
+            data = offset + _SLOT.size
+            buf[data:data + len(key)] = key
+            buf[data + len(key):data + len(key) + len(raw)] = raw
+            _SLOT.pack_into(buf, offset, _USED, len(key), len(raw))
+    
+    def _remove(self, session_id: str):
+        buf = self._buffer()
+        with self._table():
+            index, _ = self._find(buf, session_id.encode('utf-8'))
+            if index is None:
+                return
+            # Tombstone, unless the probe chain ends right after this slot
+            next_state = _SLOT.unpack_from(buf, self._offset((index + 1) % self.slots))[0]
+            if next_state != _EMPTY:
+                _SLOT.pack_into(buf, self._offset(index), _DELETED, 0, 0)
+                return
+            while True:
+                _SLOT.pack_into(buf, self._offset(index), _EMPTY, 0, 0)
+                index = (index - 1) % self.slots
+                if _SLOT.unpack_from(buf, self._offset(index))[0] != _DELETED:
+                    break
+    
+    def count(self) -> int:
+        buf = self._buffer()
+        with self._table():
+            return sum(
+                1 for index in range(self.slots)
+                if _SLOT.unpack_from(buf, self._offset(index))[0] == _USED
+            )
+    
+    def close(self):
+        super().close()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+
+class _Waiter:
+    """A caller waiting for its write to be committed."""
+    
+    def __init__(self):
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class SessionWriter:
+    """
+    Single thread that writes session records to the sessions table.
+    
+    Writes are coalesced per session (the last write wins) and committed in
+    one transaction, so a step costs a dict assignment instead of a commit:
+    
+    - write-behind (default): pending writes are committed every
+      settings.SESSION_PERSIST_INTERVAL_MS and on close
+    - wait=True: the caller blocks until its write is committed; writes
+      arriving within settings.SESSION_STORE_BATCH_WINDOW share the commit
+    
+    Rows only move forward: a write older than the stored row (another
+    worker committed a later change first) is ignored.
+    """
+    
+    def __init__(self, interval: Optional[float] = None, batch_window: Optional[float] = None):
+        """
+        Initialize the writer (the thread starts on first write).
+        
+        Args:
+            interval: Seconds between write-behind commits (default: settings)
+            batch_window: Seconds to gather synchronous writes (default: settings)
+        """
+        self.interval = interval if interval is not None else settings.SESSION_PERSIST_INTERVAL_MS / 1000
+        self.batch_window = batch_window if batch_window is not None else settings.SESSION_STORE_BATCH_WINDOW
+        
+        self._cond = threading.Condition()
+        # Session ID -> (record or None, raw record, active, change time)
+        self._pending: Dict[str, Tuple[Optional[Dict], Optional[str], bool, str]] = {}
+        self._waiters: List[_Waiter] = []
+        self._due = 0.0
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        
+        self.writes = 0
+        self.coalesced = 0
+        self.commits = 0
+        self.errors = 0
+    
+    def write(self, session_id: str, record: Optional[Dict], raw: Optional[str] = None, wait: bool = False):
+        """
+        Queue a session record.
+        
+        Args:
+            session_id: Session ID
+            record: Session record (None: mark the session inactive)
+            raw: The record as JSON (default: serialized here)
+            wait: Block until the write is committed
+        
+        Raises:
+            sqlite3.Error: If wait is True and the commit failed
+        """
+        if record is not None and raw is None:
+            raw = json.dumps(record, ensure_ascii=False)
+        waiter = _Waiter() if wait else None
+        with self._cond:
+            if not self._pending:
+                self._due = time.monotonic() + self.interval
+            previous = self._pending.get(session_id)
+            active = record is not None
+            if previous is not None:
+                self.coalesced += 1
+                if not active:
+                    # Deactivating: still write the last queued change
+                    record, raw = previous[0], previous[1]
+            self._pending[session_id] = (record, raw, active, datetime.now().isoformat())
+            self.writes += 1
+            if waiter is not None:
+                self._waiters.append(waiter)
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+                self._thread.start()
+                # Scripts that never call close() still commit their last writes
+                atexit.register(self.close)
+            self._cond.notify()
+        
+        if waiter is not None:
+            waiter.done.wait()
+            if waiter.error is not None:
+                raise waiter.error
+    
+    def flush(self):
+        """Commit everything queued so far and wait for it."""
+        with self._cond:
+            if not self._pending or self._thread is None:
+                return
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+            self._cond.notify()
+        waiter.done.wait()
+    
+    def close(self):
+        """Commit pending writes and stop the thread (call on shutdown)."""
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+    
+    # === Writer thread ===
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._waiters:
+                    if not self._pending:
+                        self._cond.wait()
+                        continue
+                    remaining = self._due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping and not self._pending and not self._waiters:
+                    self._thread = None
+                    return
+                urgent = bool(self._waiters) and not self._stopping
+            
+            if urgent and self.batch_window > 0:
+                # Let concurrent synchronous writes join this commit
+                time.sleep(self.batch_window)
+            
+            with self._cond:
+                pending, self._pending = self._pending, {}
+                waiters, self._waiters = self._waiters, []
+            
+            error = None
+            if pending:
+                try:
+                    self._commit(pending)
+                    self.commits += 1
+                except Exception as e:
+                    print(f"[SessionWriter] Error writing {len(pending)} sessions: {e}")
+                    self.errors += 1
+                    error = e
+                    with self._cond:
+                        # Retry with the next commit unless a newer write replaced them
+                        for session_id, item in pending.items():
+                            self._pending.setdefault(session_id, item)
+                        self._due = time.monotonic() + self.interval
+                        if self._stopping:
+                            self._pending.clear()
+            for waiter in waiters:
+                waiter.error = error
+                waiter.done.set()
+    
+    @staticmethod
+    def _commit(pending: Dict[str, Tuple[Optional[Dict], Optional[str], bool, str]]):
+        """Write a batch in one transaction."""
+        with cache_manager.get_connection() as conn:
+            for session_id, (record, raw, active, changed_at) in pending.items():
+                if record is None:
+                    conn.execute(
+                        'UPDATE sessions SET active = 0, updated_at = ? WHERE session_id = ? AND updated_at <= ?',
+                        (changed_at, session_id, changed_at)
+                    )
+                    continue
+                state = record.get('state') or {}
+                conn.execute('''
+                    INSERT INTO sessions
+                    (session_id, agent_id, task_id, mode, status,
+                     current_pano_id, current_heading, current_pitch, current_fov,
+                     step_count, elapsed_time, trajectory, updated_at, record, active)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        status = excluded.status,
+                        current_pano_id = excluded.current_pano_id,
+                        current_heading = excluded.current_heading,
+                        current_pitch = excluded.current_pitch,
+                        current_fov = excluded.current_fov,
+                        step_count = excluded.step_count,
+                        elapsed_time = excluded.elapsed_time,
+                        trajectory = excluded.trajectory,
+                        updated_at = excluded.updated_at,
+                        record = excluded.record,
+                        active = excluded.active
+                    WHERE excluded.updated_at >= sessions.updated_at
+                ''', (
+                    session_id,
+                    record['agent_id'],
+                    record['task_id'],
+                    record['mode'],
+                    record['status'],
+                    state.get('pano_id'),
+                    state.get('heading', 0),
+                    state.get('pitch', 0),
+                    state.get('fov', 90),
+                    record['step_count'],
+                    record['elapsed_time'],
+                    json.dumps(record['trajectory']),
+                    changed_at,
+                    raw,
+                    int(active)
+                ))
+    
+    def get_stats(self) -> dict:
+        """Get writer statistics."""
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'writes': self.writes,
+                'coalesced': self.coalesced,
+                'commits': self.commits,
+                'errors': self.errors
+            }
+
+
+class SqliteSessionStore(_SerializedSessionStore):
+    """
+    Sessions in the sessions table of the cache database.
+    
+    All writes of a process go through one SessionWriter: writes queued
+    within settings.SESSION_STORE_BATCH_WINDOW are committed in one
+    transaction, so parallel sessions do not fight over the database lock
+    with a commit per action. A write returns once it is committed, so the
+    next request of the session sees it in any worker. Removed sessions
+    keep their row (for evaluation) and are only marked inactive.
+    """
+    
+    # Sessions are already in the database
+    persistent = True
+    
+    def __init__(
+        self,
+        load_task_config: Callable[[str], Optional[Dict]],
+        batch_window: Optional[float] = None,
+        lock_path: Optional[Path] = None
+    ):
+        """
+        Initialize the store.
+        
+        Args:
+            load_task_config: Returns the configuration of a task ID
+            batch_window: Seconds the writer gathers writes (default: settings)
+            lock_path: Lock file shared by all workers
+        """
+        super().__init__(load_task_config, lock_path)
+        self._writer = SessionWriter(batch_window=batch_window)
+    
+    def _dumps(self, record: Dict) -> str:
+        return json.dumps(record, ensure_ascii=False)
+    
+    def _loads(self, raw: str) -> Dict:
+        return json.loads(raw)
+    
+    def _read(self, session_id: str) -> Optional[str]:
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                'SELECT record FROM sessions WHERE session_id = ? AND active = 1',
+                (session_id,)
+            )
+            row = cursor.fetchone()
+        return row['record'] if row else None
+    
+    def _read_all(self) -> List[Tuple[str, str]]:
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute(
+                'SELECT session_id, record FROM sessions WHERE active = 1 AND record IS NOT NULL'
+            )
+            return [(row['session_id'], row['record']) for row in cursor.fetchall()]
+    
+    def count(self) -> int:
+        with cache_manager.get_connection() as conn:
+            cursor = conn.execute('SELECT COUNT(*) FROM sessions WHERE active = 1 AND record IS NOT NULL')
+            return cursor.fetchone()[0]
+    
+    def _write(self, session_id: str, record: Dict, raw: str):
+        self._writer.write(session_id, record, raw, wait=True)
+    
+    def _remove(self, session_id: str):
+        self._writer.write(session_id, None, wait=True)
+    
+    def close(self):
+        self._writer.close()
+        super().close()
+
+
+def create_session_store(
+    backend: str,
+    load_task_config: Callable[[str], Optional[Dict]]
+) -> SessionStore:
+    """
+    Create a session store.
+    
+    Args:
+        backend: "memory", "shm" or "sqlite"
+        load_task_config: Returns the configuration of a task ID
+    
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "shm":
+        return SharedMemorySessionStore(load_task_config)
+    if backend == "sqlite":
+        return SqliteSessionStore(load_task_config)
+    raise ValueError(f"Unknown session store: {backend} (expected memory, shm or sqlite)")
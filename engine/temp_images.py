@@ -0,0 +1,402 @@
+"""
+TempImages - Step images of sessions under temp_images/.
+
+Each session writes its observations to temp_images/{session_id}/
+(step_N.jpg, look_around views step_N_<direction>.jpg). What happens to
+them is settings.TEMP_IMAGE_CLEANUP_POLICY:
+
+- keep_all: never deleted
+- keep_on_complete: kept for completed sessions, deleted for abandoned ones
+- delete_on_send: deleted once served (at the latest when the session goes)
+- delete_on_session_end: deleted when the session is over
+- auto_expire: deleted TEMP_IMAGE_EXPIRE_HOURS after they were written
+
+Images of a session are handled when it leaves memory (delete_on_evict)
+and by TempImageJanitor, which sweeps the whole directory periodically and
+also enforces a disk quota.
+"""
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config.settings import settings, DATA_DIR, TEMP_IMAGES_DIR
+from cache.cache_manager import cache_manager
+
+
+POLICIES = ('keep_all', 'keep_on_complete', 'delete_on_send', 'delete_on_session_end', 'auto_expire')
+
+
+def delete_session_images(session_id: str) -> bool:
+    """
+    Delete the image directory of a session.
+    
+    Args:
+        session_id: Session ID
+    
+    Returns:
+        True if a directory was deleted
+    """
+    session_dir = TEMP_IMAGES_DIR / session_id
+    if not session_dir.is_dir():
+        return False
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return True
+
+
+def delete_on_evict(session, policy: Optional[str] = None) -> bool:
+    """
+    Whether the images of a session leaving memory should be deleted.
+    
+    Paused sessions can be resumed later and keep their images; a session
+    evicted while running was abandoned and counts as over, not complete.
+    
+    Args:
+        session: Evicted session
+        policy: Cleanup policy (default: settings.TEMP_IMAGE_CLEANUP_POLICY)
+    """
+    policy = policy or settings.TEMP_IMAGE_CLEANUP_POLICY
+    status = session.status.value
+    if status == 'paused':
+        return False
+    if policy == 'keep_on_complete':
+        return status != 'completed'
+    return policy in ('delete_on_send', 'delete_on_session_end')
+
+
+class _Image:
+    """A file found by a sweep."""
+    
+    __slots__ = ('path', 'size', 'mtime', 'step')
+    
+    def __init__(self, path: str, size: int, mtime: float, step: Optional[int]):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.step = step
+
+
+def _step_of(name: str) -> Optional[int]:
+    """Step number of step_N.jpg / step_N_<view>.jpg (None for other files)."""
+    parts = name.split('.', 1)[0].split('_')
+    if len(parts) >= 2 and parts[0] == 'step' and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+class TempImageJanitor:
+    """
+    Enforces TEMP_IMAGE_CLEANUP_POLICY and TEMP_IMAGE_QUOTA_GB on temp_images/.
+    
+    A sweep walks the directory once (one scandir per session directory)
+    and only then lists the sessions in memory, so a session started during
+    the walk is never taken for a finished one. Sessions not in memory are
+    looked up in the sessions table: a paused one keeps its images, and an
+    active row updated within SESSION_IDLE_TTL belongs to another process
+    and counts as running. Directories without a row are left alone until
+    nothing was written to them for TEMP_IMAGE_EXPIRE_HOURS. Over the quota, the oldest remaining images are
+    deleted first, except the current step of running sessions. With
+    several workers one sweeps at a time (lock file); the others skip.
+    """
+    
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        policy: Optional[str] = None,
+        expire_hours: Optional[float] = None,
+        quota_gb: Optional[float] = None,
+        interval: Optional[float] = None
+    ):
+        """
+        Initialize the janitor (the sweep thread starts with start()).
+        
+        Args:
+            root: Image directory (default: temp_images/)
+            policy: Cleanup policy (default: settings.TEMP_IMAGE_CLEANUP_POLICY)
+            expire_hours: Age limit for auto_expire (default: settings)
+            quota_gb: Disk quota, 0 for none (default: settings.TEMP_IMAGE_QUOTA_GB)
+            interval: Seconds between sweeps (default: settings.TEMP_IMAGE_SWEEP_INTERVAL)
+        
+        Raises:
+            ValueError: If the policy is unknown
+        """
+        self.root = root or TEMP_IMAGES_DIR
+        self.policy = policy or settings.TEMP_IMAGE_CLEANUP_POLICY
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown TEMP_IMAGE_CLEANUP_POLICY: {self.policy} (expected one of {', '.join(POLICIES)})")
+        self.expire_hours = expire_hours if expire_hours is not None else settings.TEMP_IMAGE_EXPIRE_HOURS
+        self.quota_gb = quota_gb if quota_gb is not None else settings.TEMP_IMAGE_QUOTA_GB
+        self.interval = interval if interval is not None else settings.TEMP_IMAGE_SWEEP_INTERVAL
+        
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        
+        self.sweeps = 0
+        self.deleted = {'policy': 0, 'expired': 0, 'quota': 0}
+        self.freed_bytes = 0
+        self.last_sweep: Optional[dict] = None
+    
+    # === Sweep ===
+    
+    def _walk(self) -> Dict[str, List[_Image]]:
+        """Session ID -> its images, from one pass over the directory."""
+        images: Dict[str, List[_Image]] = {}
+        try:
+            root = os.scandir(self.root)
+        except FileNotFoundError:
+            return images
+        with root:
+            for entry in root:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                files = []
+                try:
+                    with os.scandir(entry.path) as it:
+                        for f in it:
+                            if f.is_file(follow_symlinks=False):
+                                stat = f.stat()
+                                files.append(_Image(f.path, stat.st_size, stat.st_mtime, _step_of(f.name)))
+                except FileNotFoundError:
+                    continue  # Deleted meanwhile
+                images[entry.name] = files
+        return images
+    
+    @staticmethod
+    def _stored_states(session_ids: List[str]) -> Dict[str, str]:
+        """States of sessions not in memory, from the sessions table."""
+        now = time.time()
+        states = {}
+        with cache_manager.get_connection() as conn:
+            for i in range(0, len(session_ids), 500):
+                chunk = session_ids[i:i + 500]
+                cursor = conn.execute(
+                    f"SELECT session_id, status, active, updated_at FROM sessions "
+                    f"WHERE session_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    status = row['status']
+                    if status == 'running':
+                        try:
+                            updated = datetime.fromisoformat(row['updated_at']).timestamp()
+                        except (TypeError, ValueError):
+                            updated = 0.0
+                        # Active and recent: served by another process
+                        recent = now - updated <= settings.SESSION_IDLE_TTL
+                        status = 'running' if row['active'] and recent else 'abandoned'
+                    states[row['session_id']] = status
+        return states
+    
+    def _select(self, state: Optional[str], files: List[_Image], expire_before: float) -> List[_Image]:
+        """Images of one session the policy deletes."""
+        if self.policy == 'keep_all' or not files:
+            return []
+        if self.policy == 'auto_expire':
+            return [f for f in files if f.mtime < expire_before]
+        if state == 'paused':
+            return []
+        if state == 'running':
+            if self.policy != 'delete_on_send':
+                return []
+            # Earlier steps have been served; the current one may not have been yet
+            latest = max((f.step for f in files if f.step is not None), default=None)
+            return [f for f in files if f.step is not None and f.step < latest]
+        
+        if state is None:
+            # Unknown (e.g. written before sessions were persisted): only a
+            # directory nothing was written to for TEMP_IMAGE_EXPIRE_HOURS goes
+            if self.policy == 'keep_on_complete' or max(f.mtime for f in files) >= expire_before:
+                return []
+            return files
+        
+        # The session is over
+        if self.policy == 'keep_on_complete':
+            return [] if state == 'completed' else files
+        return files
+    
+    def _delete(self, doomed: List[Tuple[_Image, str]], images: Dict[str, List[_Image]]) -> Dict[str, int]:
+        """Delete files and the directories they leave empty."""
+        counts = {'policy': 0, 'expired': 0, 'quota': 0}
+        freed = 0
+        for image, reason in doomed:
+            try:
+                os.remove(image.path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"[TempImages] Cannot delete {image.path}: {e}")
+                continue
+            counts[reason] += 1
+            freed += image.size
+        
+        doomed_paths = {image.path for image, _ in doomed}
+        for session_id, files in images.items():
+            if files and all(f.path in doomed_paths for f in files):
+                try:
+                    os.rmdir(self.root / session_id)
+                except OSError:
+                    pass  # A new image arrived
+        
+        counts['freed_bytes'] = freed
+        return counts
+    
+    def _sweep(self) -> dict:
+        start = time.time()
+        images = self._walk()
+        
+        from .session_manager import session_manager
+        states: Dict[str, Optional[str]] = {}
+        for session in session_manager.get_all_sessions():
+            if session.session_id in images:
+                states[session.session_id] = session.status.value
+        if self.policy not in ('keep_all', 'auto_expire'):
+            states.update(self._stored_states([sid for sid in images if sid not in states]))
+        
+        expire_reason = 'expired' if self.policy == 'auto_expire' else 'policy'
+        expire_before = start - self.expire_hours * 3600
+        doomed: List[Tuple[_Image, str]] = []
+        remaining: List[_Image] = []
+        protected = set()
+        total = 0
+        for session_id, files in images.items():
+            state = states.get(session_id)
+            selected = self._select(state, files, expire_before)
+            selected_paths = {f.path for f in selected}
+            doomed.extend((f, expire_reason) for f in selected)
+            kept = [f for f in files if f.path not in selected_paths]
+            remaining.extend(kept)
+            total += sum(f.size for f in files)
+            if state == 'running':
+                latest = max((f.step for f in kept if f.step is not None), default=None)
+                protected.update(f.path for f in kept if f.step == latest)
+        
+        # Quota: oldest first
+        remaining_bytes = sum(f.size for f in remaining)
+        quota = int(self.quota_gb * 1024 ** 3)
+        if quota and remaining_bytes > quota:
+            for image in sorted(remaining, key=lambda f: f.mtime):
+                if remaining_bytes <= quota:
+                    break
+                if image.path in protected:
+                    continue
+                doomed.append((image, 'quota'))
+                remaining_bytes -= image.size
+        
+        counts = self._delete(doomed, images)
+        freed = counts.pop('freed_bytes')
+        for reason, count in counts.items():
+            self.deleted[reason] += count
+        self.freed_bytes += freed
+        self.sweeps += 1
+        
+        self.last_sweep = {
+            'sessions': len(images),
+            'files': sum(len(files) for files in images.values()),
+            'bytes': total,
+            'deleted': counts,
+            'freed_bytes': freed,
+            'remaining_bytes': total - freed,
+            'duration_ms': round((time.time() - start) * 1000, 1),
+            'finished_at': datetime.now().isoformat()
+        }
+        if sum(counts.values()):
+            print(f"[TempImages] Deleted {sum(counts.values())} images ({freed / 1024 ** 2:.1f} MB) "
+                  f"in {self.last_sweep['duration_ms']} ms")
+        return self.last_sweep
+    
+    @contextmanager
+    def _claim(self):
+        """Hold the sweep lock file if no other process does (yields False otherwise)."""
+        if fcntl is None:
+            yield True
+            return
+        fd = os.open(str(DATA_DIR / "temp_images.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+    
+    def sweep(self) -> Optional[dict]:
+        """
+        Apply the cleanup policy and the quota once.
+        
+        Returns:
+            Summary of the sweep (None if another sweep was running)
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            with self._claim() as claimed:
+                if not claimed:
+                    return None
+                return self._sweep()
+        finally:
+            self._lock.release()
+    
+    # === Background thread ===
+    
+    def start(self):
+        """
+        Sweep every interval seconds in a background thread.
+        
+        The first sweep runs after one interval, or right away with
+        TEMP_IMAGE_SWEEP_ON_START.
+        """
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="temp-image-janitor", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        if not settings.TEMP_IMAGE_SWEEP_ON_START and self._stop.wait(self.interval):
+            return
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[TempImages] Sweep failed: {e}")
+            if self._stop.wait(self.interval):
+                return
+    
+    def stop(self):
+        """Stop the background thread."""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+    
+    def get_stats(self) -> dict:
+        """Get janitor statistics."""
+        return {
+            'policy': self.policy,
+            'expire_hours': self.expire_hours,
+            'quota_gb': self.quota_gb,
+            'sweep_interval': self.interval,
+            'running': self._thread is not None,
+            'sweeps': self.sweeps,
+            'deleted': dict(self.deleted),
+            'freed_bytes': self.freed_bytes,
+            'last_sweep': self.last_sweep
+        }
+
+
+# Global instance
+temp_image_janitor = TempImageJanitor()
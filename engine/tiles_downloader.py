@@ -6,15 +6,29 @@ Handles session management, tile downloads, and anti-scraping measures.
 import time
 import random
 import asyncio
+import threading
 import aiohttp
 import requests
+import numpy as np
 from pathlib import Path
 from typing import Optional, Dict, Tuple
 from datetime import datetime, timedelta
 
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config.settings import settings
+from cache.panorama_pyramid import decode_tile_into
+from cache.panorama_cache import panorama_cache
+from cache.negative_cache import negative_cache
+from engine.api_key_pool import get_key_pool
+
+
+TILE_SIZE = 512  # Google Street View tile edge length
 
 
 class TilesSession:
@@ -36,7 +50,12 @@ class TilesDownloader:
     Features:
     - Automatic session management
     - Anti-scraping measures (random delays, retry with backoff)
-    - Concurrent downloads with semaphore control
+    - Async downloads over one pooled aiohttp session per process, with
+      per-host connection limits
+    - Requests are spread over the API key pool (per-key rate budgets,
+      failover to another key on 429/403), one Tiles API session per key
+    - Every tile is persisted as it arrives (panorama_cache.tiles), so
+      interrupted downloads resume and lower zooms are derived locally
     """
     
     def __init__(self, api_key: Optional[str] = None):
@@ -44,14 +63,14 @@ class TilesDownloader:
         Initialize the tiles downloader.
         
         Args:
-            api_key: Google API key. Defaults to settings.
+            api_key: Google API key. Defaults to the configured key pool.
         """
-        self.api_key = api_key or settings.GOOGLE_API_KEY
-        if not self.api_key:
+        self.key_pool = get_key_pool(api_key)
+        if not len(self.key_pool):
             raise ValueError("Google API key is required")
         
         self.base_url = settings.TILES_API_BASE_URL
-        self.session: Optional[TilesSession] = None
+        self.sessions: Dict[str, TilesSession] = {}  # Tiles API sessions belong to the key that created them
         self.http_session = requests.Session()
         
         # Set headers to appear as normal browser
@@ -63,18 +82,23 @@ class TilesDownloader:
         adapter = requests.adapters.HTTPAdapter(pool_connections=50, pool_maxsize=50)
         self.http_session.mount('https://', adapter)
         self.http_session.mount('http://', adapter)
+        self._session_lock = threading.Lock()
         
-        # Concurrency control for async downloads
-        # 4 panoramas × 4 tiles = max 16 concurrent HTTP requests
-        self.tiles_per_pano = 4           # Max 4 parallel tile downloads per panorama
-        self.pano_semaphore = asyncio.Semaphore(4)  # Max 4 panoramas at once
-        self.tile_semaphore = asyncio.Semaphore(4)  # Max 4 tiles per panorama
-        self.min_delay = 0.1              # Min delay between requests
+        # Async downloads: one keep-alive pool per event loop (a pool is bound
+        # to the loop that created it); request rates are budgeted per key by
+        # the key pool
+        self._aio_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._aio_lock = threading.Lock()
     
-    def _create_session(self) -> TilesSession:
-        """Create a new Tiles API session."""
+    @property
+    def _max_retries(self) -> int:
+        """Retries per tile, plus one failover attempt per key."""
+        return settings.PREFETCH_RETRY_MAX + len(self.key_pool)
+    
+    def _create_session(self, api_key: str) -> TilesSession:
+        """Create a new Tiles API session for a key."""
         url = f"{self.base_url}/createSession"
-        params = {'key': self.api_key}
+        params = {'key': api_key}
         payload = {
             "mapType": "streetview",
             "language": "en-US",
@@ -113,10 +137,89 @@ class TilesDownloader:
         
         return TilesSession(session_token, expiry)
     
-    def _ensure_session(self):
-        """Ensure we have a valid session."""
-        if self.session is None or self.session.is_expired(settings.TILES_SESSION_REFRESH_BUFFER):
-            self.session = self._create_session()
+    def _ensure_session(self, api_key: str) -> Optional[str]:
+        """
+        Ensure a key has a valid session.
+        
+        Args:
+            api_key: Key the session belongs to
+        
+        Returns:
+            Session token, or None if the key was throttled or refused
+        """
+        with self._session_lock:
+            session = self.sessions.get(api_key)
+            if session is None or session.is_expired(settings.TILES_SESSION_REFRESH_BUFFER):
+                try:
+                    session = self._create_session(api_key)
+                except requests.exceptions.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else 0
+                    if status not in (429, 403):
+                        raise
+                    self.key_pool.report(api_key, 'tiles', status)
+                    return None
+                self.sessions[api_key] = session
+            return session.token
+    
+    async def _session_token(self, api_key: str) -> Optional[str]:
+        """Get a key's session token, creating the session in a thread if needed."""
+        session = self.sessions.get(api_key)
+        if session is None or session.is_expired(settings.TILES_SESSION_REFRESH_BUFFER):
+            return await asyncio.to_thread(self._ensure_session, api_key)
+        return session.token
+    
+    def _get_aio_session(self) -> aiohttp.ClientSession:
+        """Get the pooled aiohttp session of the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._aio_lock:
+            session = self._aio_sessions.get(loop)
+            if session is None or session.closed:
+                # Forget the pools of finished loops (their sockets close when collected)
+                for dead in [l for l in self._aio_sessions if l.is_closed()]:
+                    self._aio_sessions.pop(dead).detach()
+                connector = aiohttp.TCPConnector(
+                    limit=0,
+                    limit_per_host=settings.TILES_HOST_CONCURRENCY * len(self.key_pool),
+                    ttl_dns_cache=300
+                )
+                session = self._aio_sessions[loop] = aiohttp.ClientSession(
+                    connector=connector,
+                    headers={'User-Agent': self.http_session.headers['User-Agent']},
+                    timeout=aiohttp.ClientTimeout(total=30)
+                )
+        return session
+    
+    @staticmethod
+    def _known_missing(pano_id: str, zoom: int) -> bool:
+        """Check the negative cache before downloading a panorama."""
+        reason = negative_cache.get(pano_id, f"tiles_z{zoom}")
+        if reason:
+            print(f"Skipping {pano_id} (zoom {zoom}): {reason}")
+            return True
+        return False
+    
+    @staticmethod
+    def _record_failure(pano_id: str, zoom: int, status: int):
+        """Remember panoramas the Tiles API reports as missing."""
+        if status == 404:
+            negative_cache.add(pano_id, f"tiles_z{zoom}", "NOT_FOUND")
+    
+    async def close(self):
+        """Close the pooled aiohttp sessions."""
+        with self._aio_lock:
+            sessions = list(self._aio_sessions.items())
+            self._aio_sessions.clear()
+        loop = asyncio.get_running_loop()
+        for owner, session in sessions:
+            if session.closed:
+                continue
+            if owner is loop:
+                await session.close()
+            elif owner.is_running():
+                # Still serving another thread: close it on its own loop
+                asyncio.run_coroutine_threadsafe(session.close(), owner)
+            else:
+                session.detach()
     
     def _random_delay(self):
         """Add random delay between requests for anti-scraping."""
@@ -147,34 +250,56 @@ class TilesDownloader:
         Returns:
             Tile image bytes or None if failed
         """
-        self._ensure_session()
+        if retry == 0:
+            cached = panorama_cache.tiles.get_or_derive(pano_id, zoom, x, y)
+            if cached is not None:
+                return cached
+        
+        key = self.key_pool.acquire_sync('tiles')
+        if key is None:
+            print("Tile download failed: all API keys are cooling down")
+            return None
+        token = self._ensure_session(key)
+        if token is None:
+            # Key throttled or refused - fail over to another key
+            if retry < self._max_retries:
+                return self.download_tile(pano_id, zoom, x, y, retry + 1)
+            return None
         
         url = f"{self.base_url}/streetview/tiles/{zoom}/{x}/{y}"
         params = {
-            'session': self.session.token,
-            'key': self.api_key,
+            'session': token,
+            'key': key,
             'panoId': pano_id
         }
         
         try:
             self._random_delay()
             response = self.http_session.get(url, params=params)
+            self.key_pool.report(key, 'tiles', response.status_code)
             
             if response.status_code == 200:
+                panorama_cache.tiles.put(pano_id, zoom, x, y, response.content)
                 return response.content
-            elif response.status_code in (429, 503):
-                # Rate limited or service unavailable - retry with backoff
-                if retry < settings.PREFETCH_RETRY_MAX:
-                    wait = settings.PREFETCH_RETRY_BACKOFF ** retry
+            elif response.status_code in (429, 403):
+                # Key throttled or refused - fail over to another key
+                if retry < self._max_retries:
+                    return self.download_tile(pano_id, zoom, x, y, retry + 1)
+            elif response.status_code == 503:
+                # Service unavailable - retry with backoff
+                if retry < self._max_retries:
+                    wait = settings.PREFETCH_RETRY_BACKOFF ** min(retry, settings.PREFETCH_RETRY_MAX)
                     time.sleep(wait)
                     return self.download_tile(pano_id, zoom, x, y, retry + 1)
             else:
                 print(f"Tile download failed: {response.status_code}")
+                self._record_failure(pano_id, zoom, response.status_code)
                 
         except requests.RequestException as e:
             print(f"Tile download error: {e}")
-            if retry < settings.PREFETCH_RETRY_MAX:
-                wait = settings.PREFETCH_RETRY_BACKOFF ** retry
+            self.key_pool.report(key, 'tiles', 0)
+            if retry < self._max_retries:
+                wait = settings.PREFETCH_RETRY_BACKOFF ** min(retry, settings.PREFETCH_RETRY_MAX)
                 time.sleep(wait)
                 return self.download_tile(pano_id, zoom, x, y, retry + 1)
         
@@ -185,54 +310,62 @@ class TilesDownloader:
         pano_id: str,
         zoom: int,
         x: int,
-        y: int,
-        retry: int = 0
+        y: int
     ) -> Optional[bytes]:
         """
-        Download a single panorama tile (async with concurrency control).
+        Download a single panorama tile (async, pooled and rate limited).
         
         Args:
             pano_id: Panorama ID
             zoom: Zoom level (0-5)
             x: Tile X coordinate
             y: Tile Y coordinate
-            retry: Current retry count
             
         Returns:
             Tile image bytes or None if failed
         """
-        async with self.tile_semaphore:
-            self._ensure_session()
-            
-            url = f"{self.base_url}/streetview/tiles/{zoom}/{x}/{y}"
+        cached = await asyncio.to_thread(panorama_cache.tiles.get_or_derive, pano_id, zoom, x, y)
+        if cached is not None:
+            return cached
+        
+        http = self._get_aio_session()
+        url = f"{self.base_url}/streetview/tiles/{zoom}/{x}/{y}"
+        
+        for retry in range(self._max_retries + 1):
+            key = await self.key_pool.acquire('tiles')
+            if key is None:
+                print("Tile download failed: all API keys are cooling down")
+                return None
+            token = await self._session_token(key)
+            if token is None:
+                continue
             params = {
-                'session': self.session.token,
-                'key': self.api_key,
+                'session': token,
+                'key': key,
                 'panoId': pano_id
             }
             
             try:
-                await asyncio.sleep(self.min_delay)
-                
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, params=params) as response:
-                        if response.status == 200:
-                            return await response.read()
-                        elif response.status in (429, 503):
-                            # Rate limited - retry with backoff
-                            if retry < settings.PREFETCH_RETRY_MAX:
-                                wait = settings.PREFETCH_RETRY_BACKOFF ** retry
-                                await asyncio.sleep(wait)
-                                return await self.download_tile_async(pano_id, zoom, x, y, retry + 1)
-                        else:
-                            print(f"Tile download failed: {response.status}")
-                            
-            except Exception as e:
+                async with http.get(url, params=params) as response:
+                    self.key_pool.report(key, 'tiles', response.status)
+                    if response.status == 200:
+                        data = await response.read()
+                        await asyncio.to_thread(panorama_cache.tiles.put, pano_id, zoom, x, y, data)
+                        return data
+                    if response.status in (429, 403):
+                        # Key throttled or refused - fail over to another key
+                        continue
+                    if response.status != 503:
+                        print(f"Tile download failed: {response.status}")
+                        await asyncio.to_thread(self._record_failure, pano_id, zoom, response.status)
+                        return None
+                    # Service unavailable - retry with backoff
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                 print(f"Tile download error: {e}")
-                if retry < settings.PREFETCH_RETRY_MAX:
-                    wait = settings.PREFETCH_RETRY_BACKOFF ** retry
-                    await asyncio.sleep(wait)
-                    return await self.download_tile_async(pano_id, zoom, x, y, retry + 1)
+                self.key_pool.report(key, 'tiles', 0)
+            
+            if retry < self._max_retries:
+                await asyncio.sleep(settings.PREFETCH_RETRY_BACKOFF ** min(retry, settings.PREFETCH_RETRY_MAX))
         
         return None
     
@@ -270,6 +403,9 @@ class TilesDownloader:
         Returns:
             Dict mapping (x, y) to tile bytes, or None if failed
         """
+        if self._known_missing(pano_id, zoom):
+            return None
+        
         cols, rows = self.get_tile_grid(zoom)
         total = cols * rows
         tiles = {}
@@ -297,8 +433,8 @@ class TilesDownloader:
         """
         Download all tiles for a panorama (async with concurrency).
         
-        Uses pano_semaphore to limit concurrent panorama downloads.
-        Uses tile_semaphore to limit concurrent tile downloads per panorama.
+        Concurrency is bounded by the per-host connection pool and the
+        request rate by the key pool's per-key budgets.
         
         Args:
             pano_id: Panorama ID
@@ -308,25 +444,21 @@ class TilesDownloader:
         Returns:
             Dict mapping (x, y) to tile bytes, or None if failed
         """
-        async with self.pano_semaphore:
-            cols, rows = self.get_tile_grid(zoom)
-            total = cols * rows
-            tiles = {}
-            
-            # Create all download tasks
-            tasks = []
-            coords = []
-            for y in range(rows):
-                for x in range(cols):
-                    tasks.append(self.download_tile_async(pano_id, zoom, x, y))
-                    coords.append((x, y))
-            
-            # Download all tiles concurrently (limited by tile_semaphore)
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Process results
-            for (x, y), tile_data in zip(coords, results):
-                if isinstance(tile_data, Exception) or tile_data is None:
+        if await asyncio.to_thread(self._known_missing, pano_id, zoom):
+            return None
+        
+        cols, rows = self.get_tile_grid(zoom)
+        total = cols * rows
+        tiles = {}
+        
+        async def fetch(x: int, y: int):
+            return (x, y), await self.download_tile_async(pano_id, zoom, x, y)
+        
+        tasks = [asyncio.ensure_future(fetch(x, y)) for y in range(rows) for x in range(cols)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                (x, y), tile_data = await future
+                if tile_data is None:
                     print(f"Failed to download tile ({x}, {y})")
                     return None
                 
@@ -334,8 +466,67 @@ class TilesDownloader:
                 
                 if progress_callback:
                     progress_callback(len(tiles), total)
+        finally:
+            # Stop the remaining requests if one tile failed
+            for task in tasks:
+                task.cancel()
+        
+        return tiles
+    
+    async def download_panorama_async(
+        self,
+        pano_id: str,
+        zoom: int,
+        progress_callback=None
+    ) -> Optional[np.ndarray]:
+        """
+        Download all tiles and decode each into a preallocated panorama
+        buffer as soon as it arrives.
+        
+        Decoding runs in worker threads (OpenCV releases the GIL), overlapping
+        with the remaining downloads, so the panorama is ready as soon as the
+        last tile lands.
+        
+        Args:
+            pano_id: Panorama ID
+            zoom: Zoom level
+            progress_callback: Optional callback(current, total)
             
-            return tiles
+        Returns:
+            BGR array of shape (rows * 512, cols * 512, 3), or None if failed
+        """
+        if cv2 is None:
+            raise ImportError("opencv-python is required. Install with: pip install opencv-python")
+        if await asyncio.to_thread(self._known_missing, pano_id, zoom):
+            return None
+        
+        cols, rows = self.get_tile_grid(zoom)
+        total = cols * rows
+        output = np.zeros((rows * TILE_SIZE, cols * TILE_SIZE, 3), dtype=np.uint8)
+        
+        async def fetch(x: int, y: int):
+            tile_data = await self.download_tile_async(pano_id, zoom, x, y)
+            if tile_data is None:
+                return (x, y), False
+            return (x, y), await asyncio.to_thread(decode_tile_into, tile_data, output, x, y, TILE_SIZE)
+        
+        tasks = [asyncio.ensure_future(fetch(x, y)) for y in range(rows) for x in range(cols)]
+        done = 0
+        try:
+            for future in asyncio.as_completed(tasks):
+                (x, y), ok = await future
+                if not ok:
+                    print(f"Failed to download tile ({x}, {y})")
+                    return None
+                
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total)
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        return output
 
 
 # Global instance (lazy)
@@ -348,3 +539,9 @@ def get_tiles_downloader() -> TilesDownloader:
     if _tiles_downloader is None:
         _tiles_downloader = TilesDownloader()
     return _tiles_downloader
+
+
+async def close_tiles_downloader():
+    """Close the singleton's pooled HTTP session, if one was created."""
+    if _tiles_downloader is not None:
+        await _tiles_downloader.close()
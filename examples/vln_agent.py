@@ -9,8 +9,8 @@ Requirements:
 
 Usage:
     1. Set your API key in environment variable or .env file
-    2. Start the VLN Benchmark server: python main.py
-    3. Run this script: python vln_agent.py
+    2. Run this script: python vln_agent.py
+       (sessions run in-process; the VLN Benchmark server is not required)
 
 Configuration:
     - API_BASE_URL: API endpoint (e.g., https://yunwu.ai/v1)
@@ -42,6 +42,7 @@ from engine.observation_generator import get_observation_generator
 from engine.direction_calculator import direction_calculator
 from cache.metadata_cache import metadata_cache
 from engine.geofence_checker import geofence_checker
+from config.settings import settings
 from api.models import AvailableMove # To match structure if needed, or just use dicts
 
 # Load environment variables from .env file
@@ -183,33 +184,12 @@ IMPORTANT: Respond ONLY with valid JSON, no additional text."""
     
     # Helper for local observation building
     def _local_get_available_moves(self, session) -> list:
-        current_pano_id = session.state.pano_id
-        
-        metadata = metadata_cache.get(current_pano_id)
-        if not metadata:
-            return []
-        
-        links = metadata.get('links', [])
-        if not links:
-            return []
-            
-        links = geofence_checker.filter_links(session.geofence, links)
-        
-        current_location = (session.state.lat, session.state.lng)
-        if current_location[0] is None:
-            current_location = metadata_cache.get_location(current_pano_id)
-            
-        link_pano_ids = [l.get('panoId') or l.get('pano_id') for l in links]
-        locations = metadata_cache.get_all_locations(link_pano_ids)
-        
-        moves = direction_calculator.calculate_available_moves(
-            links, session.state.heading, current_location, locations
-        )
-        moves = direction_calculator.sort_moves_by_direction(moves)
+        table = geofence_checker.get_move_table(session.geofence, session.state.pano_id)
+        moves = direction_calculator.moves_from_table(table, session.state.heading)
         
         return [{"id": m["id"], "direction": m["direction"], "distance": m.get("distance"), "heading": m.get("heading")} for m in moves]
 
-    def _local_build_observation(self, session) -> dict:
+    def _local_build_observation(self, session, image_bytes: Optional[bytes] = None) -> dict:
         available_moves = self._local_get_available_moves(session)
         
         image_url = None
@@ -233,6 +213,7 @@ IMPORTANT: Respond ONLY with valid JSON, no additional text."""
             "fov": session.state.fov if session.state else 90.0,
             "center_heading": center_heading,
             "available_moves": available_moves,
+            "image_bytes": image_bytes,
             # Validation Context
             "pano_id": session.state.pano_id,
             "lat": session.state.lat,
@@ -245,7 +226,8 @@ IMPORTANT: Respond ONLY with valid JSON, no additional text."""
         session = session_manager.create_session(
             agent_id=agent_id,
             task_id=task_id,
-            mode="agent"
+            mode="agent",
+            in_process=True
         )
         
         if session is None:
@@ -259,17 +241,21 @@ IMPORTANT: Respond ONLY with valid JSON, no additional text."""
         # Log session start
         # session_logger.log_session_start(session)
         
-        # Generate initial view (Local)
+        # Generate initial view (Local, bytes in memory; file only for replay)
+        image_bytes = None
         try:
             generator = get_observation_generator()
-            generator.generate_observation(
+            image_result = generator.generate_observation(
                 pano_id=session.state.pano_id,
                 heading=session.state.heading,
                 pitch=session.state.pitch,
                 fov=session.state.fov,
                 session_id=session.session_id,
-                step=session.step_count
+                step=session.step_count,
+                write=settings.REPLAY_IMAGE_WRITE
             )
+            if image_result:
+                image_bytes = image_result['image_bytes']
         except Exception as e:
             pass # print(f"Error generating initial observation: {e}")
             
@@ -277,7 +263,7 @@ IMPORTANT: Respond ONLY with valid JSON, no additional text."""
         self.messages = [{"role": "system", "content": self.system_prompt}]
         self.step_count = 0
         
-        return self._local_build_observation(session)
+        return self._local_build_observation(session, image_bytes)
     
     def execute_action(self, action: dict) -> dict:
         """Execute an action (Local Call)."""
@@ -320,6 +306,7 @@ IMPORTANT: Respond ONLY with valid JSON, no additional text."""
             return None
             
         try:
+            import requests
             full_url = f"{self.config.benchmark_url}{image_url}"
             response = requests.get(full_url, timeout=10)
             response.raise_for_status()
@@ -437,17 +424,22 @@ Analyze the image and decide your next action."""
         content = [{"type": "text", "text": text_content}]
         
         # Add image if available
-        image_url = observation.get("panorama_url") or observation.get("current_image")
-        if image_url:
-            image_base64 = self.get_image_base64(image_url)
-            if image_base64:
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{image_base64}",
-                        "detail": "high"
-                    }
-                })
+        # In-process observations carry the JPEG bytes; fall back to HTTP otherwise
+        image_base64 = None
+        if observation.get("image_bytes"):
+            image_base64 = base64.b64encode(observation["image_bytes"]).decode("utf-8")
+        else:
+            image_url = observation.get("panorama_url") or observation.get("current_image")
+            if image_url:
+                image_base64 = self.get_image_base64(image_url)
+        if image_base64:
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{image_base64}",
+                    "detail": "high"
+                }
+            })
         
         return {"role": "user", "content": content}
     
@@ -57,6 +57,19 @@ async def startup_event():
     (WEB_UI_DIR / "css").mkdir(parents=True, exist_ok=True)
     (WEB_UI_DIR / "js").mkdir(parents=True, exist_ok=True)
     
+    if settings.WORKERS > 1 and settings.SESSION_STORE == "memory":
+        print("[Startup] Warning: SESSION_STORE=memory with several workers; "
+              "sessions are only found by the worker that created them (use shm or sqlite)")
+    
+    # Continue preload jobs interrupted by the last shutdown
+    if settings.PRELOAD_RESUME_ON_STARTUP:
+        from engine.preload_jobs import preload_manager
+        await preload_manager.resume_all()
+    
+    # Enforce the temp image cleanup policy and quota
+    from engine.temp_images import temp_image_janitor
+    temp_image_janitor.start()
+    
     print("")
     print("=" * 50)
     print("  VLN Benchmark Platform started!")
@@ -74,7 +87,21 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown."""
     from engine.logger import session_logger
+    from engine.tiles_downloader import close_tiles_downloader
+    from engine.prefetcher import panorama_prefetcher
+    from engine.preload_jobs import preload_manager
+    from engine.action_runner import action_runner
+    from engine.session_manager import session_manager
+    from engine.temp_images import temp_image_janitor
+    from engine.observation_generator import close_render_backend
+    temp_image_janitor.stop()
+    action_runner.shutdown()
+    close_render_backend()
     session_logger.close_all()
+    session_manager.close()
+    panorama_prefetcher.shutdown()
+    await preload_manager.shutdown()
+    await close_tiles_downloader()
     print("VLN Benchmark Platform stopped")
 
 
@@ -83,5 +110,6 @@ if __name__ == "__main__":
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG
+        workers=settings.WORKERS,
+        reload=settings.DEBUG and settings.WORKERS == 1
     )
@@ -0,0 +1,91 @@
+"""
+Audit cached assets of required panoramas and optionally preload the gaps.
+
+Required panoramas come from geofence/whitelist list names, whole whitelist
+files and/or a task directory (each task's geofence plus spawn/target
+panoramas). Reports panoramas without metadata, links or an image at the
+zoom level; with --preload the missing ones are fetched as a persistent
+preload job (resumed by the server if this script is interrupted).
+
+Usage:
+    python scripts/audit_coverage.py [--list NAME ...] [--whitelist-file PATH ...] [--tasks-dir DIR]
+                                     [--zoom Z] [--output missing.json] [--preload]
+"""
+import sys
+import json
+import asyncio
+import argparse
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config.settings import settings
+from engine.coverage_audit import audit_coverage, required_panos_for_file, required_panos_for_tasks
+from engine.preload_jobs import preload_manager, resolve_whitelist
+
+
+async def run_preload(name: str, pano_ids: list, zoom: int) -> dict:
+    """Run a preload job in this process, printing progress until it ends."""
+    job = await preload_manager.submit(name, pano_ids, zoom)
+    print(f"Started preload job {job['job_id']} ({job['total']} panoramas)")
+    try:
+        while job['status'] in ('pending', 'in_progress'):
+            await asyncio.sleep(5)
+            job = await asyncio.to_thread(preload_manager.get_job, job['job_id'])
+            print(f"  Progress: {job['done'] + job['failed']}/{job['total']} ({job['failed']} failed)")
+    finally:
+        await preload_manager.shutdown()
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Audit cached metadata/links/images of required panoramas')
+    parser.add_argument('--list', action='append', default=[], help='Geofence/whitelist list name (repeatable)')
+    parser.add_argument('--whitelist-file', action='append', default=[], help='Whitelist JSON file, all lists (repeatable)')
+    parser.add_argument('--tasks-dir', type=Path, default=None, help='Task directory (geofence + spawn/target panoramas)')
+    parser.add_argument('--zoom', type=int, default=settings.PANORAMA_ZOOM_LEVEL, help='Zoom level of images')
+    parser.add_argument('--output', type=Path, default=None, help='Write the full report as JSON')
+    parser.add_argument('--preload', action='store_true', help='Preload the missing panoramas')
+    parser.add_argument('--job-name', default=None, help='Preload job name (default: audit_<first source>)')
+    args = parser.parse_args()
+    
+    pano_ids = []
+    for name in args.list:
+        panos = resolve_whitelist(name)
+        if panos is None:
+            print(f"Unknown list: {name}")
+            return 1
+        pano_ids.extend(panos)
+    for path in args.whitelist_file:
+        pano_ids.extend(required_panos_for_file(Path(path)))
+    if args.tasks_dir:
+        pano_ids.extend(required_panos_for_tasks(args.tasks_dir))
+    if not pano_ids:
+        print("Nothing to audit: pass --list, --whitelist-file or --tasks-dir")
+        return 1
+    
+    report = audit_coverage(pano_ids, args.zoom)
+    print(f"Audited {report['required']} panoramas (zoom {report['zoom']}) in {report['audit_ms']} ms")
+    print(f"  Missing metadata:  {len(report['missing_metadata'])}")
+    print(f"  Missing links:     {len(report['missing_links'])}")
+    print(f"  Missing images:    {len(report['missing_images'])} ({report['unrecorded_images']} on disk without a record)")
+    print(f"  Known failures:    {len(report['known_failures'])}")
+    print(f"  To preload:        {len(report['missing'])}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    
+    if args.preload and report['missing']:
+        sources = args.list + [Path(p).stem for p in args.whitelist_file] + ([args.tasks_dir.name] if args.tasks_dir else [])
+        job = asyncio.run(run_preload(args.job_name or f"audit_{sources[0]}", report['missing'], report['zoom']))
+        print(f"Preload job {job['job_id']}: {job['status']} ({job['done']} done, {job['failed']} failed)")
+        return 0 if job['status'] == 'completed' else 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Build tiled mip-mapped pyramids (.pyr) for cached panoramas.
+
+Converts data/panoramas/{pano_id}_z{zoom}.jpg into {pano_id}_z{zoom}.pyr so
+the renderer can decode only the tiles a view needs (set PANORAMA_PYRAMID=true).
+
+Usage:
+    python scripts/build_pyramids.py [--zoom Z] [--force] [--workers W] [--limit N]
+"""
+import sys
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from cache.panorama_cache import panorama_cache
+from config.settings import settings
+
+
+def find_panoramas(zoom: int, force: bool) -> list:
+    """Get pano_ids with a cached JPEG at this zoom (and no pyramid unless force)."""
+    pano_ids = []
+    suffix = f"_z{zoom}"
+    for path in panorama_cache.panoramas_dir.glob(f"*{suffix}.jpg"):
+        if not force and path.with_suffix('.pyr').exists():
+            continue
+        pano_ids.append(path.stem[:-len(suffix)])
+    return pano_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build tile pyramids for cached panoramas')
+    parser.add_argument('--zoom', type=int, default=settings.PANORAMA_ZOOM_LEVEL, help='Zoom level of source images')
+    parser.add_argument('--force', action='store_true', help='Rebuild existing pyramids')
+    parser.add_argument('--workers', type=int, default=4, help='Number of parallel workers (default: 4)')
+    parser.add_argument('--limit', type=int, default=None, help='Limit number of panoramas to convert')
+    args = parser.parse_args()
+    
+    pano_ids = find_panoramas(args.zoom, args.force)
+    if args.limit:
+        pano_ids = pano_ids[:args.limit]
+    
+    print(f"Building pyramids for {len(pano_ids)} panoramas (zoom {args.zoom})")
+    if not pano_ids:
+        return 0
+    
+    done, failed = 0, 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(panorama_cache.build_pyramid, pano_id, args.zoom): pano_id for pano_id in pano_ids}
+        for future in as_completed(futures):
+            try:
+                ok = future.result() is not None
+            except Exception as e:
+                print(f"  [ERROR] {futures[future]}: {e}")
+                ok = False
+            if ok:
+                done += 1
+            else:
+                failed += 1
+            if (done + failed) % 100 == 0:
+                print(f"  Progress: {done + failed}/{len(pano_ids)}")
+    
+    print(f"Done: {done} built, {failed} failed")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Convert cached panoramas into the memory-mapped raw tier (.npy).
+
+Decodes data/panoramas/{pano_id}_z{zoom}.jpg (or a lossless .pyr tile set) once into
+data/panoramas_raw/{pano_id}_z{zoom}.npy, which the renderer maps with
+np.memmap instead of decoding (requires PANORAMA_RAW_CACHE_GB > 0, or pass
+--max-gb). Oldest files are evicted when the budget is exceeded.
+
+Usage:
+    python scripts/build_raw_panoramas.py [--zoom Z] [--max-gb G] [--force] [--limit N] [--workers W]
+    python scripts/build_raw_panoramas.py --evict-only [--max-gb G]
+"""
+import sys
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from cache.panorama_cache import panorama_cache
+from config.settings import settings
+
+
+def convert_one(pano_id: str, zoom: int) -> bool:
+    """Decode one stored panorama and put it in the raw tier."""
+    image = panorama_cache.read_image(pano_id, zoom)
+    if image is None:
+        return False
+    return panorama_cache.raw.put(pano_id, zoom, image) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build memory-mapped raw panoramas')
+    parser.add_argument('--zoom', type=int, default=settings.PANORAMA_ZOOM_LEVEL, help='Zoom level of source images')
+    parser.add_argument('--max-gb', type=float, default=None, help='Disk budget in GB (default: PANORAMA_RAW_CACHE_GB)')
+    parser.add_argument('--force', action='store_true', help='Rewrite existing raw files')
+    parser.add_argument('--limit', type=int, default=None, help='Limit number of panoramas to convert')
+    parser.add_argument('--workers', type=int, default=4, help='Number of parallel workers (default: 4)')
+    parser.add_argument('--evict-only', action='store_true', help='Only enforce the disk budget')
+    args = parser.parse_args()
+
+    store = panorama_cache.raw
+    if args.max_gb is not None:
+        store.max_bytes = int(args.max_gb * 1024 ** 3)
+    if not store.enabled:
+        print("Raw tier is disabled: set PANORAMA_RAW_CACHE_GB or pass --max-gb")
+        return 1
+
+    if args.evict_only:
+        deleted = store.evict()
+        print(f"Evicted {deleted} files; {store.get_stats()['bytes'] / 1024 ** 3:.2f} GB in use")
+        return 0
+
+    # JPEGs and lossless tile sets (.pyr without a JPEG)
+    suffix = f"_z{args.zoom}"
+    pano_ids = sorted({
+        path.stem[:-len(suffix)]
+        for pattern in (f"*{suffix}.jpg", f"*{suffix}.pyr")
+        for path in panorama_cache.panoramas_dir.glob(pattern)
+    })
+    if not args.force:
+        pano_ids = [p for p in pano_ids if not store.has(p, args.zoom)]
+    if args.limit:
+        pano_ids = pano_ids[:args.limit]
+
+    print(f"Converting {len(pano_ids)} panoramas (zoom {args.zoom}) into {store.raw_dir}")
+
+    done, failed = 0, 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(convert_one, pano_id, args.zoom): pano_id for pano_id in pano_ids}
+        for future in as_completed(futures):
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"  [ERROR] {futures[future]}: {e}")
+                ok = False
+            if ok:
+                done += 1
+            else:
+                failed += 1
+            if (done + failed) % 100 == 0:
+                print(f"  Progress: {done + failed}/{len(pano_ids)}")
+
+    stats = store.get_stats()
+    print(f"Done: {done} converted, {failed} failed, {stats['evictions']} evicted, "
+          f"{(stats['bytes'] or 0) / 1024 ** 3:.2f} GB in use")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
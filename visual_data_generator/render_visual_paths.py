@@ -7,7 +7,6 @@ and renders perspective views for each step using PARALLEL PROCESSING.
 import os
 import sys
 import json
-import shutil
 import logging
 import argparse
 from pathlib import Path
@@ -29,38 +28,47 @@ logger = logging.getLogger(__name__)
 # Max workers for parallel rendering
 MAX_WORKERS = 20 
 
-def process_step(step_data):
+def process_pano(pano_data):
     """
-    Process a single step: Download -> Render -> Save.
+    Process all steps on one panorama: Download -> Render (batched) -> Save.
     
     Args:
-        step_data: Dictionary containing:
-            - step: The step object from visual_path
+        pano_data: Dictionary containing:
+            - pano_id: Panorama ID shared by the steps
+            - steps: The step objects from visual_path on this panorama
             - output_dir: The target directory for images
             - task_id: Task ID for session context
             
     Returns:
-        Result string or error message
+        List of result strings or error messages (one per step)
     """
-    step = step_data['step']
-    images_dir = step_data['output_dir']
-    task_id = step_data['task_id']
+    pano_id = pano_data['pano_id']
+    images_dir = pano_data['output_dir']
     
-    step_index = step.get('step_index')
-    pano_id = step.get('pano_id')
-    heading = step.get('heading')
+    results = []
+    pending = []
+    for step in pano_data['steps']:
+        step_index = step.get('step_index')
+        heading = step.get('heading')
+        
+        if heading is None:
+            results.append(f"[!] Invalid data for step {step_index}")
+            continue
+        
+        # Naming convention: step_001.jpg
+        dst_filename = f"step_{step_index:03d}.jpg"
+        dst_path = images_dir / dst_filename
+        
+        # Skip if already exists
+        if dst_path.exists():
+            results.append(f"[Skipped] Step {step_index}: Already exists")
+            continue
+        
+        pending.append((step_index, heading, dst_path))
     
-    if pano_id is None or heading is None:
-        return f"[!] Invalid data for step {step_index}"
-
-    # Naming convention: step_001.jpg
-    dst_filename = f"step_{step_index:03d}.jpg" 
-    dst_path = images_dir / dst_filename
+    if not pending:
+        return results
     
-    # Skip if already exists
-    if dst_path.exists():
-        return f"[Skipped] Step {step_index}: Already exists"
-
     zoom_level = 2
     
     try:
@@ -69,32 +77,35 @@ def process_step(step_data):
         pano_path = image_stitcher.download_and_stitch(pano_id, zoom_level)
         
         if not pano_path:
-            return f"[!] Step {step_index}: Failed to download/stitch pano {pano_id}"
-
-        # 2. Render Perspective View
+            return results + [
+                f"[!] Step {step_index}: Failed to download/stitch pano {pano_id}"
+                for step_index, _, _ in pending
+            ]
+        
+        # 2. Render all views of this pano from one decode
         # ObservationGenerator is CPU bound mostly, but ThreadPool is used 
         # because image_stitcher involves I/O.
         obs_gen = get_observation_generator()
-        result = obs_gen.generate_observation(
+        rendered = obs_gen.generate_observations_batch(
             pano_id=pano_id,
-            heading=heading,
-            pitch=0,
+            views=[(heading, 0) for _, heading, _ in pending],
             zoom=zoom_level,
-            session_id=task_id,
-            step=step_index
+            write="none"
         )
         
-        if not result or not result.get('image_path'):
-            return f"[!] Step {step_index}: Failed to render view"
-
-        # 3. Copy/Move to Task specific folder
-        src_path = Path(result['image_path'])
-        shutil.copy2(src_path, dst_path)
+        # 3. Write straight into the task specific folder
+        for (step_index, _, dst_path), result in zip(pending, rendered):
+            if not result:
+                results.append(f"[!] Step {step_index}: Failed to render view")
+                continue
+            with open(dst_path, 'wb') as f:
+                f.write(result['image_bytes'])
+            results.append(f"[OK] Step {step_index}: {dst_path.name}")
         
-        return f"[OK] Step {step_index}: {dst_filename}"
+        return results
         
     except Exception as e:
-        return f"[!] Step {step_index}: Exception {str(e)}"
+        return results + [f"[!] Step {step_index}: Exception {str(e)}" for step_index, _, _ in pending]
 
 
 def render_task(task_file: Path, output_base: Path):
@@ -120,28 +131,37 @@ def render_task(task_file: Path, output_base: Path):
     images_dir = output_base / "images" / task_id
     images_dir.mkdir(parents=True, exist_ok=True)
 
-    # Prepare work items
-    work_items = []
+    # Prepare work items (one per panorama, so each is decoded once)
+    steps_by_pano = {}
     for step in visual_path:
+        pano_id = step.get('pano_id')
+        if pano_id is None:
+            logger.error(f"  [!] Invalid data for step {step.get('step_index')}")
+            continue
+        steps_by_pano.setdefault(pano_id, []).append(step)
+    
+    work_items = []
+    for pano_id, steps in steps_by_pano.items():
         work_items.append({
-            'step': step,
+            'pano_id': pano_id,
+            'steps': steps,
             'output_dir': images_dir,
             'task_id': task_id
         })
     
     # Execute in parallel
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(process_step, item) for item in work_items]
+        futures = [executor.submit(process_pano, item) for item in work_items]
         
         for future in as_completed(futures):
-            result = future.result()
-            # Log the result
-            if "[!]" in result:
-                logger.error(f"  {result}")
-            elif "[Skipped]" in result:
-                logger.debug(f"  {result}") # Debug level for skips to reduce noise
-            else:
-                logger.info(f"  {result}")
+            for result in future.result():
+                # Log the result
+                if "[!]" in result:
+                    logger.error(f"  {result}")
+                elif "[Skipped]" in result:
+                    logger.debug(f"  {result}") # Debug level for skips to reduce noise
+                else:
+                    logger.info(f"  {result}")
 
     logger.info(f"  [Done] Saved images to {images_dir}")
     return images_dir